@@ -18,10 +18,12 @@ from invokeai.app.services.urls import LocalUrlService
 from invokeai.backend.util.logging import InvokeAILogger
 from invokeai.version.invokeai_version import __version__
 
+from ..services.artifact_reaper import DefaultArtifactReaper
 from ..services.default_graphs import create_system_graphs
-from ..services.latent_storage import DiskLatentsStorage, ForwardCacheLatentsStorage
+from ..services.latent_storage import ForwardCacheLatentsStorage, SafetensorsLatentsStorage
 from ..services.graph import GraphExecutionState, LibraryGraph
 from ..services.image_file_storage import DiskImageFileStorage
+from ..services.invocation_performance_storage import SqliteInvocationPerformanceStorage
 from ..services.invocation_queue import MemoryInvocationQueue
 from ..services.invocation_services import InvocationServices
 from ..services.invoker import Invoker
@@ -30,6 +32,7 @@ from ..services.sqlite import SqliteItemStorage
 from ..services.model_manager_service import ModelManagerService
 from ..services.invocation_stats import InvocationStatsService
 from .events import FastAPIEventService
+from .threadpool import ApiThreadPool
 
 
 # TODO: is there a better way to achieve this?
@@ -62,7 +65,13 @@ class ApiDependencies:
         logger.info(f"Root directory = {str(config.root_path)}")
         logger.debug(f"Internet connectivity is {config.internet_available}")
 
-        events = FastAPIEventService(event_handler_id)
+        events = FastAPIEventService(
+            event_handler_id,
+            max_queue_size=config.event_queue_size,
+            compact_payloads=config.compact_events,
+        )
+
+        ApiThreadPool.configure(max_threads=config.api_threads)
 
         output_folder = config.output_path
 
@@ -75,11 +84,35 @@ class ApiDependencies:
             filename=db_location, table_name="graph_executions"
         )
 
+        invocation_history = (
+            SqliteInvocationPerformanceStorage(
+                filename=db_location,
+                full_resolution_days=config.invocation_history_full_days,
+                max_days=config.invocation_history_days,
+            )
+            if config.invocation_history
+            else None
+        )
+
         urls = LocalUrlService()
         image_record_storage = SqliteImageRecordStorage(db_location)
-        image_file_storage = DiskImageFileStorage(f"{output_folder}/images")
+        image_file_storage = DiskImageFileStorage(
+            f"{output_folder}/images",
+            hard_delete=config.hard_delete_images,
+            max_cache_size=config.image_cache_size,
+            write_threads=config.image_write_threads,
+            compress_level=config.png_compress_level,
+            intermediate_compress_level=config.intermediate_png_compress_level,
+            max_resized_size=config.resized_image_cache_size,
+            max_intermediate_cache_size=config.intermediate_cache_size,
+        )
         names = SimpleNameService()
-        latents = ForwardCacheLatentsStorage(DiskLatentsStorage(f"{output_folder}/latents"))
+        latents = ForwardCacheLatentsStorage(
+            SafetensorsLatentsStorage(f"{output_folder}/latents"),
+            max_latents_cache_size=config.latents_cache_size,
+            max_conditioning_cache_size=config.conditioning_cache_size,
+            max_device_cache_size=config.latents_device_cache_size,
+        )
 
         board_record_storage = SqliteBoardRecordStorage(db_location)
         board_image_record_storage = SqliteBoardImageRecordStorage(db_location)
@@ -124,11 +157,16 @@ class ApiDependencies:
             boards=boards,
             board_images=board_images,
             queue=MemoryInvocationQueue(),
+            reaper=DefaultArtifactReaper(
+                delete_session_latents=config.delete_session_latents,
+                intermediates_ttl=config.intermediate_image_ttl,
+                deletes_per_second=config.reaper_deletes_per_second,
+            ),
             graph_library=SqliteItemStorage[LibraryGraph](filename=db_location, table_name="graphs"),
             graph_execution_manager=graph_execution_manager,
             processor=DefaultInvocationProcessor(),
             configuration=config,
-            performance_statistics=InvocationStatsService(graph_execution_manager),
+            performance_statistics=InvocationStatsService(graph_execution_manager, invocation_history),
             logger=logger,
         )
 
@@ -2,51 +2,195 @@
 
 import asyncio
 import threading
-from queue import Empty, Queue
-from typing import Any
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
 
 from fastapi_events.dispatcher import dispatch
 
+from ..models.image import ProgressImageSettings
 from ..services.events import EventServiceBase
 
+# Progress events for a session replace any that have not been dispatched yet
+COALESCED_EVENTS = {"generator_progress"}
+
+
+@dataclass
+class Subscription:
+    """A client's subscription to a session, and how it wants the session's progress images"""
+
+    progress_image_settings: ProgressImageSettings = field(default_factory=ProgressImageSettings)
+    last_progress_image_time: float = 0
+
 
 class FastAPIEventService(EventServiceBase):
+    """Hands events from worker threads to the event loop, where they are dispatched.
+
+    At most `max_queue_size` events wait to be dispatched. A thread that emits an event while the queue is full
+    waits for room, except for progress events, which are dropped; the next progress event for the session takes
+    their place. Only the latest waiting progress event of each session is dispatched, and never after an event of
+    the session that was emitted after it.
+
+    Clients subscribe to sessions, so that progress is only made for sessions that someone is watching. Each client
+    has its own progress image settings; a step's progress image is made for all clients that want one at that step.
+    """
+
     event_handler_id: int
-    __queue: Queue
+    __loop: asyncio.AbstractEventLoop
+    __loop_thread_id: int
+    # Holds events, or holders of coalesced progress events, and None to stop. Each comes with whether it holds a
+    # free slot.
+    __queue: "asyncio.Queue[tuple[Union[dict, list[dict], None], bool]]"
+    # Counts the free places in the queue; the queue itself is unbounded so that stopping never blocks
+    __free_slots: threading.Semaphore
+    __lock: threading.Lock
+    # The holder of the latest waiting progress event of each session
+    __pending_progress: dict[str, list[dict]]
+    # {session id => {subscriber id => subscription}}
+    __subscriptions: dict[str, dict[str, Subscription]]
     __stop_event: threading.Event
 
-    def __init__(self, event_handler_id: int) -> None:
+    def __init__(self, event_handler_id: int, max_queue_size: int = 1000, compact_payloads: bool = False) -> None:
         self.event_handler_id = event_handler_id
-        self.__queue = Queue()
+        self.compact_payloads = compact_payloads
+        self.__loop = asyncio.get_running_loop()
+        self.__loop_thread_id = threading.get_ident()
+        self.__queue = asyncio.Queue()
+        self.__free_slots = threading.Semaphore(max_queue_size)
+        self.__lock = threading.Lock()
+        self.__pending_progress = dict()
+        self.__subscriptions = dict()
         self.__stop_event = threading.Event()
-        asyncio.create_task(self.__dispatch_from_queue(stop_event=self.__stop_event))
+        asyncio.create_task(self.__dispatch_from_queue())
 
         super().__init__()
 
     def stop(self, *args, **kwargs):
         self.__stop_event.set()
-        self.__queue.put(None)
+        self.__put(None, holds_slot=False)
 
-    def dispatch(self, event_name: str, payload: Any) -> None:
-        self.__queue.put(dict(event_name=event_name, payload=payload))
+    def subscribe(
+        self,
+        graph_execution_state_id: str,
+        subscriber_id: str,
+        progress_image_settings: Optional[ProgressImageSettings] = None,
+    ) -> None:
+        with self.__lock:
+            subscriptions = self.__subscriptions.setdefault(graph_execution_state_id, dict())
+            subscription = subscriptions.setdefault(subscriber_id, Subscription())
+            if progress_image_settings is not None:
+                subscription.progress_image_settings = progress_image_settings
 
-    async def __dispatch_from_queue(self, stop_event: threading.Event):
-        """Get events on from the queue and dispatch them, from the correct thread"""
-        while not stop_event.is_set():
-            try:
-                event = self.__queue.get(block=False)
-                if not event:  # Probably stopping
+    def unsubscribe(self, graph_execution_state_id: str, subscriber_id: str) -> None:
+        with self.__lock:
+            subscriptions = self.__subscriptions.get(graph_execution_state_id)
+            if subscriptions is None:
+                return
+            subscriptions.pop(subscriber_id, None)
+            if not subscriptions:
+                del self.__subscriptions[graph_execution_state_id]
+
+    def unsubscribe_all(self, subscriber_id: str) -> None:
+        with self.__lock:
+            session_ids = [id for id, s in self.__subscriptions.items() if subscriber_id in s]
+        for session_id in session_ids:
+            self.unsubscribe(session_id, subscriber_id)
+
+    def has_subscribers(self, graph_execution_state_id: str) -> bool:
+        with self.__lock:
+            return graph_execution_state_id in self.__subscriptions
+
+    def get_progress_image_settings(self, graph_execution_state_id: str, step: int) -> list[ProgressImageSettings]:
+        with self.__lock:
+            subscriptions = self.__subscriptions.get(graph_execution_state_id, dict())
+            now = time.monotonic()
+            due_settings = []
+            for subscription in subscriptions.values():
+                settings = subscription.progress_image_settings
+                if step % settings.every_n_steps != 0:
+                    continue
+                if settings.max_fps is not None and now - subscription.last_progress_image_time < 1 / settings.max_fps:
                     continue
+                subscription.last_progress_image_time = now
+                due_settings.append(settings)
+            return due_settings
+
+    def dispatch(self, event_name: str, payload: Any) -> None:
+        if self.__stop_event.is_set():
+            return
+
+        event = dict(event_name=event_name, payload=payload)
+        session_id, is_coalesced = self.__get_session_id(payload)
+        if not is_coalesced:
+            if session_id is not None:
+                with self.__lock:
+                    # Later progress events must not be dispatched before this one
+                    self.__pending_progress.pop(session_id, None)
+            if self.__acquire_slot():
+                self.__put(event, holds_slot=True)
+            elif threading.get_ident() == self.__loop_thread_id:
+                # The event loop can't wait for itself to make room
+                self.__put(event, holds_slot=False)
+            return
 
-                dispatch(
-                    event.get("event_name"),
-                    payload=event.get("payload"),
-                    middleware_id=self.event_handler_id,
-                )
+        with self.__lock:
+            holder = self.__pending_progress.get(session_id)
+            if holder is not None:
+                # Replaces the waiting event
+                holder[0] = event
+                return
+            if not self.__free_slots.acquire(blocking=False):
+                return
+            holder = [event]
+            self.__pending_progress[session_id] = holder
+        self.__put(holder, holds_slot=True)
+
+    def __get_session_id(self, payload: Any) -> tuple[Optional[str], bool]:
+        """Gets the session of an event, and whether it is coalesced"""
+        if not isinstance(payload, dict) or not isinstance(payload.get("data"), dict):
+            return None, False
+        session_id = payload["data"].get("graph_execution_state_id")
+        return session_id, session_id is not None and payload.get("event") in COALESCED_EVENTS
+
+    def __acquire_slot(self) -> bool:
+        """Waits for a free slot, unless called from the event loop or stopping"""
+        if threading.get_ident() == self.__loop_thread_id:
+            return self.__free_slots.acquire(blocking=False)
+        while not self.__free_slots.acquire(timeout=1):
+            if self.__stop_event.is_set():
+                return False
+        return True
+
+    def __put(self, item: Union[dict, list[dict], None], holds_slot: bool) -> None:
+        if threading.get_ident() == self.__loop_thread_id:
+            self.__queue.put_nowait((item, holds_slot))
+            return
+        try:
+            self.__loop.call_soon_threadsafe(self.__queue.put_nowait, (item, holds_slot))
+        except RuntimeError:
+            # The event loop is closed
+            pass
+
+    async def __dispatch_from_queue(self):
+        """Get events on from the queue and dispatch them, from the correct thread"""
+        while True:
+            item, holds_slot = await self.__queue.get()
+            if item is None:  # Stopping
+                break
 
-            except Empty:
-                await asyncio.sleep(0.1)
-                pass
+            if holds_slot:
+                self.__free_slots.release()
+            if isinstance(item, list):
+                with self.__lock:
+                    event = item[0]
+                    session_id, _ = self.__get_session_id(event["payload"])
+                    if self.__pending_progress.get(session_id) is item:
+                        del self.__pending_progress[session_id]
+            else:
+                event = item
 
-            except asyncio.CancelledError as e:
-                raise e  # Raise a proper error
+            dispatch(
+                event.get("event_name"),
+                payload=event.get("payload"),
+                middleware_id=self.event_handler_id,
+            )
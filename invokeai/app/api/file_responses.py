@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from .threadpool import run_in_thread
+
+# images are immutable; set a high max-age
+IMAGE_MAX_AGE = 31536000
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def make_etag(name: str, stat: os.stat_result) -> str:
+    """Makes a strong ETag for a file. A file's content only changes when it is rewritten."""
+    return '"' + hashlib.md5(f"{name}-{stat.st_mtime_ns}-{stat.st_size}".encode("utf-8")).hexdigest() + '"'
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Checks a request's conditional headers. `If-None-Match` takes precedence over `If-Modified-Since`."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            # HTTP dates have whole-second precision
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def parse_range(range_header: str, size: int) -> Optional[tuple[int, int]]:
+    """Parses a single byte range, returning its inclusive start and end.
+
+    Returns None for ranges that can't be parsed, including multiple ranges, so the whole file is sent.
+    Raises ValueError for ranges that can't be satisfied.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # A suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    if int(start) >= size or (end and int(end) < int(start)):
+        raise ValueError("Range not satisfiable")
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+async def make_file_response(
+    request: Request,
+    path: Union[str, Path],
+    media_type: str,
+    filename: Optional[str] = None,
+    get_content: Optional[Callable[[], bytes]] = None,
+    etag_key: Optional[str] = None,
+) -> Response:
+    """Makes a cacheable response for an image file, with support for conditional and range requests.
+
+    The ETag and Last-Modified headers come from the file. If `get_content` is given, it is called for the body
+    instead of reading the file; it is not called when the client's copy is still valid. Responses with different
+    bodies for the same file must be given different `etag_key`s.
+    """
+    path = Path(path)
+    stat = await run_in_thread(os.stat, path)
+    etag = make_etag(etag_key or path.name, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": f"max-age={IMAGE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    if filename is not None:
+        headers["Content-Disposition"] = f'inline; filename="{filename}"'
+
+    content = None if get_content is None else await run_in_thread(get_content)
+    size = stat.st_size if content is None else len(content)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    # A range is only applied if the client's partial copy is of the current file
+    if range_header is not None and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        if content is not None:
+            return Response(content, media_type=media_type, headers=headers)
+        # FileResponse sets its own ETag and Last-Modified, which are replaced with ours
+        response = FileResponse(path, media_type=media_type, stat_result=stat)
+        response.headers.update(headers)
+        return response
+
+    start, end = byte_range
+    if content is None:
+        content = await run_in_thread(read_file_range, path, start, end - start + 1)
+    else:
+        content = content[start : end + 1]
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content, status_code=206, media_type=media_type, headers=headers)
+
+
+def read_file_range(path: Path, start: int, length: int) -> bytes:
+    with open(path, "rb") as file:
+        file.seek(start)
+        return file.read(length)
@@ -1,12 +1,18 @@
 import typing
 from enum import Enum
 from pathlib import Path
+from typing import Optional
 
-from fastapi import Body
+from fastapi import Body, HTTPException, Query
 from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from invokeai.app.invocations.upscale import ESRGAN_MODELS
+from invokeai.app.services.invocation_performance_storage import DEFAULT_PERCENTILES
+from invokeai.app.services.models.invocation_performance_record import (
+    InvocationPerformanceGroup,
+    InvocationPerformancePercentiles,
+)
 from invokeai.backend.image_util.invisible_watermark import InvisibleWatermark
 from invokeai.backend.image_util.patchmatch import PatchMatch
 from invokeai.backend.image_util.safety_checker import SafetyChecker
@@ -14,6 +20,7 @@ from invokeai.backend.util.logging import logging
 from invokeai.version import __version__
 
 from ..dependencies import ApiDependencies
+from ..threadpool import run_in_thread
 
 
 class LogLevel(int, Enum):
@@ -103,3 +110,39 @@ async def set_log_level(
     """Sets the log verbosity level"""
     ApiDependencies.invoker.services.logger.setLevel(level)
     return LogLevel(ApiDependencies.invoker.services.logger.level)
+
+
+@app_router.get(
+    "/invocation_stats",
+    operation_id="get_invocation_stats",
+    responses={
+        200: {"description": "The operation was successful"},
+        404: {"description": "The invocation history is disabled"},
+    },
+    response_model=list[InvocationPerformancePercentiles],
+)
+async def get_invocation_stats(
+    group_by: list[InvocationPerformanceGroup] = Query(default=["node_type"], description="The dimensions to group by"),
+    percentiles: list[float] = Query(default=DEFAULT_PERCENTILES, description="The percentiles to get, from 0 to 100"),
+    since: Optional[float] = Query(default=None, description="Only invocations since this Unix timestamp"),
+    until: Optional[float] = Query(default=None, description="Only invocations before this Unix timestamp"),
+    node_type: Optional[str] = Query(default=None, description="Only invocations of this node type"),
+    model: Optional[str] = Query(default=None, description="Only invocations using this model"),
+    width: Optional[int] = Query(default=None, description="Only invocations with this output width"),
+    height: Optional[int] = Query(default=None, description="Only invocations with this output height"),
+) -> list[InvocationPerformancePercentiles]:
+    """Gets percentiles of the time and peak VRAM used by past invocations, grouped by any of their dimensions"""
+    history = ApiDependencies.invoker.services.performance_statistics.history
+    if history is None:
+        raise HTTPException(status_code=404, detail="The invocation history is disabled")
+    return await run_in_thread(
+        history.get_percentiles,
+        group_by=group_by,
+        percentiles=percentiles,
+        since=since,
+        until=until,
+        node_type=node_type,
+        model=model,
+        width=width,
+        height=height,
+    )
@@ -3,6 +3,7 @@ from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from ..dependencies import ApiDependencies
+from ..threadpool import run_in_thread
 
 board_images_router = APIRouter(prefix="/v1/board_images", tags=["boards"])
 
@@ -30,8 +31,8 @@ async def add_image_to_board(
 ):
     """Creates a board_image"""
     try:
-        result = ApiDependencies.invoker.services.board_images.add_image_to_board(
-            board_id=board_id, image_name=image_name
+        result = await run_in_thread(
+            ApiDependencies.invoker.services.board_images.add_image_to_board, board_id=board_id, image_name=image_name
         )
         return result
     except Exception:
@@ -51,7 +52,9 @@ async def remove_image_from_board(
 ):
     """Removes an image from its board, if it had one"""
     try:
-        result = ApiDependencies.invoker.services.board_images.remove_image_from_board(image_name=image_name)
+        result = await run_in_thread(
+            ApiDependencies.invoker.services.board_images.remove_image_from_board, image_name=image_name
+        )
         return result
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to remove image from board")
@@ -75,8 +78,10 @@ async def add_images_to_board(
         added_image_names: list[str] = []
         for image_name in image_names:
             try:
-                ApiDependencies.invoker.services.board_images.add_image_to_board(
-                    board_id=board_id, image_name=image_name
+                await run_in_thread(
+                    ApiDependencies.invoker.services.board_images.add_image_to_board,
+                    board_id=board_id,
+                    image_name=image_name,
                 )
                 added_image_names.append(image_name)
             except Exception:
@@ -103,7 +108,9 @@ async def remove_images_from_board(
         removed_image_names: list[str] = []
         for image_name in image_names:
             try:
-                ApiDependencies.invoker.services.board_images.remove_image_from_board(image_name=image_name)
+                await run_in_thread(
+                    ApiDependencies.invoker.services.board_images.remove_image_from_board, image_name=image_name
+                )
                 removed_image_names.append(image_name)
             except Exception:
                 pass
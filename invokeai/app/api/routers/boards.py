@@ -9,6 +9,7 @@ from invokeai.app.services.image_record_storage import OffsetPaginatedResults
 from invokeai.app.services.models.board_record import BoardDTO
 
 from ..dependencies import ApiDependencies
+from ..threadpool import run_in_thread
 
 boards_router = APIRouter(prefix="/v1/boards", tags=["boards"])
 
@@ -35,7 +36,7 @@ async def create_board(
 ) -> BoardDTO:
     """Creates a board"""
     try:
-        result = ApiDependencies.invoker.services.boards.create(board_name=board_name)
+        result = await run_in_thread(ApiDependencies.invoker.services.boards.create, board_name=board_name)
         return result
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to create board")
@@ -48,7 +49,7 @@ async def get_board(
     """Gets a board"""
 
     try:
-        result = ApiDependencies.invoker.services.boards.get_dto(board_id=board_id)
+        result = await run_in_thread(ApiDependencies.invoker.services.boards.get_dto, board_id=board_id)
         return result
     except Exception:
         raise HTTPException(status_code=404, detail="Board not found")
@@ -71,7 +72,7 @@ async def update_board(
 ) -> BoardDTO:
     """Updates a board"""
     try:
-        result = ApiDependencies.invoker.services.boards.update(board_id=board_id, changes=changes)
+        result = await run_in_thread(ApiDependencies.invoker.services.boards.update, board_id=board_id, changes=changes)
         return result
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to update board")
@@ -85,21 +86,21 @@ async def delete_board(
     """Deletes a board"""
     try:
         if include_images is True:
-            deleted_images = ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board(
-                board_id=board_id
+            deleted_images = await run_in_thread(
+                ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board, board_id=board_id
             )
-            ApiDependencies.invoker.services.images.delete_images_on_board(board_id=board_id)
-            ApiDependencies.invoker.services.boards.delete(board_id=board_id)
+            await run_in_thread(ApiDependencies.invoker.services.images.delete_images_on_board, board_id=board_id)
+            await run_in_thread(ApiDependencies.invoker.services.boards.delete, board_id=board_id)
             return DeleteBoardResult(
                 board_id=board_id,
                 deleted_board_images=[],
                 deleted_images=deleted_images,
             )
         else:
-            deleted_board_images = ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board(
-                board_id=board_id
+            deleted_board_images = await run_in_thread(
+                ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board, board_id=board_id
             )
-            ApiDependencies.invoker.services.boards.delete(board_id=board_id)
+            await run_in_thread(ApiDependencies.invoker.services.boards.delete, board_id=board_id)
             return DeleteBoardResult(
                 board_id=board_id,
                 deleted_board_images=deleted_board_images,
@@ -121,9 +122,10 @@ async def list_boards(
 ) -> Union[OffsetPaginatedResults[BoardDTO], list[BoardDTO]]:
     """Gets a list of boards"""
     if all:
-        return ApiDependencies.invoker.services.boards.get_all()
+        return await run_in_thread(ApiDependencies.invoker.services.boards.get_all)
     elif offset is not None and limit is not None:
-        return ApiDependencies.invoker.services.boards.get_many(
+        return await run_in_thread(
+            ApiDependencies.invoker.services.boards.get_many,
             offset,
             limit,
         )
@@ -144,7 +146,8 @@ async def list_all_board_image_names(
 ) -> list[str]:
     """Gets a list of images for a board"""
 
-    image_names = ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board(
+    image_names = await run_in_thread(
+        ApiDependencies.invoker.services.board_images.get_all_board_image_names_for_board,
         board_id,
     )
     return image_names
@@ -1,14 +1,19 @@
+import asyncio
+import hashlib
 import io
+import json
+import struct
+from functools import partial
 from typing import Optional
 
 from PIL import Image
 from fastapi import Body, HTTPException, Path, Query, Request, Response, UploadFile
-from fastapi.responses import FileResponse
 from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from invokeai.app.invocations.metadata import ImageMetadata
 from invokeai.app.models.image import ImageCategory, ResourceOrigin
+from invokeai.app.services.image_file_storage import RESIZED_IMAGE_FORMATS, ResizedImageFormat
 from invokeai.app.services.image_record_storage import OffsetPaginatedResults
 from invokeai.app.services.models.image_record import (
     ImageDTO,
@@ -16,18 +21,17 @@ from invokeai.app.services.models.image_record import (
     ImageUrlsDTO,
 )
 from ..dependencies import ApiDependencies
+from ..file_responses import make_file_response
+from ..threadpool import run_in_thread
 
 images_router = APIRouter(prefix="/v1/images", tags=["images"])
 
 
-# images are immutable; set a high max-age
-IMAGE_MAX_AGE = 31536000
-
-
 @images_router.post(
     "/upload",
     operation_id="upload_image",
     responses={
+        200: {"description": "The same image was already uploaded"},
         201: {"description": "The image was uploaded successfully"},
         415: {"description": "Image upload failed"},
     },
@@ -44,12 +48,32 @@ async def upload_image(
     session_id: Optional[str] = Query(default=None, description="The session ID associated with this upload, if any"),
     crop_visible: Optional[bool] = Query(default=False, description="Whether to crop the image"),
 ) -> ImageDTO:
-    """Uploads an image"""
+    """Uploads an image. Uploading the same file again returns the existing image."""
     if not file.content_type.startswith("image"):
         raise HTTPException(status_code=415, detail="Not an image")
 
     contents = await file.read()
 
+    content_hash = hashlib.sha256(contents)
+    if crop_visible:
+        content_hash.update(b"crop_visible")
+
+    try:
+        existing_image_dto = await run_in_thread(
+            ApiDependencies.invoker.services.images.get_dto_by_content_hash,
+            content_hash.hexdigest(),
+            image_category,
+            is_intermediate,
+            board_id,
+        )
+    except Exception:
+        # Reusing an image is only an optimization; upload it as a new image instead
+        existing_image_dto = None
+    if existing_image_dto is not None:
+        response.status_code = 200
+        response.headers["Location"] = existing_image_dto.image_url
+        return existing_image_dto
+
     try:
         pil_image = Image.open(io.BytesIO(contents))
         if crop_visible:
@@ -60,13 +84,15 @@ async def upload_image(
         raise HTTPException(status_code=415, detail="Failed to read image")
 
     try:
-        image_dto = ApiDependencies.invoker.services.images.create(
+        image_dto = await run_in_thread(
+            ApiDependencies.invoker.services.images.create,
             image=pil_image,
             image_origin=ResourceOrigin.EXTERNAL,
             image_category=image_category,
             session_id=session_id,
             board_id=board_id,
             is_intermediate=is_intermediate,
+            content_hash=content_hash.hexdigest(),
         )
 
         response.status_code = 201
@@ -84,7 +110,7 @@ async def delete_image(
     """Deletes an image"""
 
     try:
-        ApiDependencies.invoker.services.images.delete(image_name)
+        await run_in_thread(ApiDependencies.invoker.services.images.delete, image_name)
     except Exception:
         # TODO: Does this need any exception handling at all?
         pass
@@ -95,7 +121,7 @@ async def clear_intermediates() -> int:
     """Clears all intermediates"""
 
     try:
-        count_deleted = ApiDependencies.invoker.services.images.delete_intermediates()
+        count_deleted = await run_in_thread(ApiDependencies.invoker.services.images.delete_intermediates)
         return count_deleted
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to clear intermediates")
@@ -114,7 +140,7 @@ async def update_image(
     """Updates an image"""
 
     try:
-        return ApiDependencies.invoker.services.images.update(image_name, image_changes)
+        return await run_in_thread(ApiDependencies.invoker.services.images.update, image_name, image_changes)
     except Exception:
         raise HTTPException(status_code=400, detail="Failed to update image")
 
@@ -130,7 +156,7 @@ async def get_image_dto(
     """Gets an image's DTO"""
 
     try:
-        return ApiDependencies.invoker.services.images.get_dto(image_name)
+        return await run_in_thread(ApiDependencies.invoker.services.images.get_dto, image_name)
     except Exception:
         raise HTTPException(status_code=404)
 
@@ -146,7 +172,23 @@ async def get_image_metadata(
     """Gets an image's metadata"""
 
     try:
-        return ApiDependencies.invoker.services.images.get_metadata(image_name)
+        return await run_in_thread(ApiDependencies.invoker.services.images.get_metadata, image_name)
+    except Exception:
+        raise HTTPException(status_code=404)
+
+
+@images_router.get(
+    "/i/{image_name}/workflow",
+    operation_id="get_image_workflow",
+    response_model=Optional[str],
+)
+async def get_image_workflow(
+    image_name: str = Path(description="The name of image to get"),
+) -> Optional[str]:
+    """Gets an image's workflow"""
+
+    try:
+        return await run_in_thread(ApiDependencies.invoker.services.images.get_workflow, image_name)
     except Exception:
         raise HTTPException(status_code=404)
 
@@ -165,24 +207,31 @@ async def get_image_metadata(
     },
 )
 async def get_image_full(
+    request: Request,
     image_name: str = Path(description="The name of full-resolution image file to get"),
-) -> FileResponse:
+    embed_metadata: bool = Query(
+        default=True, description="Whether to embed the image's metadata and workflow in the PNG"
+    ),
+) -> Response:
     """Gets a full-resolution image file"""
 
     try:
         path = ApiDependencies.invoker.services.images.get_path(image_name)
 
-        if not ApiDependencies.invoker.services.images.validate_path(path):
+        if not await run_in_thread(ApiDependencies.invoker.services.images.validate_path, path):
             raise HTTPException(status_code=404)
 
-        response = FileResponse(
+        if not embed_metadata:
+            return await make_file_response(request, path, media_type="image/png", filename=image_name)
+
+        return await make_file_response(
+            request,
             path,
             media_type="image/png",
             filename=image_name,
-            content_disposition_type="inline",
+            get_content=partial(ApiDependencies.invoker.services.images.export, image_name),
+            etag_key=f"{image_name}:embed_metadata",
         )
-        response.headers["Cache-Control"] = f"max-age={IMAGE_MAX_AGE}"
-        return response
     except Exception:
         raise HTTPException(status_code=404)
 
@@ -200,18 +249,112 @@ async def get_image_full(
     },
 )
 async def get_image_thumbnail(
+    request: Request,
     image_name: str = Path(description="The name of thumbnail image file to get"),
-) -> FileResponse:
+) -> Response:
     """Gets a thumbnail image file"""
 
     try:
         path = ApiDependencies.invoker.services.images.get_path(image_name, thumbnail=True)
-        if not ApiDependencies.invoker.services.images.validate_path(path):
+        if not await run_in_thread(ApiDependencies.invoker.services.images.validate_path, path):
             raise HTTPException(status_code=404)
 
-        response = FileResponse(path, media_type="image/webp", content_disposition_type="inline")
-        response.headers["Cache-Control"] = f"max-age={IMAGE_MAX_AGE}"
-        return response
+        return await make_file_response(request, path, media_type="image/webp")
+    except Exception:
+        raise HTTPException(status_code=404)
+
+
+# Most thumbnails are a few KB, so a full batch is a few MB
+MAX_THUMBNAIL_BATCH_SIZE = 500
+
+
+def is_safe_image_name(image_name: str) -> bool:
+    """Checks that an image name is a plain file name, which cannot resolve outside the images folders"""
+    return bool(image_name) and "/" not in image_name and "\\" not in image_name and ".." not in image_name
+
+
+def read_thumbnail(image_name: str) -> Optional[bytes]:
+    if not is_safe_image_name(image_name):
+        return None
+    path = ApiDependencies.invoker.services.images.get_path(image_name, thumbnail=True)
+    if not ApiDependencies.invoker.services.images.validate_path(path):
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@images_router.post(
+    "/thumbnails",
+    operation_id="get_image_thumbnails",
+    response_class=Response,
+    responses={
+        200: {
+            "description": "Return the thumbnails, packed into one response",
+            "content": {"application/octet-stream": {}},
+        },
+        400: {"description": "Too many images requested"},
+    },
+)
+async def get_image_thumbnails(
+    image_names: list[str] = Body(description="The names of the images whose thumbnails to get", embed=True),
+) -> Response:
+    """Gets many thumbnail image files in one response.
+
+    The response starts with the byte length of an index, as a 4-byte big-endian unsigned integer. The index is
+    a UTF-8 JSON list of objects with `image_name`, `offset` and `length`, and is followed by the WEBP files.
+    Offsets are relative to the end of the index. Images whose thumbnails are missing, and names that are not plain
+    file names, are left out.
+    """
+
+    if len(image_names) > MAX_THUMBNAIL_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_THUMBNAIL_BATCH_SIZE} thumbnails per request")
+
+    async def read(image_name: str) -> Optional[bytes]:
+        try:
+            return await run_in_thread(read_thumbnail, image_name)
+        except Exception:
+            return None
+
+    thumbnails = await asyncio.gather(*(read(image_name) for image_name in image_names))
+
+    index = []
+    offset = 0
+    for image_name, thumbnail in zip(image_names, thumbnails):
+        if thumbnail is None:
+            continue
+        index.append(dict(image_name=image_name, offset=offset, length=len(thumbnail)))
+        offset += len(thumbnail)
+    index_bytes = json.dumps(index).encode("utf-8")
+
+    content = b"".join([struct.pack(">I", len(index_bytes)), index_bytes, *(t for t in thumbnails if t is not None)])
+    return Response(content, media_type="application/octet-stream", headers={"Cache-Control": "no-store"})
+
+
+@images_router.get(
+    "/i/{image_name}/resized",
+    operation_id="get_image_resized",
+    response_class=Response,
+    responses={
+        200: {
+            "description": "Return the resized image",
+            "content": {"image/webp": {}, "image/png": {}, "image/jpeg": {}},
+        },
+        404: {"description": "Image not found"},
+    },
+)
+async def get_image_resized(
+    request: Request,
+    image_name: str = Path(description="The name of the image to resize"),
+    size: int = Query(ge=16, le=2048, description="The maximum width and height of the resized image"),
+    image_format: ResizedImageFormat = Query(default="webp", alias="format", description="The format to encode in"),
+) -> Response:
+    """Gets a resized copy of an image, which is made the first time it is requested"""
+
+    try:
+        path = await run_in_thread(
+            ApiDependencies.invoker.services.images.get_resized_path, image_name, size, image_format
+        )
+        return await make_file_response(request, path, media_type=RESIZED_IMAGE_FORMATS[image_format][1])
     except Exception:
         raise HTTPException(status_code=404)
 
@@ -251,18 +394,29 @@ async def list_image_dtos(
         default=None,
         description="The board id to filter by. Use 'none' to find images without a board.",
     ),
+    model_name: Optional[str] = Query(default=None, description="The name of the main model to filter by."),
+    seed: Optional[int] = Query(default=None, description="The seed to filter by."),
+    scheduler: Optional[str] = Query(default=None, description="The scheduler to filter by."),
+    prompt: Optional[str] = Query(
+        default=None, description="Words that must all appear in the image's positive or negative prompt."
+    ),
     offset: int = Query(default=0, description="The page offset"),
     limit: int = Query(default=10, description="The number of images per page"),
 ) -> OffsetPaginatedResults[ImageDTO]:
     """Gets a list of image DTOs"""
 
-    image_dtos = ApiDependencies.invoker.services.images.get_many(
+    image_dtos = await run_in_thread(
+        ApiDependencies.invoker.services.images.get_many,
         offset,
         limit,
         image_origin,
         categories,
         is_intermediate,
         board_id,
+        model_name,
+        seed,
+        scheduler,
+        prompt,
     )
 
     return image_dtos
@@ -277,13 +431,7 @@ async def delete_images_from_list(
     image_names: list[str] = Body(description="The list of names of images to delete", embed=True),
 ) -> DeleteImagesFromListResult:
     try:
-        deleted_images: list[str] = []
-        for image_name in image_names:
-            try:
-                ApiDependencies.invoker.services.images.delete(image_name)
-                deleted_images.append(image_name)
-            except Exception:
-                pass
+        deleted_images = await run_in_thread(ApiDependencies.invoker.services.images.delete_many, image_names)
         return DeleteImagesFromListResult(deleted_images=deleted_images)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to delete images")
@@ -298,13 +446,9 @@ async def star_images_in_list(
     image_names: list[str] = Body(description="The list of names of images to star", embed=True),
 ) -> ImagesUpdatedFromListResult:
     try:
-        updated_image_names: list[str] = []
-        for image_name in image_names:
-            try:
-                ApiDependencies.invoker.services.images.update(image_name, changes=ImageRecordChanges(starred=True))
-                updated_image_names.append(image_name)
-            except Exception:
-                pass
+        updated_image_names = await run_in_thread(
+            ApiDependencies.invoker.services.images.update_many, image_names, ImageRecordChanges(starred=True)
+        )
         return ImagesUpdatedFromListResult(updated_image_names=updated_image_names)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to star images")
@@ -315,13 +459,9 @@ async def unstar_images_in_list(
     image_names: list[str] = Body(description="The list of names of images to unstar", embed=True),
 ) -> ImagesUpdatedFromListResult:
     try:
-        updated_image_names: list[str] = []
-        for image_name in image_names:
-            try:
-                ApiDependencies.invoker.services.images.update(image_name, changes=ImageRecordChanges(starred=False))
-                updated_image_names.append(image_name)
-            except Exception:
-                pass
+        updated_image_names = await run_in_thread(
+            ApiDependencies.invoker.services.images.update_many, image_names, ImageRecordChanges(starred=False)
+        )
         return ImagesUpdatedFromListResult(updated_image_names=updated_image_names)
     except Exception:
         raise HTTPException(status_code=500, detail="Failed to unstar images")
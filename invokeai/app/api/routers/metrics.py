@@ -0,0 +1,16 @@
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRouter
+
+from invokeai.app.util.metrics import REGISTRY
+
+from ..threadpool import run_in_thread
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics", operation_id="get_metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Gets the server's metrics in the Prometheus text format"""
+    # Reading memory usage may block
+    content = await run_in_thread(REGISTRY.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
@@ -4,11 +4,12 @@ from typing import Annotated, Optional, Union
 
 from fastapi import Body, HTTPException, Path, Query, Response
 from fastapi.routing import APIRouter
+from pydantic import BaseModel
 from pydantic.fields import Field
 
 # Importing * is bad karma but needed here for node detection
 from ...invocations import *  # noqa: F401 F403
-from ...invocations.baseinvocation import BaseInvocation
+from ...invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from ...services.graph import (
     Edge,
     EdgeConnection,
@@ -18,10 +19,27 @@ from ...services.graph import (
 )
 from ...services.item_storage import PaginatedResults
 from ..dependencies import ApiDependencies
+from ..threadpool import run_in_thread
 
 session_router = APIRouter(prefix="/v1/sessions", tags=["sessions"])
 
 
+class SessionInvocation(BaseModel):
+    """An invocation prepared by a session, with its output or error"""
+
+    invocation: Annotated[  # type: ignore
+        Union[BaseInvocation.get_invocations()], Field(discriminator="type", description="The invocation")
+    ]
+    source_node_id: str = Field(description="The id of the node in the session's graph that it was prepared from")
+    result: Optional[  # type: ignore
+        Annotated[
+            Union[BaseInvocationOutput.get_all_subclasses_tuple()],
+            Field(discriminator="type", description="The output of the invocation, if it has completed"),
+        ]
+    ] = None
+    error: Optional[str] = Field(default=None, description="The error raised by the invocation, if it failed")
+
+
 @session_router.post(
     "/",
     operation_id="create_session",
@@ -34,7 +52,7 @@ async def create_session(
     graph: Optional[Graph] = Body(default=None, description="The graph to initialize the session with")
 ) -> GraphExecutionState:
     """Creates a new session, optionally initializing it with an invocation graph"""
-    session = ApiDependencies.invoker.create_execution_state(graph)
+    session = await run_in_thread(ApiDependencies.invoker.create_execution_state, graph)
     return session
 
 
@@ -50,9 +68,11 @@ async def list_sessions(
 ) -> PaginatedResults[GraphExecutionState]:
     """Gets a list of sessions, optionally searching"""
     if query == "":
-        result = ApiDependencies.invoker.services.graph_execution_manager.list(page, per_page)
+        result = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.list, page, per_page)
     else:
-        result = ApiDependencies.invoker.services.graph_execution_manager.search(query, page, per_page)
+        result = await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.search, query, page, per_page
+        )
     return result
 
 
@@ -68,7 +88,7 @@ async def get_session(
     session_id: str = Path(description="The id of the session to get"),
 ) -> GraphExecutionState:
     """Gets a session"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
     else:
@@ -91,14 +111,14 @@ async def add_node(
     ),
 ) -> str:
     """Adds a node to the graph"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
     try:
         session.add_node(node)
-        ApiDependencies.invoker.services.graph_execution_manager.set(
-            session
+        await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.set, session
         )  # TODO: can this be done automatically, or add node through an API?
         return session.id
     except NodeAlreadyExecutedError:
@@ -124,14 +144,14 @@ async def update_node(
     ),
 ) -> GraphExecutionState:
     """Updates a node in the graph and removes all linked edges"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
     try:
         session.update_node(node_path, node)
-        ApiDependencies.invoker.services.graph_execution_manager.set(
-            session
+        await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.set, session
         )  # TODO: can this be done automatically, or add node through an API?
         return session
     except NodeAlreadyExecutedError:
@@ -154,14 +174,14 @@ async def delete_node(
     node_path: str = Path(description="The path to the node to delete"),
 ) -> GraphExecutionState:
     """Deletes a node in the graph and removes all linked edges"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
     try:
         session.delete_node(node_path)
-        ApiDependencies.invoker.services.graph_execution_manager.set(
-            session
+        await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.set, session
         )  # TODO: can this be done automatically, or add node through an API?
         return session
     except NodeAlreadyExecutedError:
@@ -184,14 +204,14 @@ async def add_edge(
     edge: Edge = Body(description="The edge to add"),
 ) -> GraphExecutionState:
     """Adds an edge to the graph"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
     try:
         session.add_edge(edge)
-        ApiDependencies.invoker.services.graph_execution_manager.set(
-            session
+        await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.set, session
         )  # TODO: can this be done automatically, or add node through an API?
         return session
     except NodeAlreadyExecutedError:
@@ -218,7 +238,7 @@ async def delete_edge(
     to_field: str = Path(description="The field of the node the edge is going to"),
 ) -> GraphExecutionState:
     """Deletes an edge from the graph"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
@@ -228,8 +248,8 @@ async def delete_edge(
             destination=EdgeConnection(node_id=to_node_id, field=to_field),
         )
         session.delete_edge(edge)
-        ApiDependencies.invoker.services.graph_execution_manager.set(
-            session
+        await run_in_thread(
+            ApiDependencies.invoker.services.graph_execution_manager.set, session
         )  # TODO: can this be done automatically, or add node through an API?
         return session
     except NodeAlreadyExecutedError:
@@ -238,6 +258,32 @@ async def delete_edge(
         raise HTTPException(status_code=400)
 
 
+@session_router.get(
+    "/{session_id}/invocations/{invocation_id}",
+    operation_id="get_session_invocation",
+    responses={
+        200: {"model": SessionInvocation},
+        404: {"description": "Session or invocation not found"},
+    },
+)
+async def get_session_invocation(
+    session_id: str = Path(description="The id of the session"),
+    invocation_id: str = Path(description="The id of the prepared invocation, as sent in session events"),
+) -> SessionInvocation:
+    """Gets an invocation prepared by a session, with its output or error. Session events only reference these when
+    compact event payloads are enabled."""
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
+    if session is None or invocation_id not in session.prepared_source_mapping:
+        raise HTTPException(status_code=404)
+
+    return SessionInvocation(
+        invocation=session.execution_graph.get_node(invocation_id),
+        source_node_id=session.prepared_source_mapping[invocation_id],
+        result=session.results.get(invocation_id),
+        error=session.errors.get(invocation_id),
+    )
+
+
 @session_router.put(
     "/{session_id}/invoke",
     operation_id="invoke_session",
@@ -253,14 +299,14 @@ async def invoke_session(
     all: bool = Query(default=False, description="Whether or not to invoke all remaining invocations"),
 ) -> Response:
     """Invokes a session"""
-    session = ApiDependencies.invoker.services.graph_execution_manager.get(session_id)
+    session = await run_in_thread(ApiDependencies.invoker.services.graph_execution_manager.get, session_id)
     if session is None:
         raise HTTPException(status_code=404)
 
     if session.is_complete():
         raise HTTPException(status_code=400)
 
-    ApiDependencies.invoker.invoke(session, invoke_all=all)
+    await run_in_thread(ApiDependencies.invoker.invoke, session, invoke_all=all)
     return Response(status_code=202)
 
 
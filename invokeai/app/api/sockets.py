@@ -4,8 +4,11 @@ from fastapi import FastAPI
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event
 from fastapi_socketio import SocketManager
+from pydantic import ValidationError
 
+from ..models.image import ProgressImageSettings
 from ..services.events import EventServiceBase
+from .dependencies import ApiDependencies
 
 
 class SocketIO:
@@ -15,6 +18,7 @@ class SocketIO:
         self.__sio = SocketManager(app=app)
         self.__sio.on("subscribe", handler=self._handle_sub)
         self.__sio.on("unsubscribe", handler=self._handle_unsub)
+        self.__sio.on("disconnect", handler=self._handle_disconnect)
 
         local_handler.register(event_name=EventServiceBase.session_event, _func=self._handle_session_event)
 
@@ -28,9 +32,21 @@ class SocketIO:
     async def _handle_sub(self, sid, data, *args, **kwargs):
         if "session" in data:
             self.__sio.enter_room(sid, data["session"])
+            # Clients may ask for fewer or smaller progress images, e.g. {"every_n_steps": 5, "max_fps": 2}
+            settings = None
+            try:
+                if "progress_images" in data:
+                    settings = ProgressImageSettings.parse_obj(data["progress_images"])
+            except ValidationError:
+                pass
+            ApiDependencies.invoker.services.events.subscribe(data["session"], sid, progress_image_settings=settings)
 
         # @app.sio.on('unsubscribe')
 
     async def _handle_unsub(self, sid, data, *args, **kwargs):
         if "session" in data:
             self.__sio.leave_room(sid, data["session"])
+            ApiDependencies.invoker.services.events.unsubscribe(data["session"], sid)
+
+    async def _handle_disconnect(self, sid, *args, **kwargs):
+        ApiDependencies.invoker.services.events.unsubscribe_all(sid)
@@ -0,0 +1,206 @@
+import asyncio
+import base64
+import json
+import time
+from collections import OrderedDict, deque
+from enum import Enum
+from itertools import count
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import FastAPI, Header, Query
+from fastapi.responses import StreamingResponse
+from fastapi_events.handlers.local import local_handler
+from fastapi_events.typing import Event
+
+from ..services.events import EventServiceBase
+from .dependencies import ApiDependencies
+from .events import COALESCED_EVENTS
+
+# Number of recent events kept per session, so that clients can resume a stream after reconnecting
+EVENT_HISTORY_SIZE = 200
+# Number of sessions whose recent events are kept
+MAX_SESSION_HISTORIES = 1000
+# Seconds that the events of a session are still kept after its last client disconnects, so that it can resume
+HISTORY_RETENTION = 300
+# Number of events waiting to be sent to a client. A client that falls further behind is disconnected, and resumes.
+MAX_PENDING_EVENTS = 1000
+# Seconds between comments sent to keep idle connections open
+KEEP_ALIVE_INTERVAL = 15
+# Milliseconds that clients wait before reconnecting
+RETRY_INTERVAL = 3000
+
+
+class SessionEvent:
+    """A session event, numbered in the order that it was dispatched"""
+
+    id: int
+    session_id: str
+    event_name: str
+    data: dict
+
+    def __init__(self, id: int, session_id: str, event_name: str, data: dict):
+        self.id = id
+        self.session_id = session_id
+        self.event_name = event_name
+        self.data = data
+
+    def encode(self) -> bytes:
+        data = json.dumps(self.data, default=encode_value)
+        return f"id: {self.id}\nevent: {self.event_name}\ndata: {data}\n\n".encode("utf-8")
+
+
+def encode_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+class ServerSentEvents:
+    """Streams session events to HTTP clients, as an alternative to socket.io.
+
+    Clients follow any number of sessions with `GET /api/v1/events?session_id=...`. Every event has an id, so a
+    client that reconnects with a `Last-Event-ID` header is sent the events that it missed, as long as they are
+    among the last `EVENT_HISTORY_SIZE` events of their session.
+
+    Events are only kept for sessions that are followed, or were followed in the last `HISTORY_RETENTION` seconds.
+    Only the latest progress event of a session is kept; a resuming client has no use for older ones.
+    """
+
+    __event_ids: "count[int]"
+    __histories: OrderedDict[str, deque[SessionEvent]]
+    __subscribers: dict[str, set[asyncio.Queue]]
+    # {session id => when its last client disconnected}, earliest first
+    __unfollowed_at: dict[str, float]
+
+    def __init__(self, app: FastAPI):
+        # Ids keep increasing across restarts, so that clients resuming from an earlier run miss nothing
+        self.__event_ids = count(time.time_ns() // 1000)
+        self.__histories = OrderedDict()
+        self.__subscribers = dict()
+        self.__unfollowed_at = dict()
+
+        local_handler.register(event_name=EventServiceBase.session_event, _func=self._handle_session_event)
+        app.add_api_route(
+            "/api/v1/events",
+            self._stream_events,
+            methods=["GET"],
+            operation_id="stream_session_events",
+            tags=["events"],
+            response_class=StreamingResponse,
+            responses={200: {"content": {"text/event-stream": {}}, "description": "A stream of session events"}},
+        )
+
+    async def _handle_session_event(self, event: Event):
+        session_id = event[1]["data"]["graph_execution_state_id"]
+        session_event = SessionEvent(
+            id=next(self.__event_ids),
+            session_id=session_id,
+            event_name=event[1]["event"],
+            data=event[1]["data"],
+        )
+
+        history = self.__get_history(session_id)
+        if history is not None:
+            if session_event.event_name in COALESCED_EVENTS:
+                # Only the latest progress matters to a resuming client
+                for old_event in [e for e in history if e.event_name == session_event.event_name]:
+                    history.remove(old_event)
+            history.append(session_event)
+
+        for queue in self.__subscribers.get(session_id, ()):
+            try:
+                queue.put_nowait(session_event)
+            except asyncio.QueueFull:
+                # The client is too far behind; it reconnects and resumes from the history
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def __get_history(self, session_id: str) -> Optional[deque[SessionEvent]]:
+        """Gets the history of a session, if its events are kept"""
+        self.__expire_histories()
+        history = self.__histories.get(session_id)
+        if history is not None:
+            self.__histories.move_to_end(session_id)
+            return history
+        if session_id not in self.__subscribers:
+            return None
+
+        history = deque(maxlen=EVENT_HISTORY_SIZE)
+        self.__histories[session_id] = history
+        if len(self.__histories) > MAX_SESSION_HISTORIES:
+            oldest_session_id, _ = self.__histories.popitem(last=False)
+            self.__unfollowed_at.pop(oldest_session_id, None)
+        return history
+
+    def __expire_histories(self) -> None:
+        """Drops the histories of sessions that nobody has followed for `HISTORY_RETENTION` seconds"""
+        now = time.monotonic()
+        while self.__unfollowed_at:
+            session_id, unfollowed_at = next(iter(self.__unfollowed_at.items()))
+            if now - unfollowed_at <= HISTORY_RETENTION:
+                break
+            del self.__unfollowed_at[session_id]
+            self.__histories.pop(session_id, None)
+
+    async def _stream_events(
+        self,
+        session_id: list[str] = Query(description="The ids of the sessions to follow"),
+        last_event_id: Optional[int] = Header(default=None, description="The id of the last event received"),
+    ) -> StreamingResponse:
+        """Streams the events of sessions as server-sent events"""
+        return StreamingResponse(
+            self.stream(session_id, last_event_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    async def stream(self, session_ids: list[str], last_event_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yields the encoded events of sessions, starting after the event with `last_event_id`"""
+        queue: asyncio.Queue[Optional[SessionEvent]] = asyncio.Queue(maxsize=MAX_PENDING_EVENTS)
+        subscriber_id = f"sse:{id(queue)}"
+        events = ApiDependencies.invoker.services.events
+        for session_id in session_ids:
+            self.__subscribers.setdefault(session_id, set()).add(queue)
+            self.__unfollowed_at.pop(session_id, None)
+            events.subscribe(session_id, subscriber_id)
+
+        try:
+            yield f"retry: {RETRY_INTERVAL}\n\n".encode("utf-8")
+
+            if last_event_id is not None:
+                missed_events: list[SessionEvent] = [
+                    event
+                    for session_id in session_ids
+                    for event in self.__histories.get(session_id, ())
+                    if event.id > last_event_id
+                ]
+                for event in sorted(missed_events, key=lambda e: e.id):
+                    yield event.encode()
+            else:
+                missed_events = []
+            # Events sent from the history may also be waiting in the queue
+            last_sent_id = max((e.id for e in missed_events), default=0)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                if event.id > last_sent_id:
+                    yield event.encode()
+        finally:
+            events.unsubscribe_all(subscriber_id)
+            for session_id in session_ids:
+                subscribers = self.__subscribers.get(session_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self.__subscribers[session_id]
+                    if session_id in self.__histories:
+                        self.__unfollowed_at[session_id] = time.monotonic()
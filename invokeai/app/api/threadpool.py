@@ -0,0 +1,38 @@
+from functools import partial
+from typing import Callable, Optional, TypeVar
+
+from anyio import CapacityLimiter, to_thread
+
+T = TypeVar("T")
+
+DEFAULT_MAX_THREADS = 8
+
+
+class ApiThreadPool:
+    """Bounded pool of worker threads for blocking service calls made from async API routes.
+
+    The storage services use synchronous sqlite connections guarded by a threading lock. Calling them
+    directly from an `async def` route blocks the event loop (and socket.io with it) for as long as the
+    query takes, or for as long as the processor holds the lock. Routes should instead `await run_in_thread(...)`.
+    """
+
+    __max_threads: int = DEFAULT_MAX_THREADS
+    __limiter: Optional[CapacityLimiter] = None
+
+    @classmethod
+    def configure(cls, max_threads: int) -> None:
+        """Sets the maximum number of worker threads. Takes effect the next time the pool is used."""
+        cls.__max_threads = max_threads
+        cls.__limiter = None
+
+    @classmethod
+    def get_limiter(cls) -> CapacityLimiter:
+        # The limiter binds to the running event loop, so it is created lazily from within a route
+        if cls.__limiter is None:
+            cls.__limiter = CapacityLimiter(cls.__max_threads)
+        return cls.__limiter
+
+
+async def run_in_thread(func: Callable[..., T], *args, **kwargs) -> T:
+    """Runs a blocking callable on the API worker pool and awaits its result."""
+    return await to_thread.run_sync(partial(func, *args, **kwargs), limiter=ApiThreadPool.get_limiter())
@@ -24,8 +24,9 @@ import invokeai.frontend.web as web_dir
 import mimetypes
 
 from .api.dependencies import ApiDependencies
-from .api.routers import sessions, models, images, boards, board_images, app_info
+from .api.routers import sessions, models, images, boards, board_images, app_info, metrics
 from .api.sockets import SocketIO
+from .api.sse import ServerSentEvents
 from .invocations.baseinvocation import BaseInvocation, _InputField, _OutputField, UIConfigBase
 
 import torch
@@ -60,6 +61,7 @@ app.add_middleware(
 )
 
 socket_io = SocketIO(app)
+server_sent_events = ServerSentEvents(app)
 
 
 # Add startup event to load dependencies
@@ -100,6 +102,8 @@ app.include_router(board_images.board_images_router, prefix="/api")
 
 app.include_router(app_info.app_router, prefix="/api")
 
+app.include_router(metrics.metrics_router)
+
 
 # Build a custom OpenAPI to include all outputs
 # TODO: can outputs be included on metadata of invocation schemas somehow?
@@ -30,8 +30,9 @@ from invokeai.app.services.images import ImageService, ImageServiceDependencies
 from invokeai.app.services.resource_name import SimpleNameService
 from invokeai.app.services.urls import LocalUrlService
 from invokeai.app.services.invocation_stats import InvocationStatsService
+from .services.artifact_reaper import DefaultArtifactReaper
 from .services.default_graphs import default_text_to_image_graph_id, create_system_graphs
-from .services.latent_storage import DiskLatentsStorage, ForwardCacheLatentsStorage
+from .services.latent_storage import ForwardCacheLatentsStorage, SafetensorsLatentsStorage
 
 from .cli.commands import BaseCommand, CliContext, ExitCli, SortedHelpFormatter, add_graph_parsers, add_parsers
 from .cli.completer import set_autocompleter
@@ -46,6 +47,7 @@ from .services.graph import (
     are_connection_types_compatible,
 )
 from .services.image_file_storage import DiskImageFileStorage
+from .services.invocation_performance_storage import SqliteInvocationPerformanceStorage
 from .services.invocation_queue import MemoryInvocationQueue
 from .services.invocation_services import InvocationServices
 from .services.invoker import Invoker
@@ -259,8 +261,27 @@ def invoke_cli():
     )
 
     urls = LocalUrlService()
+    invocation_history = (
+        SqliteInvocationPerformanceStorage(
+            filename=db_location,
+            full_resolution_days=config.invocation_history_full_days,
+            max_days=config.invocation_history_days,
+        )
+        if config.invocation_history
+        else None
+    )
+
     image_record_storage = SqliteImageRecordStorage(db_location)
-    image_file_storage = DiskImageFileStorage(f"{output_folder}/images")
+    image_file_storage = DiskImageFileStorage(
+        f"{output_folder}/images",
+        hard_delete=config.hard_delete_images,
+        max_cache_size=config.image_cache_size,
+        write_threads=config.image_write_threads,
+        compress_level=config.png_compress_level,
+        intermediate_compress_level=config.intermediate_png_compress_level,
+        max_resized_size=config.resized_image_cache_size,
+        max_intermediate_cache_size=config.intermediate_cache_size,
+    )
     names = SimpleNameService()
 
     board_record_storage = SqliteBoardRecordStorage(db_location)
@@ -301,15 +322,26 @@ def invoke_cli():
     services = InvocationServices(
         model_manager=model_manager,
         events=events,
-        latents=ForwardCacheLatentsStorage(DiskLatentsStorage(f"{output_folder}/latents")),
+        latents=ForwardCacheLatentsStorage(
+            SafetensorsLatentsStorage(f"{output_folder}/latents"),
+            max_latents_cache_size=config.latents_cache_size,
+            max_conditioning_cache_size=config.conditioning_cache_size,
+            max_device_cache_size=config.latents_device_cache_size,
+        ),
         images=images,
         boards=boards,
         board_images=board_images,
         queue=MemoryInvocationQueue(),
+        # Every command is added to one session, so latents must stay linkable until the CLI exits
+        reaper=DefaultArtifactReaper(
+            delete_session_latents=False,
+            intermediates_ttl=config.intermediate_image_ttl,
+            deletes_per_second=config.reaper_deletes_per_second,
+        ),
         graph_library=SqliteItemStorage[LibraryGraph](filename=db_location, table_name="graphs"),
         graph_execution_manager=graph_execution_manager,
         processor=DefaultInvocationProcessor(),
-        performance_statistics=InvocationStatsService(graph_execution_manager),
+        performance_statistics=InvocationStatsService(graph_execution_manager, invocation_history),
         logger=logger,
         configuration=config,
     )
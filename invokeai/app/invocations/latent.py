@@ -538,8 +538,8 @@ class DenoiseLatentsInvocation(BaseInvocation):
                     callback=step_callback,
                 )
 
+            # The latents service keeps the latents on the device for the next node, and saves a copy to disk
             # https://discuss.huggingface.co/t/memory-usage-by-later-pipeline-stages/23699
-            result_latents = result_latents.to("cpu")
             torch.cuda.empty_cache()
 
             name = f"{context.graph_execution_state_id}__{self.id}"
@@ -680,8 +680,8 @@ class ResizeLatentsInvocation(BaseInvocation):
             antialias=self.antialias if self.mode in ["bilinear", "bicubic"] else False,
         )
 
+        # The latents service keeps the latents on the device for the next node, and saves a copy to disk
         # https://discuss.huggingface.co/t/memory-usage-by-later-pipeline-stages/23699
-        resized_latents = resized_latents.to("cpu")
         torch.cuda.empty_cache()
 
         name = f"{context.graph_execution_state_id}__{self.id}"
@@ -716,8 +716,8 @@ class ScaleLatentsInvocation(BaseInvocation):
             antialias=self.antialias if self.mode in ["bilinear", "bicubic"] else False,
         )
 
+        # The latents service keeps the latents on the device for the next node, and saves a copy to disk
         # https://discuss.huggingface.co/t/memory-usage-by-later-pipeline-stages/23699
-        resized_latents = resized_latents.to("cpu")
         torch.cuda.empty_cache()
 
         name = f"{context.graph_execution_state_id}__{self.id}"
@@ -803,7 +803,6 @@ class ImageToLatentsInvocation(BaseInvocation):
         latents = self.vae_encode(vae_info, self.fp32, self.tiled, image_tensor)
 
         name = f"{context.graph_execution_state_id}__{self.id}"
-        latents = latents.to("cpu")
         context.services.latents.save(name, latents)
         return build_latents_output(latents_name=name, latents=latents, seed=None)
 
@@ -872,8 +871,8 @@ class BlendLatentsInvocation(BaseInvocation):
         # blend
         blended_latents = slerp(self.alpha, latents_a, latents_b)
 
+        # The latents service keeps the latents on the device for the next node, and saves a copy to disk
         # https://discuss.huggingface.co/t/memory-usage-by-later-pipeline-stages/23699
-        blended_latents = blended_latents.to("cpu")
         torch.cuda.empty_cache()
 
         name = f"{context.graph_execution_state_id}__{self.id}"
@@ -6,6 +6,7 @@ from pydantic import validator
 
 from invokeai.app.invocations.latent import LatentsField
 from invokeai.app.util.misc import SEED_MAX, get_random_seed
+from invokeai.app.util.noise_recipe import NoiseRecipe, make_noise_batch
 
 from ...backend.util.devices import choose_torch_device, torch_dtype
 from .baseinvocation import (
@@ -35,25 +36,15 @@ def get_noise(
     perlin: float = 0.0,
 ):
     """Generate noise for a given image size."""
-    noise_device_type = "cpu" if use_cpu else device.type
-
-    # limit noise to only the diffusion image channels, not the mask channels
-    input_channels = min(latent_channels, 4)
-    generator = torch.Generator(device=noise_device_type).manual_seed(seed)
-
-    noise_tensor = torch.randn(
-        [
-            1,
-            input_channels,
-            height // downsampling_factor,
-            width // downsampling_factor,
-        ],
+    return make_noise_batch(
+        seeds=[seed],
+        width=width,
+        height=height,
         dtype=torch_dtype(device),
-        device=noise_device_type,
-        generator=generator,
-    ).to("cpu")
-
-    return noise_tensor
+        device_type="cpu" if use_cpu else device.type,
+        latent_channels=latent_channels,
+        downsampling_factor=downsampling_factor,
+    )
 
 
 """
@@ -70,14 +61,6 @@ class NoiseOutput(BaseInvocationOutput):
     height: int = OutputField(description=FieldDescriptions.height)
 
 
-def build_noise_output(latents_name: str, latents: torch.Tensor, seed: int):
-    return NoiseOutput(
-        noise=LatentsField(latents_name=latents_name, seed=seed),
-        width=latents.size()[3] * 8,
-        height=latents.size()[2] * 8,
-    )
-
-
 @invocation("noise", title="Noise", tags=["latents", "noise"], category="latents", version="1.0.0")
 class NoiseInvocation(BaseInvocation):
     """Generates latent noise."""
@@ -111,13 +94,17 @@ class NoiseInvocation(BaseInvocation):
         return v % (SEED_MAX + 1)
 
     def invoke(self, context: InvocationContext) -> NoiseOutput:
-        noise = get_noise(
+        # The noise is made from its recipe when it is read, so it is never saved
+        device = choose_torch_device()
+        recipe = NoiseRecipe(
+            seed=self.seed,
+            width=self.width,
+            height=self.height,
+            dtype=str(torch_dtype(device)).removeprefix("torch."),
+            device_type="cpu" if self.use_cpu else device.type,
+        )
+        return NoiseOutput(
+            noise=LatentsField(latents_name=recipe.name, seed=self.seed),
             width=self.width,
             height=self.height,
-            device=choose_torch_device(),
-            seed=self.seed,
-            use_cpu=self.use_cpu,
         )
-        name = f"{context.graph_execution_state_id}__{self.id}"
-        context.services.latents.save(name, noise)
-        return build_noise_output(latents_name=name, latents=noise, seed=self.seed)
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Optional
 
 from pydantic import BaseModel, Field
 
@@ -10,7 +11,17 @@ class ProgressImage(BaseModel):
 
     width: int = Field(description="The effective width of the image in pixels")
     height: int = Field(description="The effective height of the image in pixels")
-    dataURL: str = Field(description="The image data as a b64 data URL")
+    dataURL: Optional[str] = Field(default=None, description="The image data as a b64 data URL")
+    data: Optional[bytes] = Field(default=None, description="The JPEG image data, sent instead of the data URL")
+
+
+class ProgressImageSettings(BaseModel):
+    """How often, and how, progress images are sent to the subscribers of a session"""
+
+    every_n_steps: int = Field(default=1, ge=1, description="Send a progress image every N steps")
+    max_fps: Optional[float] = Field(default=None, gt=0, description="Maximum number of progress images per second")
+    max_size: Optional[int] = Field(default=None, ge=8, description="Maximum width and height of the progress image")
+    binary: bool = Field(default=False, description="Send the JPEG data as a binary attachment, without a data URL")
 
 
 class ResourceOrigin(str, Enum, metaclass=MetaEnum):
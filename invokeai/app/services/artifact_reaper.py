@@ -0,0 +1,178 @@
+import time
+from abc import ABC, abstractmethod
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .graph import GraphExecutionState
+    from .invoker import Invoker
+
+# How often expired intermediates are looked for, in seconds, unless the last sweep hit the I/O budget
+INTERMEDIATES_SWEEP_INTERVAL = 60
+
+
+def get_session_id(name: str) -> str:
+    """Gets the id of the session that saved latents or conditioning, from the prefix of their name"""
+    return name.split("_", 1)[0]
+
+
+class ArtifactReaperBase(ABC):
+    """Deletes latents, conditioning and intermediate images once they are no longer needed."""
+
+    @abstractmethod
+    def release_session(self, session_id: str) -> None:
+        """Schedules the latents and conditioning saved by a session for deletion"""
+        pass
+
+    @abstractmethod
+    def reap(self, max_deletes: int) -> int:
+        """Deletes at most `max_deletes` released latents and expired intermediates, returning the number deleted"""
+        pass
+
+
+class DefaultArtifactReaper(ArtifactReaperBase):
+    """Deletes artifacts on a background thread, within a budget of deletes per second.
+
+    Latents and conditioning are tracked per session as they are saved; latents names are prefixed with the id
+    of the session that saved them, followed by an underscore. A session's latents are released when it completes
+    or is deleted, and deleted after `release_delay` seconds. Nodes may still be added to a completed session, so a
+    session that is invoked again within that time keeps its latents.
+    """
+
+    __invoker: "Invoker"
+    __lock: Lock
+    # {session id => names of latents saved by the session}, for sessions that have not completed
+    __tracked_names: dict[str, set[str]]
+    # Names of released latents and when they were released, oldest first
+    __released_names: dict[str, float]
+    # {session id => names of the session's released latents}
+    __released_sessions: dict[str, set[str]]
+    __delete_session_latents: bool
+    __intermediates_ttl: int
+    __deletes_per_second: int
+    __release_delay: float
+    __last_sweep: float
+    __has_intermediates_backlog: bool
+    __stop_event: Event
+    __reaper_thread: Optional[Thread]
+
+    def __init__(
+        self,
+        delete_session_latents: bool = True,
+        intermediates_ttl: int = 0,
+        deletes_per_second: int = 50,
+        release_delay: float = 60,
+    ):
+        self.__lock = Lock()
+        self.__tracked_names = dict()
+        self.__released_names = dict()
+        self.__released_sessions = dict()
+        self.__delete_session_latents = delete_session_latents
+        self.__intermediates_ttl = intermediates_ttl
+        self.__deletes_per_second = deletes_per_second
+        self.__release_delay = release_delay
+        self.__last_sweep = 0
+        self.__has_intermediates_backlog = False
+        self.__stop_event = Event()
+        self.__reaper_thread = None
+
+    def start(self, invoker: "Invoker") -> None:
+        self.__invoker = invoker
+        if self.__delete_session_latents:
+            invoker.services.latents.on_saved(self.__on_latents_saved)
+            invoker.services.graph_execution_manager.on_changed(self.__on_session_changed)
+            invoker.services.graph_execution_manager.on_deleted(self.release_session)
+        elif self.__intermediates_ttl == 0:
+            # Nothing to do
+            return
+
+        self.__reaper_thread = Thread(
+            name="artifact_reaper",
+            target=self.__process,
+            kwargs=dict(stop_event=self.__stop_event),
+        )
+        self.__reaper_thread.daemon = True
+        self.__reaper_thread.start()
+
+    def stop(self, *args, **kwargs) -> None:
+        self.__stop_event.set()
+
+    def release_session(self, session_id: str) -> None:
+        released_at = time.time()
+        with self.__lock:
+            names = self.__tracked_names.pop(session_id, None)
+            if not names:
+                return
+            for name in names:
+                self.__released_names[name] = released_at
+            self.__released_sessions.setdefault(session_id, set()).update(names)
+
+    def reap(self, max_deletes: int) -> int:
+        deleted = 0
+        released_before = time.time() - self.__release_delay
+        while deleted < max_deletes:
+            with self.__lock:
+                name = next(iter(self.__released_names), None)
+                if name is None or self.__released_names[name] > released_before:
+                    break
+                del self.__released_names[name]
+                self.__discard_released_session_name(name)
+            try:
+                self.__invoker.services.latents.delete(name)
+            except FileNotFoundError:
+                # Already deleted
+                pass
+            except Exception as e:
+                self.__invoker.services.logger.warning(f"Failed to delete latents {name}: {e}")
+            deleted += 1
+
+        if self.__intermediates_ttl == 0 or deleted >= max_deletes:
+            return deleted
+        if not self.__has_intermediates_backlog and time.time() - self.__last_sweep < INTERMEDIATES_SWEEP_INTERVAL:
+            return deleted
+
+        limit = max_deletes - deleted
+        count = self.__invoker.services.images.delete_intermediates(older_than=self.__intermediates_ttl, limit=limit)
+        self.__last_sweep = time.time()
+        self.__has_intermediates_backlog = count == limit
+        return deleted + count
+
+    def __discard_released_session_name(self, name: str) -> None:
+        """Removes a name from the index of released names. Call with the lock."""
+        session_id = get_session_id(name)
+        names = self.__released_sessions.get(session_id)
+        if names is None:
+            return
+        names.discard(name)
+        if not names:
+            del self.__released_sessions[session_id]
+
+    def __on_latents_saved(self, name: str) -> None:
+        with self.__lock:
+            if self.__released_names.pop(name, None) is not None:
+                self.__discard_released_session_name(name)
+            self.__tracked_names.setdefault(get_session_id(name), set()).add(name)
+
+    def __on_session_changed(self, session: "GraphExecutionState") -> None:
+        with self.__lock:
+            if session.id not in self.__tracked_names and session.id not in self.__released_sessions:
+                return
+
+        if session.is_complete():
+            self.release_session(session.id)
+            return
+
+        # The session was extended after it completed; its latents may be linked to the new nodes
+        with self.__lock:
+            released_names = self.__released_sessions.pop(session.id, set())
+            for name in released_names:
+                del self.__released_names[name]
+            if released_names:
+                self.__tracked_names.setdefault(session.id, set()).update(released_names)
+
+    def __process(self, stop_event: Event) -> None:
+        while not stop_event.wait(1):
+            try:
+                self.reap(self.__deletes_per_second)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Error while deleting artifacts: {e}")
@@ -4,6 +4,7 @@ import threading
 from typing import Optional, cast
 
 from invokeai.app.services.image_record_storage import OffsetPaginatedResults
+from invokeai.app.services.sqlite import TimedConnection
 from invokeai.app.services.models.image_record import (
     ImageRecord,
     deserialize_image_record,
@@ -46,14 +47,6 @@ class BoardImageRecordStorageBase(ABC):
         """Gets an image's board id, if it has one."""
         pass
 
-    @abstractmethod
-    def get_image_count_for_board(
-        self,
-        board_id: str,
-    ) -> int:
-        """Gets the number of images for a board."""
-        pass
-
 
 class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
     _filename: str
@@ -64,7 +57,7 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
     def __init__(self, filename: str) -> None:
         super().__init__()
         self._filename = filename
-        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn = sqlite3.connect(filename, check_same_thread=False, factory=TimedConnection)
         # Enable row factory to get rows as dictionaries (must be done before making the cursor!)
         self._conn.row_factory = sqlite3.Row
         self._cursor = self._conn.cursor()
@@ -116,6 +109,82 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
             """
         )
 
+        # Add triggers to keep each board's `image_count` and `most_recent_image_name` up to date, so listing
+        # boards does not need to count and sort their images.
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_board_images_insert_board_stats
+            AFTER INSERT
+            ON board_images FOR EACH ROW
+            BEGIN
+                UPDATE boards
+                SET image_count = image_count + 1,
+                    most_recent_image_name = CASE
+                        WHEN (SELECT created_at FROM images WHERE image_name = new.image_name)
+                            >= COALESCE((SELECT created_at FROM images WHERE image_name = boards.most_recent_image_name), '')
+                        THEN new.image_name
+                        ELSE most_recent_image_name
+                    END
+                WHERE board_id = new.board_id;
+            END;
+            """
+        )
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_board_images_delete_board_stats
+            AFTER DELETE
+            ON board_images FOR EACH ROW
+            BEGIN
+                UPDATE boards
+                SET image_count = image_count - 1,
+                    most_recent_image_name = CASE
+                        WHEN most_recent_image_name = old.image_name THEN (
+                            SELECT images.image_name
+                            FROM board_images
+                            JOIN images ON images.image_name = board_images.image_name
+                            WHERE board_images.board_id = old.board_id
+                            ORDER BY images.created_at DESC
+                            LIMIT 1
+                        )
+                        ELSE most_recent_image_name
+                    END
+                WHERE board_id = old.board_id;
+            END;
+            """
+        )
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_board_images_move_board_stats
+            AFTER UPDATE OF board_id
+            ON board_images FOR EACH ROW WHEN old.board_id != new.board_id
+            BEGIN
+                UPDATE boards
+                SET image_count = image_count - 1,
+                    most_recent_image_name = CASE
+                        WHEN most_recent_image_name = old.image_name THEN (
+                            SELECT images.image_name
+                            FROM board_images
+                            JOIN images ON images.image_name = board_images.image_name
+                            WHERE board_images.board_id = old.board_id
+                            ORDER BY images.created_at DESC
+                            LIMIT 1
+                        )
+                        ELSE most_recent_image_name
+                    END
+                WHERE board_id = old.board_id;
+                UPDATE boards
+                SET image_count = image_count + 1,
+                    most_recent_image_name = CASE
+                        WHEN (SELECT created_at FROM images WHERE image_name = new.image_name)
+                            >= COALESCE((SELECT created_at FROM images WHERE image_name = boards.most_recent_image_name), '')
+                        THEN new.image_name
+                        ELSE most_recent_image_name
+                    END
+                WHERE board_id = new.board_id;
+            END;
+            """
+        )
+
         # Add trigger for `updated_at`.
         self._cursor.execute(
             """--sql
@@ -250,20 +319,3 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
             raise e
         finally:
             self._lock.release()
-
-    def get_image_count_for_board(self, board_id: str) -> int:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
-                """--sql
-                SELECT COUNT(*) FROM board_images WHERE board_id = ?;
-                """,
-                (board_id,),
-            )
-            count = cast(int, self._cursor.fetchone()[0])
-            return count
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
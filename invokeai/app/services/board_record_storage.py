@@ -5,6 +5,7 @@ from typing import Optional, Union, cast
 
 import sqlite3
 from invokeai.app.services.image_record_storage import OffsetPaginatedResults
+from invokeai.app.services.sqlite import TimedConnection
 from invokeai.app.services.models.board_record import (
     BoardRecord,
     deserialize_board_record,
@@ -97,7 +98,7 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
     def __init__(self, filename: str) -> None:
         super().__init__()
         self._filename = filename
-        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn = sqlite3.connect(filename, check_same_thread=False, factory=TimedConnection)
         # Enable row factory to get rows as dictionaries (must be done before making the cursor!)
         self._conn.row_factory = sqlite3.Row
         self._cursor = self._conn.cursor()
@@ -122,6 +123,10 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
                 board_id TEXT NOT NULL PRIMARY KEY,
                 board_name TEXT NOT NULL,
                 cover_image_name TEXT,
+                -- Maintained by triggers on `board_images`
+                image_count INTEGER NOT NULL DEFAULT 0,
+                -- Maintained by triggers on `board_images`
+                most_recent_image_name TEXT,
                 created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
                 -- Updated via trigger
                 updated_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
@@ -132,6 +137,22 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
             """
         )
 
+        self._cursor.execute("PRAGMA table_info(boards)")
+        columns = [column[1] for column in self._cursor.fetchall()]
+
+        if "image_count" not in columns:
+            self._cursor.execute(
+                """--sql
+                ALTER TABLE boards ADD COLUMN image_count INTEGER NOT NULL DEFAULT 0;
+                """
+            )
+            self._cursor.execute(
+                """--sql
+                ALTER TABLE boards ADD COLUMN most_recent_image_name TEXT;
+                """
+            )
+            self._backfill_board_image_stats()
+
         self._cursor.execute(
             """--sql
             CREATE INDEX IF NOT EXISTS idx_boards_created_at ON boards (created_at);
@@ -151,6 +172,34 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
             """
         )
 
+    def _backfill_board_image_stats(self) -> None:
+        """Computes the image count and most recent image of boards created before they were tracked."""
+
+        self._cursor.execute(
+            """--sql
+            SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'board_images';
+            """
+        )
+        if self._cursor.fetchone() is None:
+            return
+
+        self._cursor.execute(
+            """--sql
+            UPDATE boards
+            SET image_count = (
+                    SELECT COUNT(*) FROM board_images WHERE board_images.board_id = boards.board_id
+                ),
+                most_recent_image_name = (
+                    SELECT images.image_name
+                    FROM board_images
+                    JOIN images ON images.image_name = board_images.image_name
+                    WHERE board_images.board_id = boards.board_id
+                    ORDER BY images.created_at DESC
+                    LIMIT 1
+                );
+            """
+        )
+
     def delete(self, board_id: str) -> None:
         try:
             self._lock.acquire()
@@ -216,7 +265,7 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
             self._lock.release()
         if result is None:
             raise BoardRecordNotFoundException
-        return BoardRecord(**dict(result))
+        return deserialize_board_record(dict(result))
 
     def update(
         self,
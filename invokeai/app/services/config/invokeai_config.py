@@ -207,6 +207,9 @@ class InvokeAIAppConfig(InvokeAISettings):
     allow_credentials   : bool = Field(default=True, description="Allow CORS credentials", category='Web Server')
     allow_methods       : List[str] = Field(default=["*"], description="Methods allowed for CORS", category='Web Server')
     allow_headers       : List[str] = Field(default=["*"], description="Headers allowed for CORS", category='Web Server')
+    api_threads         : int = Field(default=8, gt=0, description="Maximum number of worker threads used to run blocking storage calls for API requests", category='Web Server')
+    event_queue_size    : int = Field(default=1000, gt=0, description="Maximum number of events waiting to be sent to clients. Progress events are dropped when it is full; other events wait", category='Web Server')
+    compact_events      : bool = Field(default=False, description="Send only ids, types and output references in invocation events. Clients fetch whole invocations from the session API.", category='Web Server')
 
     # FEATURES
     esrgan              : bool = Field(default=True, description="Enable/disable upscaling code", category='Features')
@@ -229,6 +232,24 @@ class InvokeAIAppConfig(InvokeAISettings):
     use_memory_db       : bool = Field(default=False, description='Use in-memory database for storing image metadata', category='Paths')
     from_file           : Path = Field(default=None, description='Take command input from the indicated file (command-line client only)', category='Paths')
 
+    # STORAGE
+    hard_delete_images  : bool = Field(default=False, description="Permanently delete images instead of moving them to the system trash", category="Storage")
+    image_cache_size    : float = Field(default=0.5, ge=0, description="Maximum memory amount (GB) used to cache decoded images for reuse between nodes", category="Storage")
+    image_write_threads : int = Field(default=2, ge=0, description="Number of background threads writing image files, so nodes don't wait on PNG encoding. 0 writes images synchronously", category="Storage")
+    png_compress_level  : int = Field(default=6, ge=0, le=9, description="Compression level of saved PNG images (0-9). Higher levels make smaller files but take longer to write", category="Storage")
+    intermediate_png_compress_level : int = Field(default=1, ge=0, le=9, description="Compression level of intermediate PNG images (0-9). Intermediates are rarely kept, so the default favors speed", category="Storage")
+    resized_image_cache_size : float = Field(default=1.0, ge=0, description="Maximum disk space (GB) used by resized copies of images, which are made on request", category="Storage")
+    intermediate_cache_size : float = Field(default=0.5, ge=0, description="Maximum memory amount (GB) used to hold intermediate images instead of writing them to disk. Requires image_write_threads > 0", category="Storage")
+    latents_cache_size : float = Field(default=0.5, ge=0, description="Maximum memory amount (GB) used to cache latents tensors passed between nodes", category="Storage")
+    conditioning_cache_size : float = Field(default=0.25, ge=0, description="Maximum memory amount (GB) used to cache prompt conditioning passed between nodes", category="Storage")
+    latents_device_cache_size : float = Field(default=0.125, ge=0, description="Maximum VRAM amount (GB) used to keep latents on the GPU between nodes", category="Storage")
+    delete_session_latents : bool = Field(default=True, description="Delete the latents and conditioning saved by a session shortly after it completes", category="Storage")
+    intermediate_image_ttl : int = Field(default=0, ge=0, description="Delete intermediate images this many seconds after they are created. 0 keeps them until they are cleared by hand", category="Storage")
+    reaper_deletes_per_second : int = Field(default=50, ge=1, description="Maximum number of files deleted per second when removing latents and intermediates in the background", category="Storage")
+    invocation_history : bool = Field(default=False, description="Keep a record of the time and memory used by every invocation, for percentile queries", category="Storage")
+    invocation_history_days : int = Field(default=30, ge=1, description="Delete invocation history records after this many days", category="Storage")
+    invocation_history_full_days : int = Field(default=7, ge=0, description="Keep every invocation history record for this many days, then one in ten", category="Storage")
+
     # LOGGING
     log_handlers        : List[str] = Field(default=["console"], description='Log handler. Valid options are "console", "file=<path>", "syslog=path|address:host:port", "http=<url>"', category="Logging")
     # note - would be better to read the log_format values from logging.py, but this creates circular dependencies issues
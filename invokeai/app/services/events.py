@@ -1,7 +1,7 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654)
 
 from typing import Any, Optional
-from invokeai.app.models.image import ProgressImage
+from invokeai.app.models.image import ProgressImage, ProgressImageSettings
 from invokeai.app.util.misc import get_timestamp
 from invokeai.app.services.model_manager_service import (
     BaseModelType,
@@ -11,16 +11,69 @@ from invokeai.app.services.model_manager_service import (
 )
 
 
+def compact_node(node: dict) -> dict:
+    """Keeps only what identifies an invocation. The rest can be fetched from its session."""
+    return dict(id=node["id"], type=node["type"])
+
+
+# Keys of the fields that reference what an invocation made or used, e.g. `ImageField` and `MainModelField`
+REFERENCE_KEYS = {"image_name", "latents_name", "conditioning_name", "model_name"}
+
+
+def compact_result(result: dict) -> dict:
+    """Keeps an output's type, numbers and references to what it made, like images and latents, but not its strings,
+    collections and other nested objects, like metadata, which may be large"""
+    return {
+        key: value
+        for key, value in result.items()
+        if key == "type"
+        or isinstance(value, (bool, int, float))
+        or value is None
+        or (isinstance(value, dict) and not REFERENCE_KEYS.isdisjoint(value.keys()))
+    }
+
+
 class EventServiceBase:
     session_event: str = "session_event"
+    # Whether invocation events carry only ids, types and output references rather than whole invocations and outputs
+    compact_payloads: bool = False
 
     """Basic event bus, to have an empty stand-in when not needed"""
 
     def dispatch(self, event_name: str, payload: Any) -> None:
         pass
 
+    def subscribe(
+        self,
+        graph_execution_state_id: str,
+        subscriber_id: str,
+        progress_image_settings: Optional[ProgressImageSettings] = None,
+    ) -> None:
+        """Subscribes a client to a session, with how it wants the session's progress images"""
+        pass
+
+    def unsubscribe(self, graph_execution_state_id: str, subscriber_id: str) -> None:
+        pass
+
+    def unsubscribe_all(self, subscriber_id: str) -> None:
+        """Unsubscribes a client from all sessions, e.g. when it disconnects"""
+        pass
+
+    def has_subscribers(self, graph_execution_state_id: str) -> bool:
+        """Checks whether anyone receives the events of a session"""
+        return False
+
+    def get_progress_image_settings(self, graph_execution_state_id: str, step: int) -> list[ProgressImageSettings]:
+        """Gets the settings of the clients that want a progress image for a step of a session; empty if none do"""
+        return []
+
     def __emit_session_event(self, event_name: str, payload: dict) -> None:
         payload["timestamp"] = get_timestamp()
+        if self.compact_payloads:
+            if "node" in payload:
+                payload["node"] = compact_node(payload["node"])
+            if "result" in payload:
+                payload["result"] = compact_result(payload["result"])
         self.dispatch(
             event_name=EventServiceBase.session_event,
             payload=dict(event=event_name, data=payload),
@@ -1,15 +1,31 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654) and the InvokeAI Team
 import json
+import os
+import shutil
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from logging import Logger
 from pathlib import Path
 from queue import Queue
-from typing import Dict, Optional, Union
+from threading import Lock, RLock, Thread
+from typing import Literal, NamedTuple, Optional, Union
 
 from PIL import Image, PngImagePlugin
 from PIL.Image import Image as PILImageType
+from pydantic import BaseModel, Field
 from send2trash import send2trash
 
-from invokeai.app.util.thumbnails import get_thumbnail_name, make_thumbnail
+from invokeai.app.util.metrics import Histogram
+from invokeai.app.util.sharding import get_sharded_path, has_unsharded_files
+from invokeai.app.util.thumbnails import get_thumbnail_name, make_thumbnail, resize_to_fit
+from invokeai.backend.util.logging import InvokeAILogger
+
+
+IMAGE_ENCODE_SECONDS = Histogram(
+    "invokeai_image_encode_seconds", "Time spent encoding images and thumbnails when saving them", ["kind"]
+)
 
 
 # TODO: Should these excpetions subclass existing python exceptions?
@@ -34,6 +50,52 @@ class ImageFileDeleteException(Exception):
         super().__init__(message)
 
 
+# Bytes per band for modes that don't store 8-bit bands
+MODE_BYTES_PER_BAND = {"I": 4, "F": 4, "I;16": 2, "I;16B": 2, "I;16L": 2, "I;16N": 2}
+
+GIG = 1073741824
+DEFAULT_MAX_CACHE_SIZE = 0.5  # GB
+DEFAULT_WRITE_THREADS = 2
+DEFAULT_COMPRESS_LEVEL = 6  # Pillow's default
+DEFAULT_INTERMEDIATE_COMPRESS_LEVEL = 1
+DEFAULT_MAX_RESIZED_SIZE = 1.0  # GB
+DEFAULT_MAX_INTERMEDIATE_CACHE_SIZE = 0.5  # GB
+
+ResizedImageFormat = Literal["webp", "png", "jpeg"]
+# The PIL format and media type of each format resized images can be served in
+RESIZED_IMAGE_FORMATS: dict[str, tuple[str, str]] = {
+    "webp": ("WEBP", "image/webp"),
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def get_image_size_in_bytes(image: PILImageType) -> int:
+    """Gets the size of an image's decoded pixel data."""
+    return image.width * image.height * len(image.getbands()) * MODE_BYTES_PER_BAND.get(image.mode, 1)
+
+
+class ImageFileCacheStats(BaseModel):
+    """Statistics for the decoded image cache."""
+
+    hits: int = Field(default=0, description="The number of image reads served from the cache")
+    misses: int = Field(default=0, description="The number of image reads that decoded a file")
+    count: int = Field(default=0, description="The number of images in the cache")
+    size: int = Field(default=0, description="The size of the cached images, in bytes")
+    max_size: int = Field(default=0, description="The maximum size of the cached images, in bytes")
+
+
+class ImageWrite(NamedTuple):
+    """An image whose files have yet to be written, and how to write them."""
+
+    image: PILImageType
+    image_path: Path
+    thumbnail_path: Path
+    pnginfo: PngImagePlugin.PngInfo
+    compress_level: int
+    thumbnail_size: int
+
+
 class ImageFileStorageBase(ABC):
     """Low-level service responsible for storing and retrieving image files."""
 
@@ -47,6 +109,11 @@ class ImageFileStorageBase(ABC):
         """Gets the internal path to an image or thumbnail."""
         pass
 
+    @abstractmethod
+    def get_resized_path(self, image_name: str, size: int, image_format: ResizedImageFormat = "webp") -> Path:
+        """Gets the path to a copy of an image that fits within a `size`x`size` square, making it if needed."""
+        pass
+
     # TODO: We need to validate paths before starlette makes the FileResponse, else we get a
     # 500 internal server error. I don't like having this method on the service.
     @abstractmethod
@@ -62,8 +129,10 @@ class ImageFileStorageBase(ABC):
         metadata: Optional[dict] = None,
         workflow: Optional[str] = None,
         thumbnail_size: int = 256,
+        is_intermediate: bool = False,
     ) -> None:
-        """Saves an image and a 256x256 WEBP thumbnail. Returns a tuple of the image name, thumbnail name, and created timestamp."""
+        """Saves an image and a 256x256 WEBP thumbnail. The files may be written in the background; the image
+        must not be modified after it is saved. Intermediate images may be saved with faster, weaker compression."""
         pass
 
     @abstractmethod
@@ -71,35 +140,145 @@ class ImageFileStorageBase(ABC):
         """Deletes an image and its thumbnail (if one exists)."""
         pass
 
+    @abstractmethod
+    def delete_many(self, image_names: list[str]) -> None:
+        """Deletes many images and their thumbnails. The files may be removed in the background."""
+        pass
+
+    @abstractmethod
+    def get_cache_stats(self) -> ImageFileCacheStats:
+        """Gets statistics for the decoded image cache."""
+        pass
+
+    def persist(self, image_name: str) -> None:
+        """Starts writing an image's files, if they are being held in memory. Called when an intermediate is kept."""
+        pass
+
+    def stop(self) -> None:
+        """Finishes any pending background work. Called on shutdown."""
+        pass
+
 
 class DiskImageFileStorage(ImageFileStorageBase):
     """Stores images on disk"""
 
     __output_folder: Path
-    __cache_ids: Queue  # TODO: this is an incredibly naive cache
-    __cache: Dict[Path, PILImageType]
-    __max_cache_size: int
-
-    def __init__(self, output_folder: Union[str, Path]):
-        self.__cache = dict()
-        self.__cache_ids = Queue()
-        self.__max_cache_size = 10  # TODO: get this from config
+    # Whether some files are still in the flat layout used before images were sharded
+    __has_unsharded_files: bool
+    # Fully decoded images, least recently used first
+    __cache: OrderedDict[Path, PILImageType]
+    __cache_lock: Lock
+    __cache_size: int
+    __max_cache_size: int  # bytes
+    __cache_hits: int
+    __cache_misses: int
+    __hard_delete: bool
+    __delete_queue: Queue
+    __delete_thread: Thread
+    # Images whose files are not written yet, by image and thumbnail path. Intermediates are held in memory without
+    # a future until they are needed on disk; the rest are already being written.
+    __pending_writes: dict[Path, tuple[ImageWrite, Optional[Future]]]
+    __pending_lock: RLock
+    # Intermediates held in memory, oldest first
+    __deferred_writes: OrderedDict[Path, ImageWrite]
+    __deferred_size: int
+    __max_deferred_size: int  # bytes
+    __write_executor: Optional[ThreadPoolExecutor]
+    __logger: Logger
+    __compress_level: int
+    __intermediate_compress_level: int
+    # Resized copies of images on disk and their sizes in bytes, least recently used first
+    __resized: OrderedDict[Path, int]
+    __resized_lock: Lock
+    __resized_size: int
+    __max_resized_size: int  # bytes
+
+    def __init__(
+        self,
+        output_folder: Union[str, Path],
+        hard_delete: bool = False,
+        max_cache_size: float = DEFAULT_MAX_CACHE_SIZE,
+        write_threads: int = DEFAULT_WRITE_THREADS,
+        compress_level: int = DEFAULT_COMPRESS_LEVEL,
+        intermediate_compress_level: int = DEFAULT_INTERMEDIATE_COMPRESS_LEVEL,
+        max_resized_size: float = DEFAULT_MAX_RESIZED_SIZE,
+        max_intermediate_cache_size: float = DEFAULT_MAX_INTERMEDIATE_CACHE_SIZE,
+    ):
+        """
+        :param output_folder: The folder to store images and thumbnails in
+        :param hard_delete: Permanently delete files instead of moving them to the system trash
+        :param max_cache_size: Maximum size of the decoded image cache, in GB
+        :param write_threads: Number of threads encoding and writing files in the background, or 0 to write on save
+        :param compress_level: The zlib compression level (0-9) of PNG images
+        :param intermediate_compress_level: The zlib compression level (0-9) of intermediate PNG images
+        :param max_resized_size: Maximum disk space used by resized copies of images, in GB
+        :param max_intermediate_cache_size: Maximum size of the intermediate images held in memory instead of being
+            written, in GB. Requires background writes.
+        """
+        self.__cache = OrderedDict()
+        self.__cache_lock = Lock()
+        self.__cache_size = 0
+        self.__max_cache_size = int(max_cache_size * GIG)
+        self.__cache_hits = 0
+        self.__cache_misses = 0
+        self.__hard_delete = hard_delete
+        self.__compress_level = compress_level
+        self.__intermediate_compress_level = intermediate_compress_level
 
         self.__output_folder: Path = output_folder if isinstance(output_folder, Path) else Path(output_folder)
         self.__thumbnails_folder = self.__output_folder / "thumbnails"
+        self.__resized_folder = self.__output_folder / "resized"
 
         # Validate required output folders at launch
         self.__validate_storage_folders()
 
+        self.__has_unsharded_files = has_unsharded_files(self.__output_folder) or has_unsharded_files(
+            self.__thumbnails_folder
+        )
+        if self.__has_unsharded_files:
+            InvokeAILogger.getLogger().warning(
+                f"Images in {self.__output_folder} use the old flat folder layout, which is slow for large galleries."
+                " Run scripts/migrate-output-layout.py while InvokeAI is stopped to move them into subfolders."
+            )
+
+        self.__resized_lock = Lock()
+        self.__max_resized_size = int(max_resized_size * GIG)
+        self.__load_resized()
+
+        # Bulk deletes hand their files to this thread, so the caller does not wait on the filesystem
+        self.__delete_queue = Queue()
+        self.__delete_thread = Thread(name="image_file_deleter", target=self.__process_deletes, daemon=True)
+        self.__delete_thread.start()
+
+        # Saved images are served from memory until their files are written
+        self.__pending_writes = dict()
+        # Reentrant, since a write's done callback may run in the thread that submits it
+        self.__pending_lock = RLock()
+        self.__deferred_writes = OrderedDict()
+        self.__deferred_size = 0
+        self.__max_deferred_size = int(max_intermediate_cache_size * GIG)
+        self.__write_executor = (
+            ThreadPoolExecutor(max_workers=write_threads, thread_name_prefix="image_file_writer")
+            if write_threads > 0
+            else None
+        )
+        self.__logger = InvokeAILogger.getLogger()
+
     def get(self, image_name: str) -> PILImageType:
         try:
             image_path = self.get_path(image_name)
 
+            pending_image = self.__get_pending_image(image_path)
+            if pending_image is not None:
+                return pending_image
+
             cache_item = self.__get_cache(image_path)
             if cache_item:
                 return cache_item
 
             image = Image.open(image_path)
+            # Decode now, so the cache holds pixel data and not an open file handle
+            image.load()
             self.__set_cache(image_path, image)
             return image
         except FileNotFoundError as e:
@@ -112,10 +291,13 @@ class DiskImageFileStorage(ImageFileStorageBase):
         metadata: Optional[dict] = None,
         workflow: Optional[str] = None,
         thumbnail_size: int = 256,
+        is_intermediate: bool = False,
     ) -> None:
         try:
-            self.__validate_storage_folders()
             image_path = self.get_path(image_name)
+            thumbnail_path = self.get_path(image_name, thumbnail=True)
+            for folder in (image_path.parent, thumbnail_path.parent):
+                folder.mkdir(parents=True, exist_ok=True)
 
             pnginfo = PngImagePlugin.PngInfo()
 
@@ -134,66 +316,276 @@ class DiskImageFileStorage(ImageFileStorageBase):
                 if original_workflow is not None:
                     pnginfo.add_text("invokeai_workflow", original_workflow)
 
-            image.save(image_path, "PNG", pnginfo=pnginfo)
+            # Intermediates are rarely read back, so they favor encoding speed over file size
+            compress_level = self.__intermediate_compress_level if is_intermediate else self.__compress_level
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, thumbnail=True)
-            thumbnail_image = make_thumbnail(image, thumbnail_size)
-            thumbnail_image.save(thumbnail_path)
+            write = ImageWrite(image, image_path, thumbnail_path, pnginfo, compress_level, thumbnail_size)
 
-            self.__set_cache(image_path, image)
-            self.__set_cache(thumbnail_path, thumbnail_image)
+            if self.__write_executor is None:
+                self.__write(write)
+                return
+
+            with self.__pending_lock:
+                if is_intermediate and self.__max_deferred_size > 0:
+                    self.__defer_write(write)
+                else:
+                    self.__submit_write(write)
         except Exception as e:
             raise ImageFileSaveException from e
 
     def delete(self, image_name: str) -> None:
         try:
-            image_path = self.get_path(image_name)
+            for path in self.__evict(image_name):
+                if path.exists():
+                    self.__remove_file(path)
+        except Exception as e:
+            raise ImageFileDeleteException from e
 
-            if image_path.exists():
-                send2trash(image_path)
-            if image_path in self.__cache:
-                del self.__cache[image_path]
+    def delete_many(self, image_names: list[str]) -> None:
+        paths: list[Path] = []
+        for image_name in image_names:
+            paths.extend(self.__evict(image_name))
+        self.__delete_queue.put(paths)
+
+    def get_resized_path(self, image_name: str, size: int, image_format: ResizedImageFormat = "webp") -> Path:
+        path = self.__get_resized_folder(image_name) / f"{size}.{image_format}"
+        with self.__resized_lock:
+            if path in self.__resized:
+                self.__resized.move_to_end(path)
+                return path
+
+        resized_image = resize_to_fit(self.get(image_name), size)
+        if image_format == "jpeg" and resized_image.mode not in ("RGB", "L"):
+            resized_image = resized_image.convert("RGB")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.tmp")
+        resized_image.save(temp_path, RESIZED_IMAGE_FORMATS[image_format][0])
+        os.replace(temp_path, path)
+
+        evicted: list[Path] = []
+        with self.__resized_lock:
+            self.__add_resized(path, path.stat().st_size)
+            # The newest copy is kept even if it alone is over budget, so it can be served
+            while self.__resized_size > self.__max_resized_size and len(self.__resized) > 1:
+                evicted_path, evicted_size = self.__resized.popitem(last=False)
+                self.__resized_size -= evicted_size
+                evicted.append(evicted_path)
+        for evicted_path in evicted:
+            evicted_path.unlink(missing_ok=True)
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, True)
+        return path
 
-            if thumbnail_path.exists():
-                send2trash(thumbnail_path)
-            if thumbnail_path in self.__cache:
-                del self.__cache[thumbnail_path]
-        except Exception as e:
-            raise ImageFileDeleteException from e
+    def get_cache_stats(self) -> ImageFileCacheStats:
+        with self.__cache_lock:
+            return ImageFileCacheStats(
+                hits=self.__cache_hits,
+                misses=self.__cache_misses,
+                count=len(self.__cache),
+                size=self.__cache_size,
+                max_size=self.__max_cache_size,
+            )
+
+    def persist(self, image_name: str) -> None:
+        self.__flush(self.get_path(image_name))
+
+    def stop(self) -> None:
+        # Write out every saved image before exiting
+        if self.__write_executor is not None:
+            with self.__pending_lock:
+                for write in list(self.__deferred_writes.values()):
+                    self.__submit_write(write)
+            self.__write_executor.shutdown(wait=True)
+        self.__delete_queue.put(None)
+        self.__delete_thread.join()
 
     # TODO: make this a bit more flexible for e.g. cloud storage
     def get_path(self, image_name: str, thumbnail: bool = False) -> Path:
-        path = self.__output_folder / image_name
+        folder = self.__output_folder
+        file_name = image_name
 
         if thumbnail:
-            thumbnail_name = get_thumbnail_name(image_name)
-            path = self.__thumbnails_folder / thumbnail_name
+            folder = self.__thumbnails_folder
+            file_name = get_thumbnail_name(image_name)
+
+        path = get_sharded_path(folder, file_name)
+
+        # Files that have not been migrated are found where they were saved
+        if self.__has_unsharded_files and not path.exists() and (folder / file_name).exists():
+            return folder / file_name
 
         return path
 
     def validate_path(self, path: Union[str, Path]) -> bool:
         """Validates the path given for an image or thumbnail."""
         path = path if isinstance(path, Path) else Path(path)
+        self.__wait_for_write(path)
         return path.exists()
 
     def __validate_storage_folders(self) -> None:
         """Checks if the required output folders exist and create them if they don't"""
-        folders: list[Path] = [self.__output_folder, self.__thumbnails_folder]
+        folders: list[Path] = [self.__output_folder, self.__thumbnails_folder, self.__resized_folder]
         for folder in folders:
             folder.mkdir(parents=True, exist_ok=True)
 
+    def __evict(self, image_name: str) -> list[Path]:
+        """Drops an image, its thumbnail and its resized copies from the caches, returning their paths."""
+        image_path = self.get_path(image_name)
+        thumbnail_path = self.get_path(image_name, thumbnail=True)
+        # A write that has not started is abandoned; one in progress is finished, so its files can be removed
+        with self.__pending_lock:
+            pending = self.__pending_writes.get(image_path)
+            if pending is not None and pending[1] is None:
+                # An intermediate that was never needed on disk
+                self.__pending_writes.pop(image_path, None)
+                self.__pending_writes.pop(thumbnail_path, None)
+                self.__deferred_size -= get_image_size_in_bytes(self.__deferred_writes.pop(image_path).image)
+                pending = None
+        if pending is not None and not pending[1].cancel():
+            wait([pending[1]])
+        with self.__cache_lock:
+            for path in (image_path, thumbnail_path):
+                if path in self.__cache:
+                    self.__cache_size -= get_image_size_in_bytes(self.__cache.pop(path))
+        return [image_path, thumbnail_path] + self.__evict_resized(image_name)
+
+    def __load_resized(self) -> None:
+        """Indexes the resized copies of images made in previous sessions, oldest first."""
+        self.__resized = OrderedDict()
+        self.__resized_size = 0
+        for path in self.__resized_folder.glob("*/*/*.tmp"):
+            path.unlink(missing_ok=True)
+        stats = [(path, path.stat()) for path in self.__resized_folder.glob("*/*/*")]
+        for path, stat in sorted(stats, key=lambda item: item[1].st_mtime):
+            self.__add_resized(path, stat.st_size)
+
+    def __get_resized_folder(self, image_name: str) -> Path:
+        """Gets the folder an image's resized copies are stored in."""
+        return get_sharded_path(self.__resized_folder, Path(image_name).stem)
+
+    def __add_resized(self, path: Path, size: int) -> None:
+        self.__resized_size += size - self.__resized.pop(path, 0)
+        self.__resized[path] = size
+
+    def __evict_resized(self, image_name: str) -> list[Path]:
+        """Drops an image's resized copies from the index, returning the path of their folder."""
+        folder = self.__get_resized_folder(image_name)
+        if not folder.exists():
+            return []
+        with self.__resized_lock:
+            for path in folder.iterdir():
+                self.__resized_size -= self.__resized.pop(path, 0)
+        return [folder]
+
+    def __write(self, write: ImageWrite) -> None:
+        # Write to a temporary file and move it into place, so a crash never leaves a partial image behind
+        temp_path = write.image_path.with_name(f"{write.image_path.name}.tmp")
+        with open(temp_path, "wb") as file:
+            start = time.perf_counter()
+            write.image.save(file, "PNG", pnginfo=write.pnginfo, compress_level=write.compress_level)
+            IMAGE_ENCODE_SECONDS.observe(time.perf_counter() - start, "image")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, write.image_path)
+
+        thumbnail_image = make_thumbnail(write.image, write.thumbnail_size)
+        start = time.perf_counter()
+        thumbnail_image.save(write.thumbnail_path)
+        IMAGE_ENCODE_SECONDS.observe(time.perf_counter() - start, "thumbnail")
+
+        self.__set_cache(write.image_path, write.image)
+        self.__set_cache(write.thumbnail_path, thumbnail_image)
+
+    def __submit_write(self, write: ImageWrite) -> Future:
+        """Starts writing an image's files in the background. Must be called with the pending lock held."""
+        deferred_write = self.__deferred_writes.pop(write.image_path, None)
+        if deferred_write is not None:
+            self.__deferred_size -= get_image_size_in_bytes(deferred_write.image)
+
+        assert self.__write_executor is not None
+        future = self.__write_executor.submit(self.__write, write)
+        self.__pending_writes[write.image_path] = (write, future)
+        self.__pending_writes[write.thumbnail_path] = (write, future)
+        future.add_done_callback(lambda f: self.__finish_write(write.image_path, write.thumbnail_path, f))
+        return future
+
+    def __defer_write(self, write: ImageWrite) -> None:
+        """Holds an intermediate image in memory without writing it. Must be called with the pending lock held."""
+        self.__pending_writes[write.image_path] = (write, None)
+        self.__pending_writes[write.thumbnail_path] = (write, None)
+        self.__deferred_writes[write.image_path] = write
+        self.__deferred_size += get_image_size_in_bytes(write.image)
+        # Over budget, the oldest intermediates are written out
+        while self.__deferred_size > self.__max_deferred_size and self.__deferred_writes:
+            self.__submit_write(next(iter(self.__deferred_writes.values())))
+
+    def __flush(self, path: Path) -> Optional[Future]:
+        """Gets the write of an image's files, starting it if the image is held in memory."""
+        with self.__pending_lock:
+            pending = self.__pending_writes.get(path)
+            if pending is None:
+                return None
+            write, future = pending
+            return future if future is not None else self.__submit_write(write)
+
+    def __finish_write(self, image_path: Path, thumbnail_path: Path, future: Future) -> None:
+        with self.__pending_lock:
+            self.__pending_writes.pop(image_path, None)
+            self.__pending_writes.pop(thumbnail_path, None)
+        if not future.cancelled() and future.exception() is not None:
+            self.__logger.error(f"Failed to write image file {image_path}: {future.exception()}")
+
+    def __get_pending_image(self, path: Path) -> Optional[PILImageType]:
+        with self.__pending_lock:
+            pending = self.__pending_writes.get(path)
+        return None if pending is None else pending[0].image
+
+    def __wait_for_write(self, path: Path) -> None:
+        future = self.__flush(path)
+        if future is not None:
+            wait([future])
+
+    def __remove_file(self, path: Path) -> None:
+        if path.parent.parent == self.__resized_folder:
+            # Resized copies can always be made again, so they skip the trash
+            shutil.rmtree(path, ignore_errors=True)
+        elif self.__hard_delete:
+            path.unlink(missing_ok=True)
+        else:
+            send2trash(path)
+
+    def __process_deletes(self) -> None:
+        while True:
+            paths: Optional[list[Path]] = self.__delete_queue.get()
+            if paths is None:  # Stopping
+                break
+            for path in paths:
+                try:
+                    if path.exists():
+                        self.__remove_file(path)
+                except Exception:
+                    # The records are already gone; a file we fail to remove is orphaned, not fatal
+                    pass
+
     def __get_cache(self, image_name: Path) -> Optional[PILImageType]:
-        return None if image_name not in self.__cache else self.__cache[image_name]
+        with self.__cache_lock:
+            image = self.__cache.get(image_name)
+            if image is None:
+                self.__cache_misses += 1
+                return None
+            self.__cache_hits += 1
+            self.__cache.move_to_end(image_name)
+            return image
 
     def __set_cache(self, image_name: Path, image: PILImageType):
-        if image_name not in self.__cache:
+        size = get_image_size_in_bytes(image)
+        if size > self.__max_cache_size:
+            return
+        with self.__cache_lock:
+            if image_name in self.__cache:
+                self.__cache_size -= get_image_size_in_bytes(self.__cache.pop(image_name))
             self.__cache[image_name] = image
-            self.__cache_ids.put(image_name)  # TODO: this should refresh position for LRU cache
-            if len(self.__cache) > self.__max_cache_size:
-                cache_id = self.__cache_ids.get()
-                if cache_id in self.__cache:
-                    del self.__cache[cache_id]
+            self.__cache_size += size
+            while self.__cache_size > self.__max_cache_size:
+                _, evicted = self.__cache.popitem(last=False)
+                self.__cache_size -= get_image_size_in_bytes(evicted)
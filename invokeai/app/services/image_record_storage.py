@@ -1,9 +1,10 @@
+import hashlib
 import json
 import sqlite3
 import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Generic, Optional, TypeVar, cast
+from typing import Generic, Iterator, Optional, TypeVar, cast
 
 from pydantic import BaseModel, Field
 from pydantic.generics import GenericModel
@@ -14,6 +15,7 @@ from invokeai.app.services.models.image_record import (
     ImageRecordChanges,
     deserialize_image_record,
 )
+from invokeai.app.services.sqlite import TimedConnection
 
 T = TypeVar("T", bound=BaseModel)
 
@@ -74,6 +76,33 @@ IMAGE_DTO_COLS = ", ".join(
 )
 
 
+# Core metadata fields exposed as generated columns on `images`, so the gallery can be filtered by them
+# through an index instead of parsing every row's metadata. {column: (type, json path)}
+METADATA_COLUMNS = {
+    "model_name": ("TEXT", "$.model.model_name"),
+    "base_model": ("TEXT", "$.model.base_model"),
+    "seed": ("INTEGER", "$.seed"),
+    "scheduler": ("TEXT", "$.scheduler"),
+    "generation_mode": ("TEXT", "$.generation_mode"),
+}
+
+
+def to_fts_query(text: str) -> str:
+    """Converts free text into an FTS5 query matching all of its words, escaping FTS5 syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+# Bulk queries bind one parameter per image name. Stay well under SQLITE_MAX_VARIABLE_NUMBER, which
+# is only 999 on older sqlite builds.
+BULK_QUERY_BATCH_SIZE = 500
+
+
+def batched(image_names: list[str], batch_size: int = BULK_QUERY_BATCH_SIZE) -> Iterator[list[str]]:
+    """Splits a list of image names into batches small enough to bind in a single query."""
+    for i in range(0, len(image_names), batch_size):
+        yield image_names[i : i + batch_size]
+
+
 class ImageRecordStorageBase(ABC):
     """Low-level service responsible for interfacing with the image record store."""
 
@@ -89,6 +118,11 @@ class ImageRecordStorageBase(ABC):
         """Gets an image's metadata'."""
         pass
 
+    @abstractmethod
+    def get_workflow(self, image_name: str) -> Optional[str]:
+        """Gets an image's workflow."""
+        pass
+
     @abstractmethod
     def update(
         self,
@@ -98,6 +132,16 @@ class ImageRecordStorageBase(ABC):
         """Updates an image record."""
         pass
 
+    @abstractmethod
+    def update_many(
+        self,
+        image_names: list[str],
+        changes: ImageRecordChanges,
+    ) -> list[str]:
+        """Applies the same changes to many image records in a single transaction, returning the names of the updated
+        records."""
+        pass
+
     @abstractmethod
     def get_many(
         self,
@@ -107,8 +151,12 @@ class ImageRecordStorageBase(ABC):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        scheduler: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> OffsetPaginatedResults[ImageRecord]:
-        """Gets a page of image records."""
+        """Gets a page of image records, optionally filtered by generation metadata."""
         pass
 
     # TODO: The database has a nullable `deleted_at` column, currently unused.
@@ -119,13 +167,17 @@ class ImageRecordStorageBase(ABC):
         pass
 
     @abstractmethod
-    def delete_many(self, image_names: list[str]) -> None:
-        """Deletes many image records."""
+    def delete_many(self, image_names: list[str]) -> list[str]:
+        """Deletes many image records in a single transaction, returning the names of the deleted records."""
         pass
 
     @abstractmethod
-    def delete_intermediates(self) -> list[str]:
-        """Deletes all intermediate image records, returning a list of deleted image names."""
+    def delete_intermediates(self, older_than: Optional[int] = None, limit: Optional[int] = None) -> list[str]:
+        """Deletes intermediate image records, returning a list of deleted image names.
+
+        If `older_than` is given, only records created more than that many seconds ago are deleted. If `limit` is
+        given, at most that many records are deleted, oldest first.
+        """
         pass
 
     @abstractmethod
@@ -141,13 +193,24 @@ class ImageRecordStorageBase(ABC):
         metadata: Optional[dict],
         is_intermediate: bool = False,
         starred: bool = False,
+        workflow: Optional[str] = None,
+        content_hash: Optional[str] = None,
     ) -> datetime:
-        """Saves an image record."""
+        """Saves an image record. Identical workflows are stored once and shared between images."""
         pass
 
     @abstractmethod
-    def get_most_recent_image_for_board(self, board_id: str) -> Optional[ImageRecord]:
-        """Gets the most recent image for a board."""
+    def get_by_content_hash(
+        self,
+        content_hash: str,
+        image_category: ImageCategory,
+        is_intermediate: bool,
+        board_id: Optional[str],
+    ) -> Optional[ImageRecord]:
+        """Gets an image made from the same content, with the same category, intermediate flag and board.
+
+        A reused intermediate image's `created_at` is reset, so that it is not deleted as expired right away.
+        """
         pass
 
 
@@ -156,11 +219,13 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
     _lock: threading.Lock
+    _has_fts: bool
 
     def __init__(self, filename: str) -> None:
         super().__init__()
         self._filename = filename
-        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._has_fts = False
+        self._conn = sqlite3.connect(filename, check_same_thread=False, factory=TimedConnection)
         # Enable row factory to get rows as dictionaries (must be done before making the cursor!)
         self._conn.row_factory = sqlite3.Row
         self._cursor = self._conn.cursor()
@@ -202,6 +267,18 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             """
         )
 
+        # Create the `workflows` table. Workflows are content-addressed, so every image made with the same
+        # workflow references a single copy.
+        self._cursor.execute(
+            """--sql
+            CREATE TABLE IF NOT EXISTS workflows (
+                workflow_hash TEXT NOT NULL PRIMARY KEY,
+                workflow TEXT NOT NULL,
+                created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+            );
+            """
+        )
+
         self._cursor.execute("PRAGMA table_info(images)")
         columns = [column[1] for column in self._cursor.fetchall()]
 
@@ -212,6 +289,33 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                 """
             )
 
+        if "workflow_hash" not in columns:
+            self._cursor.execute(
+                """--sql
+                ALTER TABLE images ADD COLUMN workflow_hash TEXT;
+                """
+            )
+
+        if "content_hash" not in columns:
+            self._cursor.execute(
+                """--sql
+                ALTER TABLE images ADD COLUMN content_hash TEXT;
+                """
+            )
+
+        # Generated columns are hidden from `table_info`
+        self._cursor.execute("PRAGMA table_xinfo(images)")
+        columns = [column[1] for column in self._cursor.fetchall()]
+
+        for column, (column_type, json_path) in METADATA_COLUMNS.items():
+            if column not in columns:
+                self._cursor.execute(
+                    f"""--sql
+                    ALTER TABLE images ADD COLUMN {column} {column_type}
+                        GENERATED ALWAYS AS (json_extract(metadata, '{json_path}')) VIRTUAL;
+                    """
+                )
+
         # Create the `images` table indices.
         self._cursor.execute(
             """--sql
@@ -240,6 +344,27 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             """
         )
 
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_images_workflow_hash ON images(workflow_hash);
+            """
+        )
+
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_images_content_hash ON images(content_hash);
+            """
+        )
+
+        for column in METADATA_COLUMNS:
+            self._cursor.execute(
+                f"""--sql
+                CREATE INDEX IF NOT EXISTS idx_images_{column} ON images({column});
+                """
+            )
+
+        self._create_prompt_index()
+
         # Add trigger for `updated_at`.
         self._cursor.execute(
             """--sql
@@ -253,6 +378,86 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
             """
         )
 
+        # Add trigger to delete workflows once no image references them.
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_images_workflow_delete
+            AFTER DELETE
+            ON images FOR EACH ROW WHEN old.workflow_hash IS NOT NULL
+            BEGIN
+                DELETE FROM workflows
+                WHERE workflow_hash = old.workflow_hash
+                    AND NOT EXISTS (SELECT 1 FROM images WHERE workflow_hash = old.workflow_hash);
+            END;
+            """
+        )
+
+    def _create_prompt_index(self) -> None:
+        """Creates the `images_fts` full-text index of prompts, kept in sync with `images` by triggers."""
+
+        self._cursor.execute(
+            """--sql
+            SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'images_fts';
+            """
+        )
+        exists = self._cursor.fetchone() is not None
+
+        try:
+            # FTS rows share the rowid of their image, so triggers can find them without a scan
+            self._cursor.execute(
+                """--sql
+                CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+                    positive_prompt,
+                    negative_prompt
+                );
+                """
+            )
+        except sqlite3.OperationalError:
+            # sqlite was built without FTS5; prompt searches fall back to a scan
+            return
+
+        self._has_fts = True
+
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_images_fts_insert
+            AFTER INSERT
+            ON images FOR EACH ROW WHEN new.metadata IS NOT NULL
+            BEGIN
+                INSERT INTO images_fts (rowid, positive_prompt, negative_prompt)
+                VALUES (
+                    new.rowid,
+                    json_extract(new.metadata, '$.positive_prompt'),
+                    json_extract(new.metadata, '$.negative_prompt')
+                );
+            END;
+            """
+        )
+        self._cursor.execute(
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_images_fts_delete
+            AFTER DELETE
+            ON images FOR EACH ROW WHEN old.metadata IS NOT NULL
+            BEGIN
+                DELETE FROM images_fts WHERE rowid = old.rowid;
+            END;
+            """
+        )
+
+        if not exists:
+            # Index the prompts of images saved before the index existed
+            self._cursor.execute(
+                """--sql
+                INSERT INTO images_fts (rowid, positive_prompt, negative_prompt)
+                SELECT
+                    rowid,
+                    json_extract(metadata, '$.positive_prompt'),
+                    json_extract(metadata, '$.negative_prompt')
+                FROM images
+                WHERE metadata IS NOT NULL;
+                """
+            )
+
     def get(self, image_name: str) -> Optional[ImageRecord]:
         try:
             self._lock.acquire()
@@ -299,6 +504,29 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         finally:
             self._lock.release()
 
+    def get_workflow(self, image_name: str) -> Optional[str]:
+        try:
+            self._lock.acquire()
+
+            self._cursor.execute(
+                """--sql
+                SELECT workflows.workflow FROM images
+                JOIN workflows ON images.workflow_hash = workflows.workflow_hash
+                WHERE images.image_name = ?;
+                """,
+                (image_name,),
+            )
+
+            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+            if not result:
+                return None
+            return result[0]
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            raise ImageRecordNotFoundException from e
+        finally:
+            self._lock.release()
+
     def update(
         self,
         image_name: str,
@@ -357,6 +585,57 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         finally:
             self._lock.release()
 
+    def update_many(
+        self,
+        image_names: list[str],
+        changes: ImageRecordChanges,
+    ) -> list[str]:
+        assignments: list[str] = []
+        values: list = []
+        if changes.image_category is not None:
+            assignments.append("image_category = ?")
+            values.append(changes.image_category)
+        if changes.session_id is not None:
+            assignments.append("session_id = ?")
+            values.append(changes.session_id)
+        if changes.is_intermediate is not None:
+            assignments.append("is_intermediate = ?")
+            values.append(changes.is_intermediate)
+        if changes.starred is not None:
+            assignments.append("starred = ?")
+            values.append(changes.starred)
+
+        try:
+            self._lock.acquire()
+            updated_image_names: list[str] = []
+            for batch in batched(image_names):
+                placeholders = ",".join("?" for _ in batch)
+                self._cursor.execute(
+                    f"""--sql
+                    SELECT image_name FROM images
+                    WHERE image_name IN ({placeholders});
+                    """,
+                    batch,
+                )
+                result = cast(list[sqlite3.Row], self._cursor.fetchall())
+                updated_image_names.extend(map(lambda r: r[0], result))
+                if assignments:
+                    self._cursor.execute(
+                        f"""--sql
+                        UPDATE images
+                        SET {", ".join(assignments)}
+                        WHERE image_name IN ({placeholders});
+                        """,
+                        values + batch,
+                    )
+            self._conn.commit()
+            return updated_image_names
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            raise ImageRecordSaveException from e
+        finally:
+            self._lock.release()
+
     def get_many(
         self,
         offset: Optional[int] = None,
@@ -365,6 +644,10 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        scheduler: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> OffsetPaginatedResults[ImageRecord]:
         try:
             self._lock.acquire()
@@ -425,6 +708,40 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                 """
                 query_params.append(board_id)
 
+            # Metadata filters are answered from the generated column indices
+            if model_name is not None:
+                query_conditions += """--sql
+                AND images.model_name = ?
+                """
+                query_params.append(model_name)
+
+            if seed is not None:
+                query_conditions += """--sql
+                AND images.seed = ?
+                """
+                query_params.append(seed)
+
+            if scheduler is not None:
+                query_conditions += """--sql
+                AND images.scheduler = ?
+                """
+                query_params.append(scheduler)
+
+            if prompt:
+                if self._has_fts:
+                    query_conditions += """--sql
+                    AND images.rowid IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)
+                    """
+                    query_params.append(to_fts_query(prompt))
+                else:
+                    query_conditions += """--sql
+                    AND (
+                        json_extract(images.metadata, '$.positive_prompt') LIKE ?
+                        OR json_extract(images.metadata, '$.negative_prompt') LIKE ?
+                    )
+                    """
+                    query_params.extend([f"%{prompt}%", f"%{prompt}%"])
+
             query_pagination = """--sql
             ORDER BY images.starred DESC, images.created_at DESC LIMIT ? OFFSET ?
             """
@@ -474,42 +791,69 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         finally:
             self._lock.release()
 
-    def delete_many(self, image_names: list[str]) -> None:
+    def delete_many(self, image_names: list[str]) -> list[str]:
         try:
-            placeholders = ",".join("?" for _ in image_names)
-
             self._lock.acquire()
-
-            # Construct the SQLite query with the placeholders
-            query = f"DELETE FROM images WHERE image_name IN ({placeholders})"
-
-            # Execute the query with the list of IDs as parameters
-            self._cursor.execute(query, image_names)
-
+            deleted_image_names: list[str] = []
+            for batch in batched(image_names):
+                placeholders = ",".join("?" for _ in batch)
+                self._cursor.execute(
+                    f"""--sql
+                    SELECT image_name FROM images
+                    WHERE image_name IN ({placeholders});
+                    """,
+                    batch,
+                )
+                result = cast(list[sqlite3.Row], self._cursor.fetchall())
+                deleted_image_names.extend(map(lambda r: r[0], result))
+                self._cursor.execute(
+                    f"""--sql
+                    DELETE FROM images
+                    WHERE image_name IN ({placeholders});
+                    """,
+                    batch,
+                )
             self._conn.commit()
+            return deleted_image_names
         except sqlite3.Error as e:
             self._conn.rollback()
             raise ImageRecordDeleteException from e
         finally:
             self._lock.release()
 
-    def delete_intermediates(self) -> list[str]:
+    def delete_intermediates(self, older_than: Optional[int] = None, limit: Optional[int] = None) -> list[str]:
         try:
             self._lock.acquire()
-            self._cursor.execute(
-                """--sql
+            query = """--sql
                 SELECT image_name FROM images
-                WHERE is_intermediate = TRUE;
+                WHERE is_intermediate = TRUE
                 """
-            )
+            query_params: list = []
+            if older_than is not None:
+                query += """--sql
+                AND created_at < STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', ?)
+                """
+                query_params.append(f"-{older_than} seconds")
+            query += """--sql
+                ORDER BY created_at
+                """
+            if limit is not None:
+                query += """--sql
+                LIMIT ?
+                """
+                query_params.append(limit)
+            self._cursor.execute(query, query_params)
             result = cast(list[sqlite3.Row], self._cursor.fetchall())
             image_names = list(map(lambda r: r[0], result))
-            self._cursor.execute(
-                """--sql
-                DELETE FROM images
-                WHERE is_intermediate = TRUE;
-                """
-            )
+            for batch in batched(image_names):
+                placeholders = ",".join("?" * len(batch))
+                self._cursor.execute(
+                    f"""--sql
+                    DELETE FROM images
+                    WHERE image_name IN ({placeholders});
+                    """,
+                    batch,
+                )
             self._conn.commit()
             return image_names
         except sqlite3.Error as e:
@@ -530,10 +874,21 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         metadata: Optional[dict],
         is_intermediate: bool = False,
         starred: bool = False,
+        workflow: Optional[str] = None,
+        content_hash: Optional[str] = None,
     ) -> datetime:
         try:
             metadata_json = None if metadata is None else json.dumps(metadata)
+            workflow_hash = None if workflow is None else hashlib.sha256(workflow.encode("utf-8")).hexdigest()
             self._lock.acquire()
+            if workflow_hash is not None:
+                self._cursor.execute(
+                    """--sql
+                    INSERT OR IGNORE INTO workflows (workflow_hash, workflow)
+                    VALUES (?, ?);
+                    """,
+                    (workflow_hash, workflow),
+                )
             self._cursor.execute(
                 """--sql
                 INSERT OR IGNORE INTO images (
@@ -546,9 +901,11 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                     session_id,
                     metadata,
                     is_intermediate,
-                    starred
+                    starred,
+                    workflow_hash,
+                    content_hash
                     )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
                 """,
                 (
                     image_name,
@@ -561,6 +918,8 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                     metadata_json,
                     is_intermediate,
                     starred,
+                    workflow_hash,
+                    content_hash,
                 ),
             )
             self._conn.commit()
@@ -583,25 +942,56 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         finally:
             self._lock.release()
 
-    def get_most_recent_image_for_board(self, board_id: str) -> Optional[ImageRecord]:
+    def get_by_content_hash(
+        self,
+        content_hash: str,
+        image_category: ImageCategory,
+        is_intermediate: bool,
+        board_id: Optional[str],
+    ) -> Optional[ImageRecord]:
         try:
             self._lock.acquire()
+
             self._cursor.execute(
-                """--sql
-                SELECT images.*
-                FROM images
-                JOIN board_images ON images.image_name = board_images.image_name
-                WHERE board_images.board_id = ?
-                ORDER BY images.created_at DESC
+                f"""--sql
+                SELECT {IMAGE_DTO_COLS} FROM images
+                LEFT JOIN board_images ON board_images.image_name = images.image_name
+                WHERE images.content_hash = ?
+                AND images.image_category = ?
+                AND images.is_intermediate = ?
+                AND board_images.board_id IS ?
                 LIMIT 1;
                 """,
-                (board_id,),
+                (content_hash, image_category.value, is_intermediate, board_id),
             )
 
             result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+            if result is None:
+                return None
+            record = dict(result)
+
+            if is_intermediate:
+                # Intermediates expire by age, so a reused intermediate must not be deleted as soon as it is reused
+                self._cursor.execute(
+                    """--sql
+                    UPDATE images
+                    SET created_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+                    WHERE image_name = ?;
+                    """,
+                    (record["image_name"],),
+                )
+                self._cursor.execute(
+                    """--sql
+                    SELECT created_at FROM images WHERE image_name = ?;
+                    """,
+                    (record["image_name"],),
+                )
+                record["created_at"] = self._cursor.fetchone()[0]
+                self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            raise ImageRecordNotFoundException from e
         finally:
             self._lock.release()
-        if result is None:
-            return None
 
-        return deserialize_image_record(dict(result))
+        return deserialize_image_record(record)
@@ -1,3 +1,4 @@
+import json
 from abc import ABC, abstractmethod
 from logging import Logger
 from typing import TYPE_CHECKING, Optional
@@ -17,6 +18,7 @@ from invokeai.app.services.image_file_storage import (
     ImageFileNotFoundException,
     ImageFileSaveException,
     ImageFileStorageBase,
+    ResizedImageFormat,
 )
 from invokeai.app.services.image_record_storage import (
     ImageRecordDeleteException,
@@ -35,6 +37,7 @@ from invokeai.app.services.models.image_record import (
 from invokeai.app.services.resource_name import NameServiceBase
 from invokeai.app.services.urls import UrlServiceBase
 from invokeai.app.util.metadata import get_metadata_graph_from_raw_session
+from invokeai.app.util.png_text import add_png_text, get_png_text_keys
 
 if TYPE_CHECKING:
     from invokeai.app.services.graph import GraphExecutionState
@@ -55,10 +58,22 @@ class ImageServiceABC(ABC):
         is_intermediate: bool = False,
         metadata: Optional[dict] = None,
         workflow: Optional[str] = None,
+        content_hash: Optional[str] = None,
     ) -> ImageDTO:
         """Creates an image, storing the file and its metadata."""
         pass
 
+    @abstractmethod
+    def get_dto_by_content_hash(
+        self,
+        content_hash: str,
+        image_category: ImageCategory,
+        is_intermediate: bool,
+        board_id: Optional[str] = None,
+    ) -> Optional[ImageDTO]:
+        """Gets an image created from the same content, if there is one that can be reused."""
+        pass
+
     @abstractmethod
     def update(
         self,
@@ -68,6 +83,15 @@ class ImageServiceABC(ABC):
         """Updates an image."""
         pass
 
+    @abstractmethod
+    def update_many(
+        self,
+        image_names: list[str],
+        changes: ImageRecordChanges,
+    ) -> list[str]:
+        """Applies the same changes to many images, returning the names of the updated images."""
+        pass
+
     @abstractmethod
     def get_pil_image(self, image_name: str) -> PILImageType:
         """Gets an image as a PIL image."""
@@ -88,11 +112,26 @@ class ImageServiceABC(ABC):
         """Gets an image's metadata."""
         pass
 
+    @abstractmethod
+    def get_workflow(self, image_name: str) -> Optional[str]:
+        """Gets an image's workflow."""
+        pass
+
     @abstractmethod
     def get_path(self, image_name: str, thumbnail: bool = False) -> str:
         """Gets an image's path."""
         pass
 
+    @abstractmethod
+    def get_resized_path(self, image_name: str, size: int, image_format: ResizedImageFormat = "webp") -> str:
+        """Gets the path to a copy of an image resized to fit within a `size`x`size` square."""
+        pass
+
+    @abstractmethod
+    def export(self, image_name: str) -> bytes:
+        """Gets an image's PNG file with its metadata and workflow embedded."""
+        pass
+
     @abstractmethod
     def validate_path(self, path: str) -> bool:
         """Validates an image's path."""
@@ -112,8 +151,12 @@ class ImageServiceABC(ABC):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        scheduler: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> OffsetPaginatedResults[ImageDTO]:
-        """Gets a paginated list of image DTOs."""
+        """Gets a paginated list of image DTOs, optionally filtered by generation metadata."""
         pass
 
     @abstractmethod
@@ -122,8 +165,14 @@ class ImageServiceABC(ABC):
         pass
 
     @abstractmethod
-    def delete_intermediates(self) -> int:
-        """Deletes all intermediate images."""
+    def delete_many(self, image_names: list[str]) -> list[str]:
+        """Deletes many images, returning the names of the deleted images."""
+        pass
+
+    @abstractmethod
+    def delete_intermediates(self, older_than: Optional[int] = None, limit: Optional[int] = None) -> int:
+        """Deletes intermediate images, optionally only those created more than `older_than` seconds ago, oldest
+        first and at most `limit` of them. Returns the number of deleted images."""
         pass
 
     @abstractmethod
@@ -179,6 +228,7 @@ class ImageService(ImageServiceABC):
         is_intermediate: bool = False,
         metadata: Optional[dict] = None,
         workflow: Optional[str] = None,
+        content_hash: Optional[str] = None,
     ) -> ImageDTO:
         if image_origin not in ResourceOrigin:
             raise InvalidOriginException
@@ -216,10 +266,13 @@ class ImageService(ImageServiceABC):
                 node_id=node_id,
                 metadata=metadata,
                 session_id=session_id,
+                workflow=workflow,
+                content_hash=content_hash,
             )
             if board_id is not None:
                 self._services.board_image_records.add_image_to_board(board_id=board_id, image_name=image_name)
-            self._services.image_files.save(image_name=image_name, image=image, metadata=metadata, workflow=workflow)
+            # The metadata and workflow live in the database; they are embedded in the PNG on export
+            self._services.image_files.save(image_name=image_name, image=image, is_intermediate=is_intermediate)
             image_dto = self.get_dto(image_name)
 
             return image_dto
@@ -233,6 +286,30 @@ class ImageService(ImageServiceABC):
             self._services.logger.error(f"Problem saving image record and file: {str(e)}")
             raise e
 
+    def get_dto_by_content_hash(
+        self,
+        content_hash: str,
+        image_category: ImageCategory,
+        is_intermediate: bool,
+        board_id: Optional[str] = None,
+    ) -> Optional[ImageDTO]:
+        try:
+            image_record = self._services.image_records.get_by_content_hash(
+                content_hash, image_category, is_intermediate, board_id
+            )
+            if image_record is None:
+                return None
+
+            return image_record_to_dto(
+                image_record,
+                self._services.urls.get_image_url(image_record.image_name),
+                self._services.urls.get_image_url(image_record.image_name, True),
+                board_id,
+            )
+        except Exception as e:
+            self._services.logger.error("Problem getting image DTO")
+            raise e
+
     def update(
         self,
         image_name: str,
@@ -240,6 +317,9 @@ class ImageService(ImageServiceABC):
     ) -> ImageDTO:
         try:
             self._services.image_records.update(image_name, changes)
+            if changes.is_intermediate is False:
+                # A kept intermediate may only be in memory
+                self._services.image_files.persist(image_name)
             return self.get_dto(image_name)
         except ImageRecordSaveException:
             self._services.logger.error("Failed to update image record")
@@ -248,6 +328,25 @@ class ImageService(ImageServiceABC):
             self._services.logger.error("Problem updating image record")
             raise e
 
+    def update_many(
+        self,
+        image_names: list[str],
+        changes: ImageRecordChanges,
+    ) -> list[str]:
+        try:
+            updated_image_names = self._services.image_records.update_many(image_names, changes)
+            if changes.is_intermediate is False:
+                # Kept intermediates may only be in memory
+                for image_name in updated_image_names:
+                    self._services.image_files.persist(image_name)
+            return updated_image_names
+        except ImageRecordSaveException:
+            self._services.logger.error("Failed to update image records")
+            raise
+        except Exception as e:
+            self._services.logger.error("Problem updating image records")
+            raise e
+
     def get_pil_image(self, image_name: str) -> PILImageType:
         try:
             return self._services.image_files.get(image_name)
@@ -313,6 +412,16 @@ class ImageService(ImageServiceABC):
             self._services.logger.error("Problem getting image DTO")
             raise e
 
+    def get_workflow(self, image_name: str) -> Optional[str]:
+        try:
+            return self._services.image_records.get_workflow(image_name)
+        except ImageRecordNotFoundException:
+            self._services.logger.error("Image record not found")
+            raise
+        except Exception as e:
+            self._services.logger.error("Problem getting image workflow")
+            raise e
+
     def get_path(self, image_name: str, thumbnail: bool = False) -> str:
         try:
             return self._services.image_files.get_path(image_name, thumbnail)
@@ -320,6 +429,44 @@ class ImageService(ImageServiceABC):
             self._services.logger.error("Problem getting image path")
             raise e
 
+    def get_resized_path(self, image_name: str, size: int, image_format: ResizedImageFormat = "webp") -> str:
+        try:
+            return self._services.image_files.get_resized_path(image_name, size, image_format)
+        except ImageFileNotFoundException:
+            self._services.logger.error("Failed to get image file")
+            raise
+        except Exception as e:
+            self._services.logger.error("Problem resizing image")
+            raise e
+
+    def export(self, image_name: str) -> bytes:
+        try:
+            path = self._services.image_files.get_path(image_name)
+            # Waits for the file, if it is still being written
+            if not self._services.image_files.validate_path(path):
+                raise FileNotFoundError(path)
+            with open(path, "rb") as file:
+                png = file.read()
+
+            # Images saved before the metadata and workflow were stored separately already have them embedded
+            existing_keys = get_png_text_keys(png)
+            if "invokeai_metadata" not in existing_keys:
+                metadata = self._services.image_records.get_metadata(image_name)
+                if metadata is not None:
+                    png = add_png_text(png, "invokeai_metadata", json.dumps(metadata))
+            if "invokeai_workflow" not in existing_keys:
+                workflow = self._services.image_records.get_workflow(image_name)
+                if workflow is not None:
+                    png = add_png_text(png, "invokeai_workflow", workflow)
+
+            return png
+        except FileNotFoundError as e:
+            self._services.logger.error("Failed to get image file")
+            raise ImageFileNotFoundException from e
+        except Exception as e:
+            self._services.logger.error("Problem exporting image")
+            raise e
+
     def validate_path(self, path: str) -> bool:
         try:
             return self._services.image_files.validate_path(path)
@@ -342,6 +489,10 @@ class ImageService(ImageServiceABC):
         categories: Optional[list[ImageCategory]] = None,
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
+        model_name: Optional[str] = None,
+        seed: Optional[int] = None,
+        scheduler: Optional[str] = None,
+        prompt: Optional[str] = None,
     ) -> OffsetPaginatedResults[ImageDTO]:
         try:
             results = self._services.image_records.get_many(
@@ -351,6 +502,10 @@ class ImageService(ImageServiceABC):
                 categories,
                 is_intermediate,
                 board_id,
+                model_name,
+                seed,
+                scheduler,
+                prompt,
             )
 
             image_dtos = list(
@@ -389,35 +544,41 @@ class ImageService(ImageServiceABC):
             self._services.logger.error("Problem deleting image record and file")
             raise e
 
+    def delete_many(self, image_names: list[str]) -> list[str]:
+        try:
+            deleted_image_names = self._services.image_records.delete_many(image_names)
+            self._services.image_files.delete_many(deleted_image_names)
+            return deleted_image_names
+        except ImageRecordDeleteException:
+            self._services.logger.error("Failed to delete image records")
+            raise
+        except Exception as e:
+            self._services.logger.error("Problem deleting image records and files")
+            raise e
+
     def delete_images_on_board(self, board_id: str):
         try:
             image_names = self._services.board_image_records.get_all_board_image_names_for_board(board_id)
-            for image_name in image_names:
-                self._services.image_files.delete(image_name)
-            self._services.image_records.delete_many(image_names)
+            self.delete_many(image_names)
         except ImageRecordDeleteException:
             self._services.logger.error("Failed to delete image records")
             raise
-        except ImageFileDeleteException:
-            self._services.logger.error("Failed to delete image files")
-            raise
         except Exception as e:
             self._services.logger.error("Problem deleting image records and files")
             raise e
 
-    def delete_intermediates(self) -> int:
+    def delete_intermediates(self, older_than: Optional[int] = None, limit: Optional[int] = None) -> int:
         try:
-            image_names = self._services.image_records.delete_intermediates()
-            count = len(image_names)
-            for image_name in image_names:
-                self._services.image_files.delete(image_name)
-            return count
+            image_names = self._services.image_records.delete_intermediates(older_than=older_than, limit=limit)
+            self._services.image_files.delete_many(image_names)
+            return len(image_names)
         except ImageRecordDeleteException:
             self._services.logger.error("Failed to delete image records")
             raise
-        except ImageFileDeleteException:
-            self._services.logger.error("Failed to delete image files")
-            raise
         except Exception as e:
             self._services.logger.error("Problem deleting image records and files")
             raise e
+
+    def stop(self, *args, **kwargs) -> None:
+        # Let the file storage finish removing files from bulk deletes
+        self._services.image_files.stop()
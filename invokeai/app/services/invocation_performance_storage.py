@@ -0,0 +1,307 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from itertools import groupby
+from typing import Any, Optional
+
+from invokeai.app.services.models.invocation_performance_record import (
+    InvocationPerformanceGroup,
+    InvocationPerformancePercentiles,
+    InvocationPerformanceRecord,
+)
+from invokeai.app.services.sqlite import TimedConnection
+
+# Records older than the full-resolution period are thinned to one in this many
+DOWNSAMPLE_FACTOR = 10
+# Seconds between looking for records to downsample and delete
+MAINTENANCE_INTERVAL = 3600
+
+DEFAULT_PERCENTILES = [50, 90, 95, 99]
+
+# The columns that each group is made of
+GROUP_COLUMNS: dict[str, list[str]] = {
+    "node_type": ["node_type"],
+    "resolution": ["width", "height"],
+    "model": ["model"],
+    "model_cache_hit": ["model_cache_hit"],
+}
+
+
+def get_weighted_percentile(values: list[tuple[float, int]], percentile: float) -> float:
+    """Gets a percentile of sorted (value, weight) pairs, by the nearest rank"""
+    total = sum(weight for _, weight in values)
+    rank = percentile / 100 * total
+    cumulative = 0
+    for value, weight in values:
+        cumulative += weight
+        if cumulative >= rank:
+            return value
+    return values[-1][0]
+
+
+class InvocationPerformanceStorageBase(ABC):
+    """Low-level service responsible for storing the time and memory used by invocations."""
+
+    @abstractmethod
+    def save(self, record: InvocationPerformanceRecord) -> None:
+        """Saves the performance record of an invocation."""
+        pass
+
+    @abstractmethod
+    def get_percentiles(
+        self,
+        group_by: list[InvocationPerformanceGroup],
+        percentiles: list[float] = DEFAULT_PERCENTILES,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        node_type: Optional[str] = None,
+        model: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ) -> list[InvocationPerformancePercentiles]:
+        """Gets percentiles of the time and memory used by invocations, grouped by any of their dimensions.
+
+        `since` and `until` are Unix timestamps. The other arguments filter the invocations.
+        """
+        pass
+
+    @abstractmethod
+    def downsample(self) -> None:
+        """Thins out old records, and deletes expired ones."""
+        pass
+
+
+class SqliteInvocationPerformanceStorage(InvocationPerformanceStorageBase):
+    """Stores invocation performance records in sqlite.
+
+    Records are kept as they are for `full_resolution_days`. After that, one in `DOWNSAMPLE_FACTOR` records of
+    each node type, resolution, model and cache hit or miss is kept, weighted by the number of records it stands
+    for, so percentiles stay representative. Records are deleted after `max_days`.
+    """
+
+    _filename: str
+    _conn: sqlite3.Connection
+    _cursor: sqlite3.Cursor
+    _lock: threading.Lock
+    _full_resolution_days: int
+    _max_days: int
+    _last_maintenance: float
+
+    def __init__(self, filename: str, full_resolution_days: int = 7, max_days: int = 30) -> None:
+        super().__init__()
+        self._filename = filename
+        self._conn = sqlite3.connect(filename, check_same_thread=False, factory=TimedConnection)
+        # Enable row factory to get rows as dictionaries (must be done before making the cursor!)
+        self._conn.row_factory = sqlite3.Row
+        self._cursor = self._conn.cursor()
+        self._lock = threading.Lock()
+        self._full_resolution_days = full_resolution_days
+        self._max_days = max_days
+        self._last_maintenance = 0
+
+        try:
+            self._lock.acquire()
+            self._create_tables()
+            self._conn.commit()
+        finally:
+            self._lock.release()
+
+    def _create_tables(self) -> None:
+        """Creates the `invocation_performance` table."""
+
+        self._cursor.execute(
+            """--sql
+            CREATE TABLE IF NOT EXISTS invocation_performance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                node_type TEXT NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                model TEXT,
+                model_cache_hit BOOLEAN,
+                duration REAL NOT NULL,
+                peak_vram INTEGER NOT NULL DEFAULT 0,
+                ram_used INTEGER NOT NULL DEFAULT 0,
+                -- The number of invocations that the record stands for; more than 1 once downsampled
+                weight INTEGER NOT NULL DEFAULT 1,
+                downsampled BOOLEAN NOT NULL DEFAULT FALSE,
+                created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+            );
+            """
+        )
+
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_invocation_performance_created_at ON invocation_performance (created_at);
+            """
+        )
+
+        self._cursor.execute(
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_invocation_performance_node_type
+            ON invocation_performance (node_type, created_at);
+            """
+        )
+
+    def save(self, record: InvocationPerformanceRecord) -> None:
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                """--sql
+                INSERT INTO invocation_performance (
+                    node_type,
+                    width,
+                    height,
+                    model,
+                    model_cache_hit,
+                    duration,
+                    peak_vram,
+                    ram_used
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                """,
+                (
+                    record.node_type,
+                    record.width,
+                    record.height,
+                    record.model,
+                    record.model_cache_hit,
+                    record.duration,
+                    record.peak_vram,
+                    record.ram_used,
+                ),
+            )
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+        if time.time() - self._last_maintenance > MAINTENANCE_INTERVAL:
+            self.downsample()
+
+    def get_percentiles(
+        self,
+        group_by: list[InvocationPerformanceGroup],
+        percentiles: list[float] = DEFAULT_PERCENTILES,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        node_type: Optional[str] = None,
+        model: Optional[str] = None,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ) -> list[InvocationPerformancePercentiles]:
+        group_columns = [column for group in group_by for column in GROUP_COLUMNS[group]]
+        conditions: list[str] = []
+        params: list[Any] = []
+        if since is not None:
+            conditions.append("created_at >= STRFTIME('%Y-%m-%d %H:%M:%f', ?, 'unixepoch')")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < STRFTIME('%Y-%m-%d %H:%M:%f', ?, 'unixepoch')")
+            params.append(until)
+        for column, value in [("node_type", node_type), ("model", model), ("width", width), ("height", height)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        selected = ", ".join(group_columns + ["duration", "peak_vram", "weight"])
+        # Rows come grouped and with their durations sorted, so only one group is held in memory at a time
+        order_by = ", ".join(group_columns + ["duration"])
+
+        results = []
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                f"""--sql
+                SELECT {selected}
+                FROM invocation_performance
+                {where}
+                ORDER BY {order_by};
+                """,
+                params,
+            )
+            for key, group_rows in groupby(
+                self._cursor, key=lambda row: tuple(row[column] for column in group_columns)
+            ):
+                durations: list[tuple[float, int]] = []
+                peak_vrams: list[tuple[float, int]] = []
+                for row in group_rows:
+                    durations.append((row["duration"], row["weight"]))
+                    peak_vrams.append((row["peak_vram"], row["weight"]))
+                peak_vrams.sort()
+                values = dict(zip(group_columns, key))
+                results.append(
+                    InvocationPerformancePercentiles(
+                        node_type=values.get("node_type"),
+                        resolution=f"{values['width']}x{values['height']}" if "resolution" in group_by else None,
+                        model=values.get("model"),
+                        model_cache_hit=values.get("model_cache_hit"),
+                        count=sum(weight for _, weight in durations),
+                        duration={f"p{p:g}": get_weighted_percentile(durations, p) for p in percentiles},
+                        peak_vram={f"p{p:g}": get_weighted_percentile(peak_vrams, p) for p in percentiles},
+                    )
+                )
+        finally:
+            self._lock.release()
+        return results
+
+    def downsample(self) -> None:
+        try:
+            self._lock.acquire()
+            self._last_maintenance = time.time()
+            self._cursor.execute(
+                """--sql
+                DELETE FROM invocation_performance
+                WHERE created_at < STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', ?);
+                """,
+                (f"-{self._max_days} days",),
+            )
+
+            self._cursor.execute(
+                """--sql
+                SELECT id, weight, node_type, width, height, model, model_cache_hit
+                FROM invocation_performance
+                WHERE downsampled = FALSE AND created_at < STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', ?)
+                ORDER BY node_type, width, height, model, model_cache_hit, id;
+                """,
+                (f"-{self._full_resolution_days} days",),
+            )
+            rows = self._cursor.fetchall()
+
+            # Keeps the first record of every run of records of the same kind, standing in for the rest of the run
+            kept: list[tuple[int, int]] = []
+            deleted: list[tuple[int]] = []
+            run_kind = None
+            run_length = 0
+            for row in rows:
+                kind = (row["node_type"], row["width"], row["height"], row["model"], row["model_cache_hit"])
+                if kind != run_kind or run_length == DOWNSAMPLE_FACTOR:
+                    run_kind = kind
+                    run_length = 0
+                    kept.append((row["weight"], row["id"]))
+                else:
+                    weight, id = kept[-1]
+                    kept[-1] = (weight + row["weight"], id)
+                    deleted.append((row["id"],))
+                run_length += 1
+
+            self._cursor.executemany(
+                """--sql
+                UPDATE invocation_performance SET weight = ?, downsampled = TRUE WHERE id = ?;
+                """,
+                kept,
+            )
+            self._cursor.executemany(
+                """--sql
+                DELETE FROM invocation_performance WHERE id = ?;
+                """,
+                deleted,
+            )
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
@@ -7,6 +7,11 @@ from queue import Queue
 from pydantic import BaseModel, Field
 from typing import Optional
 
+from invokeai.app.util.metrics import Gauge, Histogram
+
+QUEUE_DEPTH = Gauge("invokeai_queue_depth", "Number of invocations waiting to be run")
+QUEUE_WAIT_SECONDS = Histogram("invokeai_queue_wait_seconds", "Time that invocations waited in the queue")
+
 
 class InvocationQueueItem(BaseModel):
     graph_execution_state_id: str = Field(description="The ID of the graph execution state")
@@ -45,6 +50,7 @@ class MemoryInvocationQueue(InvocationQueueABC):
 
     def get(self) -> InvocationQueueItem:
         item = self.__queue.get()
+        QUEUE_DEPTH.dec()
 
         while (
             isinstance(item, InvocationQueueItem)
@@ -52,6 +58,10 @@ class MemoryInvocationQueue(InvocationQueueABC):
             and self.__cancellations[item.graph_execution_state_id] > item.timestamp
         ):
             item = self.__queue.get()
+            QUEUE_DEPTH.dec()
+
+        if isinstance(item, InvocationQueueItem):
+            QUEUE_WAIT_SECONDS.observe(time.time() - item.timestamp)
 
         # Clear old items
         for graph_execution_state_id in list(self.__cancellations.keys()):
@@ -62,6 +72,7 @@ class MemoryInvocationQueue(InvocationQueueABC):
 
     def put(self, item: Optional[InvocationQueueItem]) -> None:
         self.__queue.put(item)
+        QUEUE_DEPTH.inc()
 
     def cancel(self, graph_execution_state_id: str) -> None:
         if graph_execution_state_id not in self.__cancellations:
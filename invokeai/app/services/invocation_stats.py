@@ -33,22 +33,67 @@ import time
 from abc import ABC, abstractmethod
 from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Dict, Optional
 
 import torch
 
 import invokeai.backend.util.logging as logger
 
-from ..invocations.baseinvocation import BaseInvocation
+from pydantic import BaseModel
+
+from ..invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from .graph import GraphExecutionState
+from .invocation_performance_storage import InvocationPerformanceStorageBase
 from .item_storage import ItemStorageABC
+from .latent_storage import LatentsCacheStats, LatentsStorageBase
 from .model_manager_service import ModelManagerService
+from .models.invocation_performance_record import InvocationPerformanceRecord
+from invokeai.app.util.metrics import Counter, Gauge, Histogram
 from invokeai.backend.model_management.model_cache import CacheStats
 
 # size of GIG in bytes
 GIG = 1073741824
 
 
+def get_memory_usage() -> dict[tuple[str, ...], float]:
+    usage = {("ram",): float(psutil.Process().memory_info().rss)}
+    if torch.cuda.is_available():
+        usage[("vram_allocated",)] = float(torch.cuda.memory_allocated())
+        usage[("vram_reserved",)] = float(torch.cuda.memory_reserved())
+    return usage
+
+
+NODE_SECONDS = Histogram("invokeai_node_duration_seconds", "Time spent running invocations", ["node_type"])
+CACHE_HITS = Counter("invokeai_cache_hits_total", "Number of cache hits", ["cache"])
+CACHE_MISSES = Counter("invokeai_cache_misses_total", "Number of cache misses", ["cache"])
+CACHE_EVICTIONS = Counter("invokeai_cache_evictions_total", "Number of items evicted from a cache", ["cache"])
+MEMORY_BYTES = Gauge("invokeai_memory_bytes", "Memory used by the process", ["kind"], callback=get_memory_usage)
+
+
+def get_model_name(invocation: BaseInvocation) -> Optional[str]:
+    """Gets the name of the first model that an invocation uses, e.g. from its `unet` or `vae` field"""
+    for value in invocation.__dict__.values():
+        if hasattr(value, "model_name"):
+            return value.model_name
+        if isinstance(value, BaseModel):
+            for nested_value in value.__dict__.values():
+                if hasattr(nested_value, "model_name"):
+                    return nested_value.model_name
+    return None
+
+
+def get_resolution(
+    invocation: BaseInvocation, output: Optional[BaseInvocationOutput]
+) -> tuple[Optional[int], Optional[int]]:
+    """Gets the size of an invocation's output, or failing that the size that it was asked to make"""
+    for source in (output, invocation):
+        width = getattr(source, "width", None)
+        height = getattr(source, "height", None)
+        if isinstance(width, int) and isinstance(height, int):
+            return width, height
+    return None, None
+
+
 @dataclass
 class NodeStats:
     """Class for tracking execution stats of an invocation node"""
@@ -76,14 +121,23 @@ class InvocationStatsServiceBase(ABC):
     # {graph_id => NodeLog}
     _stats: Dict[str, NodeLog]
     _cache_stats: Dict[str, CacheStats]
+    _latents_cache_stats: Dict[str, LatentsCacheStats]
+    # {graph_id => {cache => (hits, misses, evictions)}}, as last added to the cache metrics
+    _reported_cache_counts: Dict[str, Dict[str, tuple[int, int, int]]]
+    history: Optional[InvocationPerformanceStorageBase]
     ram_used: float
     ram_changed: float
 
     @abstractmethod
-    def __init__(self, graph_execution_manager: ItemStorageABC["GraphExecutionState"]):
+    def __init__(
+        self,
+        graph_execution_manager: ItemStorageABC["GraphExecutionState"],
+        history: Optional[InvocationPerformanceStorageBase] = None,
+    ):
         """
         Initialize the InvocationStatsService and reset counters to zero
         :param graph_execution_manager: Graph execution manager for this session
+        :param history: Optional storage for a record of every invocation
         """
         pass
 
@@ -132,6 +186,14 @@ class InvocationStatsServiceBase(ABC):
         """
         pass
 
+    @abstractmethod
+    def update_cache_metrics(self, graph_id: str):
+        """
+        Add the cache statistics of a graph to the cache metrics served at /metrics.
+        :param graph_id: ID of the graph that is currently executing
+        """
+        pass
+
     @abstractmethod
     def log_stats(self):
         """
@@ -158,11 +220,19 @@ class InvocationStatsService(InvocationStatsServiceBase):
     """Accumulate performance information about a running graph. Collects time spent in each node,
     as well as the maximum and current VRAM utilisation for CUDA systems"""
 
-    def __init__(self, graph_execution_manager: ItemStorageABC["GraphExecutionState"]):
+    def __init__(
+        self,
+        graph_execution_manager: ItemStorageABC["GraphExecutionState"],
+        history: Optional[InvocationPerformanceStorageBase] = None,
+    ):
         self.graph_execution_manager = graph_execution_manager
+        # Keeps a record of every invocation, if given
+        self.history = history
         # {graph_id => NodeLog}
         self._stats: Dict[str, NodeLog] = {}
         self._cache_stats: Dict[str, CacheStats] = {}
+        self._latents_cache_stats: Dict[str, LatentsCacheStats] = {}
+        self._reported_cache_counts: Dict[str, Dict[str, tuple[int, int, int]]] = {}
         self.ram_used: float = 0.0
         self.ram_changed: float = 0.0
 
@@ -175,6 +245,11 @@ class InvocationStatsService(InvocationStatsServiceBase):
         start_time: float
         ram_used: int
         model_manager: ModelManagerService
+        latents: Optional[LatentsStorageBase]
+        # Set by the caller once the invocation has run, for its resolution
+        output: Optional[BaseInvocationOutput]
+        # Model cache hits and misses when the invocation started
+        cache_counts: tuple[int, int]
 
         def __init__(
             self,
@@ -182,6 +257,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
             graph_id: str,
             model_manager: ModelManagerService,
             collector: "InvocationStatsServiceBase",
+            latents: Optional[LatentsStorageBase] = None,
         ):
             """Initialize statistics for this run."""
             self.invocation = invocation
@@ -190,6 +266,9 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self.start_time = 0.0
             self.ram_used = 0
             self.model_manager = model_manager
+            self.latents = latents
+            self.output = None
+            self.cache_counts = (0, 0)
 
         def __enter__(self):
             self.start_time = time.time()
@@ -198,31 +277,64 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self.ram_used = psutil.Process().memory_info().rss
             if self.model_manager:
                 self.model_manager.collect_cache_stats(self.collector._cache_stats[self.graph_id])
+            if self.latents:
+                self.latents.collect_cache_stats(self.collector._latents_cache_stats[self.graph_id])
+            cache_stats = self.collector._cache_stats[self.graph_id]
+            self.cache_counts = (cache_stats.hits, cache_stats.misses)
+            return self
 
-        def __exit__(self, *args):
+        def __exit__(self, exc_type, *args):
             """Called on exit from the context."""
             ram_used = psutil.Process().memory_info().rss
             self.collector.update_mem_stats(
                 ram_used=ram_used / GIG,
                 ram_changed=(ram_used - self.ram_used) / GIG,
             )
+            time_used = time.time() - self.start_time
+            peak_vram = torch.cuda.max_memory_allocated() if torch.cuda.is_available() else 0
             self.collector.update_invocation_stats(
                 graph_id=self.graph_id,
                 invocation_type=self.invocation.type,  # type: ignore - `type` is not on the `BaseInvocation` model, but *is* on all invocations
-                time_used=time.time() - self.start_time,
-                vram_used=torch.cuda.max_memory_allocated() / GIG if torch.cuda.is_available() else 0.0,
+                time_used=time_used,
+                vram_used=peak_vram / GIG,
             )
+            NODE_SECONDS.observe(time_used, self.invocation.type)  # type: ignore
+            self.collector.update_cache_metrics(self.graph_id)
+
+            if self.collector.history is None or exc_type is not None:
+                return
+            cache_stats = self.collector._cache_stats[self.graph_id]
+            hits, misses = cache_stats.hits - self.cache_counts[0], cache_stats.misses - self.cache_counts[1]
+            width, height = get_resolution(self.invocation, self.output)
+            try:
+                self.collector.history.save(
+                    InvocationPerformanceRecord(
+                        node_type=self.invocation.type,  # type: ignore
+                        width=width,
+                        height=height,
+                        model=get_model_name(self.invocation),
+                        model_cache_hit=misses == 0 if hits + misses > 0 else None,
+                        duration=time_used,
+                        peak_vram=peak_vram,
+                        ram_used=ram_used,
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Failed to save invocation performance record: {e}")
 
     def collect_stats(
         self,
         invocation: BaseInvocation,
         graph_execution_state_id: str,
         model_manager: ModelManagerService,
+        latents: Optional[LatentsStorageBase] = None,
     ) -> StatsContext:
         if not self._stats.get(graph_execution_state_id):  # first time we're seeing this
             self._stats[graph_execution_state_id] = NodeLog()
             self._cache_stats[graph_execution_state_id] = CacheStats()
-        return self.StatsContext(invocation, graph_execution_state_id, model_manager, self)
+            self._latents_cache_stats[graph_execution_state_id] = LatentsCacheStats()
+            self._reported_cache_counts[graph_execution_state_id] = {}
+        return self.StatsContext(invocation, graph_execution_state_id, model_manager, self, latents)
 
     def reset_all_stats(self):
         """Zero all statistics"""
@@ -233,6 +345,9 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self._stats.pop(graph_execution_id)
         except KeyError:
             logger.warning(f"Attempted to clear statistics for unknown graph {graph_execution_id}")
+        self._cache_stats.pop(graph_execution_id, None)
+        self._latents_cache_stats.pop(graph_execution_id, None)
+        self._reported_cache_counts.pop(graph_execution_id, None)
 
     def update_mem_stats(
         self,
@@ -256,6 +371,24 @@ class InvocationStatsService(InvocationStatsServiceBase):
         stats.time_used += time_used
         stats.max_vram = max(stats.max_vram, vram_used)
 
+    def update_cache_metrics(self, graph_id: str):
+        # Only what changed since the last update is added
+        reported = self._reported_cache_counts.get(graph_id)
+        if reported is None:
+            return
+        cache_stats = self._cache_stats[graph_id]
+        latents_cache_stats = self._latents_cache_stats[graph_id]
+        counts = {
+            "models": (cache_stats.hits, cache_stats.misses, cache_stats.cleared),
+            "latents": (latents_cache_stats.hits, latents_cache_stats.misses, latents_cache_stats.evictions),
+        }
+        for cache, (hits, misses, evictions) in counts.items():
+            reported_hits, reported_misses, reported_evictions = reported.get(cache, (0, 0, 0))
+            CACHE_HITS.inc(cache, amount=hits - reported_hits)
+            CACHE_MISSES.inc(cache, amount=misses - reported_misses)
+            CACHE_EVICTIONS.inc(cache, amount=evictions - reported_evictions)
+        reported.update(counts)
+
     def log_stats(self):
         completed = set()
         errored = set()
@@ -293,12 +426,26 @@ class InvocationStatsService(InvocationStatsServiceBase):
             logger.info(f"   Models cleared from cache: {cache_stats.cleared}")
             logger.info(f"   Cache high water mark: {hwm:4.2f}/{tot:4.2f}G")
 
+            latents_cache_stats = self._latents_cache_stats[graph_id]
+            latents_hwm = latents_cache_stats.high_watermark / GIG
+            latents_tot = latents_cache_stats.cache_size / GIG
+            logger.info("Latents cache statistics:")
+            logger.info(f"   Latents cache hits: {latents_cache_stats.hits}")
+            logger.info(f"   Latents cache misses: {latents_cache_stats.misses}")
+            logger.info(f"   Latents evicted from cache: {latents_cache_stats.evictions}")
+            logger.info(f"   Cache high water mark: {latents_hwm:4.2f}/{latents_tot:4.2f}G")
+
             completed.add(graph_id)
 
         for graph_id in completed:
+            self.update_cache_metrics(graph_id)
             del self._stats[graph_id]
             del self._cache_stats[graph_id]
+            del self._latents_cache_stats[graph_id]
+            del self._reported_cache_counts[graph_id]
 
         for graph_id in errored:
             del self._stats[graph_id]
             del self._cache_stats[graph_id]
+            del self._latents_cache_stats[graph_id]
+            del self._reported_cache_counts[graph_id]
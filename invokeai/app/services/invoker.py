@@ -6,6 +6,7 @@ from typing import Optional
 from .graph import Graph, GraphExecutionState
 from .invocation_queue import InvocationQueueItem
 from .invocation_services import InvocationServices
+from .latent_storage import get_latents_names
 
 
 class Invoker:
@@ -29,6 +30,10 @@ class Invoker:
         # Save the execution state
         self.services.graph_execution_manager.set(graph_execution_state)
 
+        # Keep the invocation's input latents in memory until it has run
+        for name in get_latents_names(invocation):
+            self.services.latents.pin(name)
+
         # Queue the invocation
         self.services.queue.put(
             InvocationQueueItem(
@@ -50,6 +55,7 @@ class Invoker:
     def cancel(self, graph_execution_state_id: str) -> None:
         """Cancels the given execution state"""
         self.services.queue.cancel(graph_execution_state_id)
+        self.services.latents.unpin_session(graph_execution_state_id)
 
     def __start_service(self, service) -> None:
         # Call start() method on any services that have it
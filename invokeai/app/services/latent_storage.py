@@ -1,16 +1,85 @@
 # Copyright (c) 2023 Kyle Schouviller (https://github.com/kyle0654)
 
+import dataclasses
+import os
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Union, Optional
+from threading import Lock
+from typing import Any, Callable, Literal, Union, Optional
 
 import torch
+from pydantic import BaseModel
+
+from invokeai.app.util.noise_recipe import NoiseRecipe
+from invokeai.app.util.sharding import get_sharded_path, has_unsharded_files
+from invokeai.app.util.tensor_files import (
+    UnsupportedTensorDataError,
+    is_safetensors_file,
+    load_tensor_file,
+    save_tensor_file,
+)
+
+# size of GIG in bytes
+GIG = 1073741824
+
+DEFAULT_MAX_LATENTS_CACHE_SIZE = 0.5
+DEFAULT_MAX_CONDITIONING_CACHE_SIZE = 0.25
+DEFAULT_MAX_DEVICE_CACHE_SIZE = 0.125
+
+# Fields of latents, conditioning and denoise mask values that hold the names of saved latents
+LATENTS_NAME_FIELDS = ("latents_name", "conditioning_name", "mask_name", "masked_latents_name")
+
+# Latents tensors and conditioning are cached separately. Latents on the execution device are also kept there.
+LatentsKind = Literal["device", "latents", "conditioning"]
+
+
+@dataclass
+class LatentsCacheStats(object):
+    hits: int = 0  # cache hits
+    misses: int = 0  # cache misses
+    evictions: int = 0  # entries evicted to make space
+    high_watermark: int = 0  # amount of cache used
+    cache_size: int = 0  # total size of cache
+
+
+def get_latents_size_in_bytes(data: Any) -> int:
+    """Gets the size of the tensors in latents or conditioning data, which may be nested in lists, tuples and
+    dataclasses."""
+    if isinstance(data, torch.Tensor):
+        return data.element_size() * data.nelement()
+    if isinstance(data, (list, tuple)):
+        return sum(get_latents_size_in_bytes(item) for item in data)
+    if dataclasses.is_dataclass(data):
+        return sum(get_latents_size_in_bytes(getattr(data, field.name)) for field in dataclasses.fields(data))
+    return 0
+
+
+def get_latents_names(invocation: BaseModel) -> list[str]:
+    """Gets the names of the latents and conditioning referred to by an invocation's inputs"""
+    names = []
+    values = list(invocation.__dict__.values())
+    while values:
+        value = values.pop()
+        if isinstance(value, list):
+            values.extend(value)
+        elif isinstance(value, BaseModel):
+            for field in LATENTS_NAME_FIELDS:
+                name = getattr(value, field, None)
+                if isinstance(name, str):
+                    names.append(name)
+    return names
 
 
 class LatentsStorageBase(ABC):
     """Responsible for storing and retrieving latents."""
 
+    _on_saved_callbacks: list[Callable[[str], None]]
+
+    def __init__(self) -> None:
+        self._on_saved_callbacks = list()
+
     @abstractmethod
     def get(self, name: str) -> torch.Tensor:
         pass
@@ -23,71 +92,316 @@ class LatentsStorageBase(ABC):
     def delete(self, name: str) -> None:
         pass
 
+    def on_saved(self, on_saved: Callable[[str], None]) -> None:
+        """Register a callback for when latents are saved"""
+        self._on_saved_callbacks.append(on_saved)
+
+    def _on_saved(self, name: str) -> None:
+        for callback in self._on_saved_callbacks:
+            callback(name)
+
+    def pin(self, name: str) -> None:
+        """Keeps latents in memory until they are unpinned, for nodes that are queued to use them. Pins are counted."""
+        pass
+
+    def unpin(self, name: str) -> None:
+        """Removes a pin"""
+        pass
+
+    def unpin_session(self, session_id: str) -> None:
+        """Removes all pins on latents saved by a session, e.g. when it is canceled"""
+        pass
+
+    def collect_cache_stats(self, cache_stats: LatentsCacheStats) -> None:
+        """Counts cache hits and misses into `cache_stats` from now on"""
+        pass
+
+    def flush(self) -> None:
+        """Writes latents that are only held in memory to the underlying storage"""
+        pass
+
 
 class ForwardCacheLatentsStorage(LatentsStorageBase):
-    """Caches the latest N latents in memory, writing-thorugh to and reading from underlying storage"""
+    """Caches recently used latents and conditioning in memory, writing-through to and reading from underlying storage.
+
+    Latents tensors and conditioning have separate budgets, in bytes, so large latents don't push out the small
+    conditioning shared by every denoising step. The least recently used entries are evicted first; pinned entries
+    are never evicted.
+
+    Latents saved from the execution device (e.g. CUDA) are kept there, in a small tier of their own, so the next
+    node doesn't copy them back. They are only copied to the CPU and written to the underlying storage when they are
+    evicted from that tier, unpinned or flushed. The device tier's budget is never exceeded: latents that don't fit
+    next to the pinned entries skip it. Latents on the CPU skip the device tier.
+
+    Names of noise recipes (see `NoiseRecipe`) are never saved; the noise is made when it is not in the cache.
+    """
 
-    __cache: Dict[str, torch.Tensor]
-    __cache_ids: Queue
-    __max_cache_size: int
     __underlying_storage: LatentsStorageBase
+    __lock: Lock
+    # {kind => {name => (data, size in bytes)}}, least recently used first
+    __caches: dict[LatentsKind, OrderedDict[str, tuple[Any, int]]]
+    __cache_sizes: dict[LatentsKind, int]
+    __max_cache_sizes: dict[LatentsKind, int]
+    # {name => number of pins}
+    __pins: dict[str, int]
+    # Names of latents in the device tier that are not yet in the underlying storage
+    __unwritten_names: set[str]
+    __stats: Optional[LatentsCacheStats]
 
-    def __init__(self, underlying_storage: LatentsStorageBase, max_cache_size: int = 20):
+    def __init__(
+        self,
+        underlying_storage: LatentsStorageBase,
+        max_latents_cache_size: float = DEFAULT_MAX_LATENTS_CACHE_SIZE,
+        max_conditioning_cache_size: float = DEFAULT_MAX_CONDITIONING_CACHE_SIZE,
+        max_device_cache_size: float = DEFAULT_MAX_DEVICE_CACHE_SIZE,
+    ):
+        """
+        :param underlying_storage: Storage that latents are written through to
+        :param max_latents_cache_size: Maximum size of the cached latents tensors, in GB
+        :param max_conditioning_cache_size: Maximum size of the cached conditioning, in GB
+        :param max_device_cache_size: Maximum size of the latents kept on the execution device, in GB
+        """
+        super().__init__()
         self.__underlying_storage = underlying_storage
-        self.__cache = dict()
-        self.__cache_ids = Queue()
-        self.__max_cache_size = max_cache_size
+        self.__lock = Lock()
+        # The device tier is searched first
+        self.__caches = dict(device=OrderedDict(), latents=OrderedDict(), conditioning=OrderedDict())
+        self.__cache_sizes = dict(device=0, latents=0, conditioning=0)
+        self.__max_cache_sizes = dict(
+            device=int(max_device_cache_size * GIG),
+            latents=int(max_latents_cache_size * GIG),
+            conditioning=int(max_conditioning_cache_size * GIG),
+        )
+        self.__pins = dict()
+        self.__unwritten_names = set()
+        self.__stats = None
 
     def get(self, name: str) -> torch.Tensor:
         cache_item = self.__get_cache(name)
         if cache_item is not None:
             return cache_item
 
-        latent = self.__underlying_storage.get(name)
+        recipe = NoiseRecipe.from_name(name)
+        latent = recipe.make_noise() if recipe is not None else self.__underlying_storage.get(name)
         self.__set_cache(name, latent)
         return latent
 
     def save(self, name: str, data: torch.Tensor) -> None:
+        if isinstance(data, torch.Tensor) and data.device.type != "cpu":
+            if self.__set_device_cache(name, data):
+                self._on_saved(name)
+                return
+            data = data.to("cpu")
+        else:
+            # The device tier is searched first, so a copy of earlier data there must not outlive it
+            self.__drop_cache(name, "device")
         self.__underlying_storage.save(name, data)
         self.__set_cache(name, data)
+        self._on_saved(name)
 
     def delete(self, name: str) -> None:
-        self.__underlying_storage.delete(name)
-        if name in self.__cache:
-            del self.__cache[name]
+        with self.__lock:
+            self.__pins.pop(name, None)
+            unwritten = name in self.__unwritten_names
+            self.__unwritten_names.discard(name)
+            for kind, cache in self.__caches.items():
+                if name in cache:
+                    self.__cache_sizes[kind] -= cache.pop(name)[1]
+        if NoiseRecipe.from_name(name) is None:
+            try:
+                self.__underlying_storage.delete(name)
+            except FileNotFoundError:
+                # Latents that were only on the device may never have been written
+                if not unwritten:
+                    raise
+
+    def pin(self, name: str) -> None:
+        if NoiseRecipe.from_name(name) is not None:
+            # Noise is made again if it was evicted
+            return
+        with self.__lock:
+            self.__pins[name] = self.__pins.get(name, 0) + 1
+
+    def unpin(self, name: str) -> None:
+        with self.__lock:
+            pins = self.__pins.pop(name, 0) - 1
+            if pins > 0:
+                self.__pins[name] = pins
+            else:
+                self.__write_back(name)
+            for kind in self.__caches.keys():
+                self.__evict(kind)
+
+    def unpin_session(self, session_id: str) -> None:
+        with self.__lock:
+            for name in [name for name in self.__pins if name.startswith(session_id)]:
+                del self.__pins[name]
+                self.__write_back(name)
+            for kind in self.__caches.keys():
+                self.__evict(kind)
+
+    def flush(self) -> None:
+        with self.__lock:
+            for name in list(self.__unwritten_names):
+                self.__write_back(name)
+
+    def stop(self, invoker) -> None:
+        self.flush()
+
+    def collect_cache_stats(self, cache_stats: LatentsCacheStats) -> None:
+        with self.__lock:
+            self.__stats = cache_stats
+            cache_stats.cache_size = sum(self.__max_cache_sizes.values())
 
     def __get_cache(self, name: str) -> Optional[torch.Tensor]:
-        return None if name not in self.__cache else self.__cache[name]
+        with self.__lock:
+            for cache in self.__caches.values():
+                if name in cache:
+                    cache.move_to_end(name)
+                    if self.__stats:
+                        self.__stats.hits += 1
+                    return cache[name][0]
+            if self.__stats:
+                self.__stats.misses += 1
+            return None
+
+    def __set_cache(self, name: str, data: Any):
+        with self.__lock:
+            self.__put_cache(name, data)
+
+    def __set_device_cache(self, name: str, data: torch.Tensor) -> bool:
+        """Keeps latents in the device tier without writing them to the underlying storage, if they fit its budget
+        next to the pinned entries. Returns whether they were kept."""
+        size = get_latents_size_in_bytes(data)
+        with self.__lock:
+            cache = self.__caches["device"]
+            if name in cache:
+                self.__cache_sizes["device"] -= cache.pop(name)[1]
+                self.__unwritten_names.discard(name)
+            pinned_size = sum(entry_size for entry_name, (_, entry_size) in cache.items() if entry_name in self.__pins)
+            if pinned_size + size > self.__max_cache_sizes["device"]:
+                return False
+            self.__evict("device", size)
+            cache[name] = (data, size)
+            self.__cache_sizes["device"] += size
+            self.__unwritten_names.add(name)
+            # The device tier is searched first, so a copy of earlier data in memory is never read again
+            cache = self.__caches["latents"]
+            if name in cache:
+                self.__cache_sizes["latents"] -= cache.pop(name)[1]
+            self.__update_high_watermark()
+            return True
 
-    def __set_cache(self, name: str, data: torch.Tensor):
-        if name not in self.__cache:
-            self.__cache[name] = data
-            self.__cache_ids.put(name)
-            if self.__cache_ids.qsize() > self.__max_cache_size:
-                self.__cache.pop(self.__cache_ids.get())
+    def __put_cache(self, name: str, data: Any):
+        """Caches latents or conditioning in memory. Call with the lock."""
+        kind: LatentsKind = "latents" if isinstance(data, torch.Tensor) else "conditioning"
+        size = get_latents_size_in_bytes(data)
+        cache = self.__caches[kind]
+        if name in cache:
+            self.__cache_sizes[kind] -= cache.pop(name)[1]
+        if size > self.__max_cache_sizes[kind] and name not in self.__pins:
+            return
+        cache[name] = (data, size)
+        self.__cache_sizes[kind] += size
+        self.__evict(kind)
+        self.__update_high_watermark()
+
+    def __drop_cache(self, name: str, kind: LatentsKind):
+        with self.__lock:
+            cache = self.__caches[kind]
+            if name in cache:
+                self.__cache_sizes[kind] -= cache.pop(name)[1]
+            if kind == "device":
+                self.__unwritten_names.discard(name)
+
+    def __write_back(self, name: str):
+        """Copies latents that are only in the device tier to memory and the underlying storage. Call with the lock."""
+        if name not in self.__unwritten_names:
+            return
+        self.__unwritten_names.remove(name)
+        data = self.__caches["device"][name][0].to("cpu")
+        self.__underlying_storage.save(name, data)
+        self.__put_cache(name, data)
+
+    def __evict(self, kind: LatentsKind, needed_size: int = 0):
+        """Evicts the least recently used unpinned entries until the cache is within its budget, with `needed_size`
+        bytes to spare. Entries evicted from the device tier are written back first. Call with the lock."""
+        cache = self.__caches[kind]
+        max_size = self.__max_cache_sizes[kind] - needed_size
+        if self.__cache_sizes[kind] <= max_size:
+            return
+        for name in [name for name in cache if name not in self.__pins]:
+            if kind == "device":
+                self.__write_back(name)
+            self.__cache_sizes[kind] -= cache.pop(name)[1]
+            if self.__stats:
+                self.__stats.evictions += 1
+            if self.__cache_sizes[kind] <= max_size:
+                break
+
+    def __update_high_watermark(self):
+        """Call with the lock."""
+        if self.__stats:
+            self.__stats.high_watermark = max(self.__stats.high_watermark, sum(self.__cache_sizes.values()))
 
 
 class DiskLatentsStorage(LatentsStorageBase):
     """Stores latents in a folder on disk without caching"""
 
     __output_folder: Union[str, Path]
+    # Whether some files are still in the flat layout used before latents were sharded
+    __has_unsharded_files: bool
 
     def __init__(self, output_folder: Union[str, Path]):
+        super().__init__()
         self.__output_folder = output_folder if isinstance(output_folder, Path) else Path(output_folder)
         self.__output_folder.mkdir(parents=True, exist_ok=True)
+        self.__has_unsharded_files = has_unsharded_files(self.__output_folder)
 
     def get(self, name: str) -> torch.Tensor:
         latent_path = self.get_path(name)
         return torch.load(latent_path)
 
     def save(self, name: str, data: torch.Tensor) -> None:
-        self.__output_folder.mkdir(parents=True, exist_ok=True)
         latent_path = self.get_path(name)
+        latent_path.parent.mkdir(parents=True, exist_ok=True)
         torch.save(data, latent_path)
+        self._on_saved(name)
 
     def delete(self, name: str) -> None:
         latent_path = self.get_path(name)
         latent_path.unlink()
 
     def get_path(self, name: str) -> Path:
-        return self.__output_folder / name
+        path = get_sharded_path(self.__output_folder, name)
+        # Files that have not been migrated are found where they were saved
+        if self.__has_unsharded_files and not path.exists() and (self.__output_folder / name).exists():
+            return self.__output_folder / name
+        return path
+
+
+class SafetensorsLatentsStorage(DiskLatentsStorage):
+    """Stores latents in a folder on disk as safetensors, loading them through memory maps.
+
+    Conditioning is stored with its structure in the file's metadata, so loading never unpickles. Data that can only
+    be pickled, e.g. ONNX conditioning, is saved with `torch.save`, and files written by `DiskLatentsStorage` are
+    still read.
+    """
+
+    def get(self, name: str) -> torch.Tensor:
+        latent_path = self.get_path(name)
+        if not is_safetensors_file(latent_path):
+            return super().get(name)
+        return load_tensor_file(latent_path)
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        latent_path = self.get_path(name)
+        latent_path.parent.mkdir(parents=True, exist_ok=True)
+        # Latents saved again under the same name replace the file, so tensors mapped from the old file stay valid
+        temp_path = latent_path.with_name(latent_path.name + ".tmp")
+        try:
+            save_tensor_file(temp_path, data)
+        except UnsupportedTensorDataError:
+            torch.save(data, temp_path)
+        os.replace(temp_path, latent_path)
+        self._on_saved(name)
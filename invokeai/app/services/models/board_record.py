@@ -1,6 +1,6 @@
 from typing import Optional, Union
 from datetime import datetime
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 from invokeai.app.util.misc import get_iso_timestamp
 from invokeai.app.util.model_exclude_null import BaseModelExcludeNull
 
@@ -20,6 +20,20 @@ class BoardRecord(BaseModelExcludeNull):
     """The updated timestamp of the image."""
     cover_image_name: Optional[str] = Field(description="The name of the cover image of the board.")
     """The name of the cover image of the board."""
+    # Kept up to date by triggers, and served as the DTO's image count and cover image; not part of the API schema.
+    # `BoardDTO` declares the public `image_count`, which a property of the same name here would shadow.
+    _image_count: int = PrivateAttr(default=0)
+    _most_recent_image_name: Optional[str] = PrivateAttr(default=None)
+
+    @property
+    def board_image_count(self) -> int:
+        """The number of images in the board."""
+        return self._image_count
+
+    @property
+    def most_recent_image_name(self) -> Optional[str]:
+        """The name of the most recently created image in the board."""
+        return self._most_recent_image_name
 
 
 class BoardDTO(BoardRecord):
@@ -42,8 +56,10 @@ def deserialize_board_record(board_dict: dict) -> BoardRecord:
     created_at = board_dict.get("created_at", get_iso_timestamp())
     updated_at = board_dict.get("updated_at", get_iso_timestamp())
     deleted_at = board_dict.get("deleted_at", get_iso_timestamp())
+    image_count = board_dict.get("image_count", 0)
+    most_recent_image_name = board_dict.get("most_recent_image_name", None)
 
-    return BoardRecord(
+    board_record = BoardRecord(
         board_id=board_id,
         board_name=board_name,
         cover_image_name=cover_image_name,
@@ -51,3 +67,6 @@ def deserialize_board_record(board_dict: dict) -> BoardRecord:
         updated_at=updated_at,
         deleted_at=deleted_at,
     )
+    board_record._image_count = image_count
+    board_record._most_recent_image_name = most_recent_image_name
+    return board_record
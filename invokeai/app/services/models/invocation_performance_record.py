@@ -0,0 +1,51 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+InvocationPerformanceGroup = Literal["node_type", "resolution", "model", "model_cache_hit"]
+
+
+class InvocationPerformanceRecord(BaseModel):
+    """The time and memory used by one invocation."""
+
+    node_type: str = Field(description="The type of the invocation.")
+    """The type of the invocation."""
+    width: Optional[int] = Field(default=None, description="The width of the invocation's output, if it has one.")
+    """The width of the invocation's output, if it has one."""
+    height: Optional[int] = Field(default=None, description="The height of the invocation's output, if it has one.")
+    """The height of the invocation's output, if it has one."""
+    model: Optional[str] = Field(default=None, description="The name of the model used by the invocation.")
+    """The name of the model used by the invocation."""
+    model_cache_hit: Optional[bool] = Field(
+        default=None, description="Whether all models were in the cache. Null if no models were loaded."
+    )
+    """Whether all models were in the cache. Null if no models were loaded."""
+    duration: float = Field(description="The time taken by the invocation, in seconds.")
+    """The time taken by the invocation, in seconds."""
+    peak_vram: int = Field(default=0, description="The peak VRAM allocated while the invocation ran, in bytes.")
+    """The peak VRAM allocated while the invocation ran, in bytes."""
+    ram_used: int = Field(default=0, description="The RAM used by the process after the invocation, in bytes.")
+    """The RAM used by the process after the invocation, in bytes."""
+
+
+class InvocationPerformancePercentiles(BaseModel):
+    """Percentiles of the time and memory used by a group of invocations."""
+
+    node_type: Optional[str] = Field(default=None, description="The type of the invocations, if grouped by it.")
+    """The type of the invocations, if grouped by it."""
+    resolution: Optional[str] = Field(
+        default=None, description="The resolution of the invocations' outputs, as WIDTHxHEIGHT, if grouped by it."
+    )
+    """The resolution of the invocations' outputs, as WIDTHxHEIGHT, if grouped by it."""
+    model: Optional[str] = Field(default=None, description="The model used by the invocations, if grouped by it.")
+    """The model used by the invocations, if grouped by it."""
+    model_cache_hit: Optional[bool] = Field(
+        default=None, description="Whether the models were in the cache, if grouped by it."
+    )
+    """Whether the models were in the cache, if grouped by it."""
+    count: int = Field(description="The number of invocations, estimated for downsampled records.")
+    """The number of invocations, estimated for downsampled records."""
+    duration: dict[str, float] = Field(description="Percentiles of the time taken, in seconds, by percentile.")
+    """Percentiles of the time taken, in seconds, by percentile."""
+    peak_vram: dict[str, float] = Field(description="Percentiles of the peak VRAM allocated, in bytes, by percentile.")
+    """Percentiles of the peak VRAM allocated, in bytes, by percentile."""
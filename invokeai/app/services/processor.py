@@ -9,6 +9,7 @@ from ..models.exceptions import CanceledException
 from .invocation_queue import InvocationQueueItem
 from .invocation_stats import InvocationStatsServiceBase
 from .invoker import InvocationProcessorABC, Invoker
+from .latent_storage import get_latents_names
 
 
 class DefaultInvocationProcessor(InvocationProcessorABC):
@@ -88,7 +89,8 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                 try:
                     graph_id = graph_execution_state.id
                     model_manager = self.__invoker.services.model_manager
-                    with statistics.collect_stats(invocation, graph_id, model_manager):
+                    latents = self.__invoker.services.latents
+                    with statistics.collect_stats(invocation, graph_id, model_manager, latents) as stats_context:
                         # use the internal invoke_internal(), which wraps the node's invoke() method in
                         # this accomodates nodes which require a value, but get it only from a
                         # connection
@@ -98,6 +100,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                                 graph_execution_state_id=graph_execution_state.id,
                             )
                         )
+                        stats_context.output = outputs
 
                         # Check queue to see if this is canceled, and skip if so
                         if self.__invoker.services.queue.is_canceled(graph_execution_state.id):
@@ -147,6 +150,11 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                     statistics.reset_stats(graph_execution_state.id)
                     pass
 
+                finally:
+                    # The invocation's input latents were pinned when it was queued
+                    for name in get_latents_names(invocation):
+                        self.__invoker.services.latents.unpin(name)
+
                 # Check queue to see if this is canceled, and skip if so
                 if self.__invoker.services.queue.is_canceled(graph_execution_state.id):
                     continue
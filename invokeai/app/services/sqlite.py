@@ -1,15 +1,56 @@
 import sqlite3
+import time
 from threading import Lock
 from typing import Generic, Optional, TypeVar, get_args
 
 from pydantic import BaseModel, parse_raw_as
 
+from invokeai.app.util.metrics import Histogram
+
 from .item_storage import ItemStorageABC, PaginatedResults
 
 T = TypeVar("T", bound=BaseModel)
 
 sqlite_memory = ":memory:"
 
+DB_QUERY_SECONDS = Histogram(
+    "invokeai_db_query_seconds",
+    "Time spent running database statements and fetching their rows",
+    ["operation"],
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor that records how long statements and fetches take"""
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, "execute")
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, "execute")
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, "fetch")
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose cursors record how long statements take. Use with `sqlite3.connect(factory=...)`."""
+
+    def cursor(self, factory=TimedCursor):  # type: ignore
+        return super().cursor(factory)
+
 
 class SqliteItemStorage(ItemStorageABC, Generic[T]):
     _filename: str
@@ -27,7 +68,7 @@ class SqliteItemStorage(ItemStorageABC, Generic[T]):
         self._id_field = id_field  # TODO: validate that T has this field
         self._lock = Lock()
         self._conn = sqlite3.connect(
-            self._filename, check_same_thread=False
+            self._filename, check_same_thread=False, factory=TimedConnection
         )  # TODO: figure out a better threading solution
         self._cursor = self._conn.cursor()
 
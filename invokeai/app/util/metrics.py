@@ -0,0 +1,195 @@
+"""Counters, gauges and histograms, exposed in the Prometheus text format at `/metrics`.
+
+Metrics are updated as things happen, from any thread. Each update takes a lock and does a few additions, so they can
+be used in hot paths such as database queries.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Iterable, Optional, Sequence
+
+# Seconds; from a fast database query to a slow model load
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """A metric with values for each combination of its labels"""
+
+    metric_type: str = "untyped"
+    name: str
+    description: str
+    label_names: tuple[str, ...]
+    _lock: Lock
+
+    def __init__(
+        self, name: str, description: str, label_names: Sequence[str] = (), registry: Optional["Registry"] = None
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = Lock()
+        (registry or REGISTRY).register(self)
+
+    def _format_labels(self, label_values: tuple[str, ...], extra: str = "") -> str:
+        labels = [f'{name}="{escape_label_value(value)}"' for name, value in zip(self.label_names, label_values)]
+        if extra:
+            labels.append(extra)
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def _check_labels(self, label_values: tuple[str, ...]) -> None:
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {label_values}")
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Gets the lines of the metric's values, in the Prometheus text format"""
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. a number of cache hits"""
+
+    metric_type = "counter"
+    _values: dict[tuple[str, ...], float]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Metrics without labels start at zero rather than being missing
+        self._values = dict() if self.label_names else {(): 0}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._check_labels(label_values)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{self._format_labels(label_values)} {format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. a queue depth.
+
+    A gauge with a `callback` is read when the metrics are collected, e.g. for memory use; the callback returns the
+    values by label values.
+    """
+
+    metric_type = "gauge"
+    _values: dict[tuple[str, ...], float]
+    _callback: Optional[Callable[[], dict[tuple[str, ...], float]]]
+
+    def __init__(self, *args, callback: Optional[Callable[[], dict[tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = dict() if self.label_names else {(): 0}
+        self._callback = callback
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._check_labels(label_values)
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._check_labels(label_values)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterable[str]:
+        if self._callback is not None:
+            for label_values, value in self._callback().items():
+                self.set(value, *label_values)
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{self._format_labels(label_values)} {format_value(value)}"
+
+
+class Histogram(Metric):
+    """Counts observations, e.g. durations, in buckets"""
+
+    metric_type = "histogram"
+    buckets: tuple[float, ...]
+    # {label values => (count per bucket, sum)}; the last bucket is +Inf
+    _values: dict[tuple[str, ...], tuple[list[int], list[float]]]
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values = dict()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        self._check_labels(label_values)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def get_count(self, *label_values: str) -> int:
+        counts, _ = self._values.get(label_values, ([], [0.0]))
+        return sum(counts)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(label_values, list(counts), total[0]) for label_values, (counts, total) in self._values.items()]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket{self._format_labels(label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{self._format_labels(label_values)} {format_value(total)}"
+            yield f"{self.name}_count{self._format_labels(label_values)} {cumulative}"
+
+
+class Registry:
+    """The metrics to expose"""
+
+    _metrics: dict[str, Metric]
+    _lock: Lock
+
+    def __init__(self):
+        self._metrics = dict()
+        self._lock = Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
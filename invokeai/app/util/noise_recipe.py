@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import torch
+
+# Latents names starting with this are noise recipes rather than saved latents
+NOISE_RECIPE_PREFIX = "noise:"
+
+
+def make_noise_batch(
+    seeds: list[int],
+    width: int,
+    height: int,
+    dtype: torch.dtype,
+    device_type: str = "cpu",
+    latent_channels: int = 4,
+    downsampling_factor: int = 8,
+) -> torch.Tensor:
+    """Generates noise for many seeds, as a CPU tensor with one batch entry per seed.
+
+    Each entry is identical to `torch.randn` with a generator seeded with its seed, so the seeds are still drawn one
+    at a time in a Python loop. The loop reseeds a single generator and writes into one preallocated tensor, which
+    only saves allocating a generator and a tensor per seed.
+    """
+    # limit noise to only the diffusion image channels, not the mask channels
+    input_channels = min(latent_channels, 4)
+    shape = [len(seeds), input_channels, height // downsampling_factor, width // downsampling_factor]
+    noise = torch.empty(shape, dtype=dtype, device=device_type)
+    generator = torch.Generator(device=device_type)
+    for i, seed in enumerate(seeds):
+        generator.manual_seed(seed)
+        noise[i].normal_(generator=generator)
+    return noise.to("cpu")
+
+
+@dataclass(frozen=True)
+class NoiseRecipe:
+    """Everything that determines a noise tensor.
+
+    Noise is passed between nodes as its recipe, encoded in the latents name, and made when it is read.
+    """
+
+    seed: int
+    width: int
+    height: int
+    dtype: str
+    device_type: str = "cpu"
+    latent_channels: int = 4
+    downsampling_factor: int = 8
+
+    @property
+    def name(self) -> str:
+        values = [
+            self.seed,
+            self.width,
+            self.height,
+            self.dtype,
+            self.device_type,
+            self.latent_channels,
+            self.downsampling_factor,
+        ]
+        return NOISE_RECIPE_PREFIX + ":".join(str(v) for v in values)
+
+    @classmethod
+    def from_name(cls, name: str) -> Optional["NoiseRecipe"]:
+        """Parses a latents name, returning None if it is not a noise recipe"""
+        if not name.startswith(NOISE_RECIPE_PREFIX):
+            return None
+        seed, width, height, dtype, device_type, latent_channels, downsampling_factor = name[
+            len(NOISE_RECIPE_PREFIX) :
+        ].split(":")
+        return cls(
+            seed=int(seed),
+            width=int(width),
+            height=int(height),
+            dtype=dtype,
+            device_type=device_type,
+            latent_channels=int(latent_channels),
+            downsampling_factor=int(downsampling_factor),
+        )
+
+    def make_noise(self) -> torch.Tensor:
+        return make_noise_batch(
+            seeds=[self.seed],
+            width=self.width,
+            height=self.height,
+            dtype=getattr(torch, self.dtype),
+            device_type=self.device_type,
+            latent_channels=self.latent_channels,
+            downsampling_factor=self.downsampling_factor,
+        )
@@ -0,0 +1,58 @@
+import struct
+import zlib
+from typing import Iterator
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Text chunks are written ahead of the image data, as PIL does, so readers find them without decoding the image
+TEXT_CHUNK_TYPES = (b"tEXt", b"iTXt", b"zTXt")
+
+
+def iter_png_chunks(png: bytes) -> Iterator[tuple[int, bytes, bytes]]:
+    """Iterates over the chunks of an encoded PNG, yielding each chunk's offset, type and data."""
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(png):
+        (length,) = struct.unpack(">I", png[offset : offset + 4])
+        chunk_type = png[offset + 4 : offset + 8]
+        yield offset, chunk_type, png[offset + 8 : offset + 8 + length]
+        if chunk_type == b"IEND":
+            return
+        # length, type and CRC are 4 bytes each
+        offset += length + 12
+
+
+def make_png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Builds a PNG chunk of the given type, including its length and CRC."""
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def get_png_text_keys(png: bytes) -> set[str]:
+    """Gets the keywords of the text chunks in an encoded PNG, without decoding the image."""
+    if not png.startswith(PNG_SIGNATURE):
+        return set()
+    return {
+        data.split(b"\0", 1)[0].decode("latin-1")
+        for _, chunk_type, data in iter_png_chunks(png)
+        if chunk_type in TEXT_CHUNK_TYPES
+    }
+
+
+def add_png_text(png: bytes, key: str, value: str) -> bytes:
+    """Adds a text chunk to an encoded PNG without re-encoding the image data.
+
+    Like PIL's `PngInfo.add_text`, uses a tEXt chunk when the value is latin-1 and an iTXt chunk otherwise.
+    Data that is not a PNG is returned unchanged.
+    """
+    if not png.startswith(PNG_SIGNATURE):
+        return png
+
+    insert_at = next((offset for offset, chunk_type, _ in iter_png_chunks(png) if chunk_type == b"IDAT"), None)
+    if insert_at is None:
+        return png
+
+    try:
+        chunk = make_png_chunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1"))
+    except UnicodeEncodeError:
+        # keyword, null, compression flag, compression method, empty language tag, empty translated keyword
+        chunk = make_png_chunk(b"iTXt", key.encode("latin-1") + b"\0\0\0\0\0" + value.encode("utf-8"))
+
+    return png[:insert_at] + chunk + png[insert_at:]
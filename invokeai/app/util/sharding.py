@@ -0,0 +1,57 @@
+import hashlib
+import os
+from pathlib import Path
+
+# Files are spread over 16^SHARD_LENGTH subfolders
+SHARD_LENGTH = 2
+
+
+def get_shard(name: str) -> str:
+    """Gets the name of the subfolder a file is stored in, from a hash of its name"""
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:SHARD_LENGTH]
+
+
+def get_sharded_path(folder: Path, name: str) -> Path:
+    """Gets the path of a file in a sharded folder"""
+    return folder / get_shard(name) / name
+
+
+def has_unsharded_files(folder: Path) -> bool:
+    """Checks whether a folder has files that are not yet in their shards"""
+    if not folder.exists():
+        return False
+    with os.scandir(folder) as entries:
+        return any(entry.is_file() for entry in entries)
+
+
+def migrate_to_sharded_layout(folder: Path) -> int:
+    """Moves the files directly in a folder into their shards, returning the number of files moved.
+
+    Subfolders are left alone, so the migration can be interrupted and run again.
+    """
+    moved = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            sharded_path = get_sharded_path(folder, entry.name)
+            sharded_path.parent.mkdir(exist_ok=True)
+            os.replace(entry.path, sharded_path)
+            moved += 1
+    return moved
+
+
+def migrate_folders_to_sharded_layout(folder: Path) -> int:
+    """Moves the subfolders of a folder that hold files into their shards, returning the number of subfolders moved.
+
+    Shards only hold subfolders, so the migration can be interrupted and run again.
+    """
+    moved = 0
+    with os.scandir(folder) as entries:
+        subfolders = [entry for entry in entries if entry.is_dir() and has_unsharded_files(Path(entry.path))]
+    for entry in subfolders:
+        sharded_path = get_sharded_path(folder, entry.name)
+        sharded_path.parent.mkdir(exist_ok=True)
+        os.replace(entry.path, sharded_path)
+        moved += 1
+    return moved
@@ -1,15 +1,65 @@
+import io
+from functools import lru_cache
+from typing import Optional
+
 import torch
 from PIL import Image
 from invokeai.app.models.exceptions import CanceledException
-from invokeai.app.models.image import ProgressImage
+from invokeai.app.models.image import ProgressImage, ProgressImageSettings
 from ..invocations.baseinvocation import InvocationContext
 from ...backend.util.util import image_to_dataURL
 from ...backend.stable_diffusion import PipelineIntermediateState
 from ...backend.model_management.models import BaseModelType
 
-
-def sample_to_lowres_estimated_image(samples, latent_rgb_factors, smooth_matrix=None):
-    latent_image = samples[0].permute(1, 2, 0) @ latent_rgb_factors
+# fast latents preview matrix for sdxl
+# generated by @StAlKeR7779
+SDXL_LATENT_RGB_FACTORS = [
+    #   R        G        B
+    [0.3816, 0.4930, 0.5320],
+    [-0.3753, 0.1631, 0.1739],
+    [0.1770, 0.3588, -0.2048],
+    [-0.4350, -0.2644, -0.4289],
+]
+
+SDXL_SMOOTH_MATRIX = [
+    [0.0358, 0.0964, 0.0358],
+    [0.0964, 0.4711, 0.0964],
+    [0.0358, 0.0964, 0.0358],
+]
+
+# origingally adapted from code by @erucipe and @keturn here:
+# https://discuss.huggingface.co/t/decoding-latents-to-rgb-without-upscaling/23204/7
+
+# these updated numbers for v1.5 are from @torridgristle
+V1_5_LATENT_RGB_FACTORS = [
+    #    R        G        B
+    [0.3444, 0.1385, 0.0670],  # L1
+    [0.1247, 0.4027, 0.1494],  # L2
+    [-0.3192, 0.2513, 0.2103],  # L3
+    [-0.1307, -0.1874, -0.7445],  # L4
+]
+
+
+@lru_cache(maxsize=16)
+def get_latent_rgb_factors(
+    is_sdxl: bool, dtype: torch.dtype, device: torch.device
+) -> tuple[torch.Tensor, Optional[torch.Tensor]]:
+    """Gets the latent to RGB factors and smoothing matrix of a model type, made once per dtype and device"""
+    if is_sdxl:
+        factors = torch.tensor(SDXL_LATENT_RGB_FACTORS, dtype=dtype, device=device)
+        smooth_matrix = torch.tensor(SDXL_SMOOTH_MATRIX, dtype=dtype, device=device)
+        return factors, smooth_matrix
+    return torch.tensor(V1_5_LATENT_RGB_FACTORS, dtype=dtype, device=device), None
+
+
+def sample_to_lowres_estimated_image(samples, latent_rgb_factors, smooth_matrix=None, max_size=None):
+    sample = samples[0]
+    if max_size is not None and max(sample.shape[1:]) > max_size:
+        # Scaling down the latents is cheaper than scaling down the image
+        scale = max_size / max(sample.shape[1:])
+        sample = torch.nn.functional.interpolate(sample.unsqueeze(0), scale_factor=scale, mode="area").squeeze(0)
+
+    latent_image = sample.permute(1, 2, 0) @ latent_rgb_factors
 
     if smooth_matrix is not None:
         latent_image = latent_image.unsqueeze(0).permute(3, 0, 1, 2)
@@ -23,6 +73,35 @@ def sample_to_lowres_estimated_image(samples, latent_rgb_factors, smooth_matrix=
     return Image.fromarray(latents_ubyte.numpy())
 
 
+def make_progress_image(
+    sample: torch.Tensor, base_model: BaseModelType, settings: list[ProgressImageSettings]
+) -> ProgressImage:
+    """Makes a progress image that satisfies all of the given settings.
+
+    The image is as large as the largest `max_size` asks for, and has the JPEG data if any client wants it binary,
+    and a data URL if any client doesn't.
+    """
+    is_sdxl = base_model in [BaseModelType.StableDiffusionXL, BaseModelType.StableDiffusionXLRefiner]
+    latent_rgb_factors, smooth_matrix = get_latent_rgb_factors(is_sdxl, sample.dtype, sample.device)
+    max_sizes = [s.max_size for s in settings]
+    max_size = None if None in max_sizes else max(max_sizes)
+    image = sample_to_lowres_estimated_image(sample, latent_rgb_factors, smooth_matrix, max_size=max_size)
+
+    # The effective size is that of the image being generated, not of the preview
+    height, width = sample.shape[-2:]
+    width *= 8
+    height *= 8
+
+    progress_image = ProgressImage(width=width, height=height)
+    if any(s.binary for s in settings):
+        buffered = io.BytesIO()
+        image.save(buffered, format="JPEG")
+        progress_image.data = buffered.getvalue()
+    if not all(s.binary for s in settings):
+        progress_image.dataURL = image_to_dataURL(image, image_format="JPEG")
+    return progress_image
+
+
 def stable_diffusion_step_callback(
     context: InvocationContext,
     intermediate_state: PipelineIntermediateState,
@@ -33,6 +112,11 @@ def stable_diffusion_step_callback(
     if context.services.queue.is_canceled(context.graph_execution_state_id):
         raise CanceledException
 
+    events = context.services.events
+    if not events.has_subscribers(context.graph_execution_state_id):
+        # Nobody would see the progress
+        return
+
     # Some schedulers report not only the noisy latents at the current timestep,
     # but also their estimate so far of what the de-noised latents will be. Use
     # that estimate if it is available.
@@ -41,77 +125,14 @@ def stable_diffusion_step_callback(
     else:
         sample = intermediate_state.latents
 
-    # TODO: This does not seem to be needed any more?
-    # # txt2img provides a Tensor in the step_callback
-    # # img2img provides a PipelineIntermediateState
-    # if isinstance(sample, PipelineIntermediateState):
-    #     # this was an img2img
-    #     print('img2img')
-    #     latents = sample.latents
-    #     step = sample.step
-    # else:
-    #     print('txt2img')
-    #     latents = sample
-    #     step = intermediate_state.step
-
-    # TODO: only output a preview image when requested
-
-    if base_model in [BaseModelType.StableDiffusionXL, BaseModelType.StableDiffusionXLRefiner]:
-        # fast latents preview matrix for sdxl
-        # generated by @StAlKeR7779
-        sdxl_latent_rgb_factors = torch.tensor(
-            [
-                #   R        G        B
-                [0.3816, 0.4930, 0.5320],
-                [-0.3753, 0.1631, 0.1739],
-                [0.1770, 0.3588, -0.2048],
-                [-0.4350, -0.2644, -0.4289],
-            ],
-            dtype=sample.dtype,
-            device=sample.device,
-        )
-
-        sdxl_smooth_matrix = torch.tensor(
-            [
-                [0.0358, 0.0964, 0.0358],
-                [0.0964, 0.4711, 0.0964],
-                [0.0358, 0.0964, 0.0358],
-            ],
-            dtype=sample.dtype,
-            device=sample.device,
-        )
-
-        image = sample_to_lowres_estimated_image(sample, sdxl_latent_rgb_factors, sdxl_smooth_matrix)
-    else:
-        # origingally adapted from code by @erucipe and @keturn here:
-        # https://discuss.huggingface.co/t/decoding-latents-to-rgb-without-upscaling/23204/7
-
-        # these updated numbers for v1.5 are from @torridgristle
-        v1_5_latent_rgb_factors = torch.tensor(
-            [
-                #    R        G        B
-                [0.3444, 0.1385, 0.0670],  # L1
-                [0.1247, 0.4027, 0.1494],  # L2
-                [-0.3192, 0.2513, 0.2103],  # L3
-                [-0.1307, -0.1874, -0.7445],  # L4
-            ],
-            dtype=sample.dtype,
-            device=sample.device,
-        )
-
-        image = sample_to_lowres_estimated_image(sample, v1_5_latent_rgb_factors)
-
-    (width, height) = image.size
-    width *= 8
-    height *= 8
-
-    dataURL = image_to_dataURL(image, image_format="JPEG")
+    settings = events.get_progress_image_settings(context.graph_execution_state_id, intermediate_state.step)
+    progress_image = make_progress_image(sample, base_model, settings) if settings else None
 
-    context.services.events.emit_generator_progress(
+    events.emit_generator_progress(
         graph_execution_state_id=context.graph_execution_state_id,
         node=node,
         source_node_id=source_node_id,
-        progress_image=ProgressImage(width=width, height=height, dataURL=dataURL),
+        progress_image=progress_image,
         step=intermediate_state.step,
         order=intermediate_state.order,
         total_steps=intermediate_state.total_steps,
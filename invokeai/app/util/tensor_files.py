@@ -0,0 +1,146 @@
+import dataclasses
+import json
+import mmap
+import os
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Union
+
+import torch
+from safetensors.torch import save_file
+
+# Metadata key of the structure that the tensors in a file are put back into
+STRUCTURE_METADATA_KEY = "invokeai_structure"
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+class UnsupportedTensorDataError(TypeError):
+    """Raised when data holds values that can't be stored without pickling."""
+
+    def __init__(self, message="Data can't be stored as safetensors"):
+        super().__init__(message)
+
+
+@lru_cache(maxsize=1)
+def get_structure_types() -> dict[str, type]:
+    """Gets the dataclasses that may be stored alongside tensors, by name. Only these are created on load."""
+    # Imported here, as the invocations import the services
+    from invokeai.app.invocations.compel import ConditioningFieldData
+    from invokeai.backend.stable_diffusion.diffusion.shared_invokeai_diffusion import (
+        BasicConditioningInfo,
+        InvokeAIDiffuserComponent,
+        SDXLConditioningInfo,
+    )
+
+    types = [
+        ConditioningFieldData,
+        BasicConditioningInfo,
+        SDXLConditioningInfo,
+        InvokeAIDiffuserComponent.ExtraConditioningInfo,
+    ]
+    return {t.__name__: t for t in types}
+
+
+def encode_structure(data: Any, tensors: dict[str, torch.Tensor]) -> Any:
+    """Encodes data as JSON-serializable values, moving its tensors into `tensors`."""
+    if isinstance(data, torch.Tensor):
+        key = f"t{len(tensors)}"
+        tensor = data.detach().cpu().contiguous()
+        # safetensors refuses tensors that share memory, e.g. views of one batch
+        if any(t.untyped_storage().data_ptr() == tensor.untyped_storage().data_ptr() for t in tensors.values()):
+            tensor = tensor.clone()
+        tensors[key] = tensor
+        return {"tensor": key}
+    if data is None or isinstance(data, (bool, int, float, str)):
+        return data
+    if isinstance(data, list):
+        return {"list": [encode_structure(item, tensors) for item in data]}
+    if isinstance(data, tuple):
+        return {"tuple": [encode_structure(item, tensors) for item in data]}
+    if dataclasses.is_dataclass(data) and get_structure_types().get(type(data).__name__) is type(data):
+        fields = {
+            field.name: encode_structure(getattr(data, field.name), tensors) for field in dataclasses.fields(data)
+        }
+        return {"type": type(data).__name__, "fields": fields}
+    raise UnsupportedTensorDataError(f"Can't store {type(data).__name__} as safetensors")
+
+
+def decode_structure(structure: Any, tensors: dict[str, torch.Tensor]) -> Any:
+    """Rebuilds data encoded with `encode_structure`."""
+    if not isinstance(structure, dict):
+        return structure
+    if "tensor" in structure:
+        return tensors[structure["tensor"]]
+    if "list" in structure:
+        return [decode_structure(item, tensors) for item in structure["list"]]
+    if "tuple" in structure:
+        return tuple(decode_structure(item, tensors) for item in structure["tuple"])
+    structure_type = get_structure_types()[structure["type"]]
+    return structure_type(**{name: decode_structure(value, tensors) for name, value in structure["fields"].items()})
+
+
+def is_safetensors_file(path: Union[str, Path]) -> bool:
+    """Checks whether a file is a safetensors file rather than a pickle written by `torch.save`."""
+    with open(path, "rb") as file:
+        header = file.read(9)
+    # An 8-byte header size, then the JSON header
+    return len(header) == 9 and header[8:9] == b"{"
+
+
+def save_tensor_file(path: Union[str, Path], data: Any) -> None:
+    """Saves tensors, or a structure of tensors, to a safetensors file.
+
+    Raises UnsupportedTensorDataError if the data holds values other than tensors, primitives, lists, tuples and
+    the dataclasses from `get_structure_types`.
+    """
+    tensors: dict[str, torch.Tensor] = {}
+    structure = encode_structure(data, tensors)
+    save_file(tensors, str(path), metadata={STRUCTURE_METADATA_KEY: json.dumps(structure)})
+
+
+def load_tensor_file(path: Union[str, Path]) -> Any:
+    """Loads data saved with `save_tensor_file`.
+
+    The tensors share the memory of a copy-on-write mapping of the file, so no data is copied until it is read, and
+    changes to the tensors are never written back. Windows can't delete a file while it is mapped, so the file is
+    read into memory there instead.
+    """
+    with open(path, "rb") as file:
+        if os.name == "nt":
+            buffer: Union[mmap.mmap, bytearray] = bytearray(file.read())
+        else:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    (header_size,) = struct.unpack("<Q", buffer[:8])
+    header = json.loads(buffer[8 : 8 + header_size])
+    metadata = header.pop("__metadata__", None) or {}
+    data_start = 8 + header_size
+
+    tensors = {}
+    for key, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if start == end:
+            tensor = torch.empty(0, dtype=dtype)
+        else:
+            itemsize = torch.empty(0, dtype=dtype).element_size()
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=(end - start) // itemsize, offset=data_start + start)
+        tensors[key] = tensor.reshape(info["shape"])
+
+    if STRUCTURE_METADATA_KEY not in metadata:
+        # A plain safetensors file
+        return tensors
+    return decode_structure(json.loads(metadata[STRUCTURE_METADATA_KEY]), tensors)
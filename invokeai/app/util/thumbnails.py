@@ -10,6 +10,17 @@ def get_thumbnail_name(image_name: str) -> str:
 
 def make_thumbnail(image: Image.Image, size: int = 256) -> Image.Image:
     """Makes a thumbnail from a PIL Image"""
-    thumbnail = image.copy()
-    thumbnail.thumbnail(size=(size, size))
-    return thumbnail
+    return resize_to_fit(image, size)
+
+
+def resize_to_fit(image: Image.Image, size: int) -> Image.Image:
+    """Makes a copy of a PIL Image that fits within a `size`x`size` square, keeping its aspect ratio.
+
+    Images are never enlarged. Large reductions first shrink the image by an integer factor with
+    `Image.reduce`, which is much faster than resampling the full image.
+    """
+    scale = min(size / image.width, size / image.height)
+    if scale >= 1:
+        return image.copy()
+    resized_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(resized_size, Image.Resampling.BICUBIC, reducing_gap=2.0)
@@ -27,6 +27,7 @@ from prompt_toolkit.completion import PathCompleter
 from prompt_toolkit.key_binding import KeyBindings
 
 from invokeai.app.services.config import InvokeAIAppConfig
+from invokeai.app.util.sharding import get_sharded_path
 
 app_config = InvokeAIAppConfig.get_config()
 
@@ -560,7 +561,8 @@ class MediaImportProcessor:
         """Import a single file by its path"""
         parser = InvokeAIMetadataParser()
         file_name = os.path.basename(filepath)
-        file_destination_path = os.path.join(config.outputs_path, file_name)
+        file_destination_path = str(get_sharded_path(Path(config.outputs_path), file_name))
+        Path(file_destination_path).parent.mkdir(parents=True, exist_ok=True)
 
         print("===============================================================================")
         print(f"Importing {filepath}")
@@ -630,7 +632,8 @@ class MediaImportProcessor:
 
         # create thumbnail
         print("Creating thumbnail...", end="")
-        thumbnail_path = os.path.join(config.thumbnail_path, os.path.splitext(file_name)[0]) + ".webp"
+        thumbnail_path = get_sharded_path(Path(config.thumbnail_path), os.path.splitext(file_name)[0] + ".webp")
+        thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
         thumbnail_size = 256, 256
         with PIL.Image.open(filepath) as source_image:
             source_image.thumbnail(thumbnail_size)
@@ -729,7 +732,7 @@ class MediaImportProcessor:
             "- A property 'imported_app_version' will be added to metadata that can be viewed in the UI's metadata viewer."
         )
         print(
-            "- The new 3.x InvokeAI outputs folder structure is flat so recursively found source imges will all be placed into the single outputs/images folder."
+            "- Recursively found source images are all placed in the outputs/images folder, which spreads them over hashed subfolders."
         )
 
         while True:
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+Compare the encode time and file size of the lossless formats InvokeAI can store images in.
+
+Use it to choose `png_compress_level` and `intermediate_png_compress_level` for your hardware.
+"""
+
+import argparse
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+def make_test_image(size: int) -> Image.Image:
+    """Makes an image with smooth gradients and fine noise, which compresses roughly like a generated image."""
+    y, x = np.mgrid[0:size, 0:size] / size
+    gradient = np.stack([x, y, (x + y) / 2], axis=-1) * 255
+    noise = np.random.default_rng(0).normal(0, 4, (size, size, 3))
+    return Image.fromarray(np.clip(gradient + noise, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, repeat: int, **kwargs) -> tuple[float, int]:
+    """Encodes the image `repeat` times, returning the fastest time in seconds and the size in bytes."""
+    best = float("inf")
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        image.save(buffer, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, buffer.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image encoding benchmark")
+    parser.add_argument("images", type=Path, nargs="*", help="Images to encode. Defaults to a synthetic image")
+    parser.add_argument("--size", type=int, default=2048, help="Size of the synthetic image")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to encode each image")
+    parser.add_argument("--webp", default=False, action="store_true", help="Also benchmark lossless WebP")
+    args = parser.parse_args()
+
+    images = [(str(path), Image.open(path)) for path in args.images] or [
+        (f"synthetic {args.size}x{args.size}", make_test_image(args.size))
+    ]
+
+    for name, image in images:
+        image.load()
+        print(f"{name}")
+        print(f"{'format':<20}{'time (ms)':>12}{'size (KiB)':>12}")
+        for level in range(10):
+            seconds, size = encode(image, args.repeat, format="PNG", compress_level=level)
+            print(f"{f'PNG level {level}':<20}{seconds * 1000:>12.1f}{size / 1024:>12.1f}")
+        if args.webp:
+            for method in (0, 4, 6):
+                seconds, size = encode(image, args.repeat, format="WEBP", lossless=True, method=method)
+                print(f"{f'WebP method {method}':<20}{seconds * 1000:>12.1f}{size / 1024:>12.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
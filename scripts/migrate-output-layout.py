@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+"""
+Move images, thumbnails, resized copies of images and latents from the flat outputs layout into hashed subfolders.
+
+InvokeAI finds unmigrated files where they were saved, so this can be run at any time, but
+InvokeAI should not be running while it does.
+"""
+
+import argparse
+from pathlib import Path
+
+from invokeai.app.services.config import InvokeAIAppConfig
+from invokeai.app.util.sharding import migrate_folders_to_sharded_layout, migrate_to_sharded_layout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outputs folder layout migration")
+    parser.add_argument("--root", type=Path, default=None, help="Path to the InvokeAI runtime directory")
+    args = parser.parse_args()
+
+    config = InvokeAIAppConfig.get_config()
+    config.parse_args(["--root", str(args.root)] if args.root else [])
+
+    output_folder = config.output_path
+    folders = [output_folder / "images", output_folder / "images" / "thumbnails", output_folder / "latents"]
+    for folder in folders:
+        if not folder.is_dir():
+            continue
+        print(f"Migrating {folder}...")
+        moved = migrate_to_sharded_layout(folder)
+        print(f"Moved {moved} files")
+
+    # Resized copies of an image share a subfolder, which is moved as a whole
+    resized_folder = output_folder / "images" / "resized"
+    if resized_folder.is_dir():
+        print(f"Migrating {resized_folder}...")
+        moved = migrate_folders_to_sharded_layout(resized_folder)
+        print(f"Moved {moved} folders")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from invokeai.app.services.artifact_reaper import DefaultArtifactReaper
+from invokeai.app.services.latent_storage import DiskLatentsStorage, ForwardCacheLatentsStorage
+
+
+class FakeSession:
+    def __init__(self, id: str, complete: bool):
+        self.id = id
+        self.complete = complete
+
+    def is_complete(self) -> bool:
+        return self.complete
+
+
+class FakeSessionStorage:
+    def __init__(self):
+        self.on_changed_callbacks = []
+        self.on_deleted_callbacks = []
+
+    def on_changed(self, callback):
+        self.on_changed_callbacks.append(callback)
+
+    def on_deleted(self, callback):
+        self.on_deleted_callbacks.append(callback)
+
+    def set(self, session: FakeSession):
+        for callback in self.on_changed_callbacks:
+            callback(session)
+
+
+@pytest.fixture
+def latents(tmp_path) -> ForwardCacheLatentsStorage:
+    return ForwardCacheLatentsStorage(DiskLatentsStorage(tmp_path / "latents"))
+
+
+def start_reaper(latents: ForwardCacheLatentsStorage, sessions: FakeSessionStorage) -> DefaultArtifactReaper:
+    reaper = DefaultArtifactReaper(release_delay=0)
+    invoker = SimpleNamespace(services=SimpleNamespace(latents=latents, graph_execution_manager=sessions, logger=None))
+    reaper.start(invoker)  # type: ignore
+    # Stop the background thread; the test reaps by hand
+    reaper.stop()
+    return reaper
+
+
+def test_latents_are_deleted_when_their_session_completes(latents: ForwardCacheLatentsStorage):
+    sessions = FakeSessionStorage()
+    reaper = start_reaper(latents, sessions)
+    latents.save("session-1__noise", torch.zeros(1))
+    latents.save("session-1_compel_conditioning", torch.zeros(1))
+    latents.save("session-2__noise", torch.zeros(1))
+
+    sessions.set(FakeSession("session-1", complete=False))
+    assert reaper.reap(10) == 0
+
+    sessions.set(FakeSession("session-1", complete=True))
+    assert reaper.reap(1) == 1
+    assert reaper.reap(10) == 1
+    with pytest.raises(FileNotFoundError):
+        latents.get("session-1__noise")
+    with pytest.raises(FileNotFoundError):
+        latents.get("session-1_compel_conditioning")
+    assert latents.get("session-2__noise") is not None
+
+
+def test_extended_session_keeps_released_latents(latents: ForwardCacheLatentsStorage):
+    sessions = FakeSessionStorage()
+    reaper = start_reaper(latents, sessions)
+    latents.save("session-1__noise", torch.zeros(1))
+
+    sessions.set(FakeSession("session-1", complete=True))
+    # Nodes were added to the session before its latents were deleted
+    sessions.set(FakeSession("session-1", complete=False))
+    assert reaper.reap(10) == 0
+    assert latents.get("session-1__noise") is not None
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from invokeai.app.models.image import ImageCategory, ResourceOrigin
+from invokeai.app.services.board_image_record_storage import SqliteBoardImageRecordStorage
+from invokeai.app.services.board_record_storage import SqliteBoardRecordStorage
+from invokeai.app.services.image_record_storage import SqliteImageRecordStorage
+
+
+class Storage:
+    def __init__(self, db_location: str):
+        self.image_records = SqliteImageRecordStorage(db_location)
+        self.board_records = SqliteBoardRecordStorage(db_location)
+        self.board_image_records = SqliteBoardImageRecordStorage(db_location)
+
+    def save_image(self, image_name: str) -> None:
+        self.image_records.save(
+            image_name=image_name,
+            image_origin=ResourceOrigin.INTERNAL,
+            image_category=ImageCategory.GENERAL,
+            session_id=None,
+            width=512,
+            height=512,
+            node_id=None,
+            metadata=None,
+        )
+        # created_at has millisecond resolution
+        time.sleep(0.002)
+
+
+@pytest.fixture
+def storage(tmp_path) -> Storage:
+    return Storage(str(tmp_path / "invokeai.db"))
+
+
+def test_board_tracks_image_count_and_most_recent_image(storage: Storage):
+    board_id = storage.board_records.save("board").board_id
+    for image_name in ["1.png", "2.png", "3.png"]:
+        storage.save_image(image_name)
+    storage.board_image_records.add_image_to_board(board_id, "2.png")
+    storage.board_image_records.add_image_to_board(board_id, "1.png")
+
+    board = storage.board_records.get(board_id)
+    assert board.board_image_count == 2
+    assert board.most_recent_image_name == "2.png"
+
+    storage.board_image_records.add_image_to_board(board_id, "3.png")
+    board = storage.board_records.get(board_id)
+    assert board.board_image_count == 3
+    assert board.most_recent_image_name == "3.png"
+
+    # deleting the image cascades to the board_images record
+    storage.image_records.delete("3.png")
+    board = storage.board_records.get(board_id)
+    assert board.board_image_count == 2
+    assert board.most_recent_image_name == "2.png"
+
+    storage.board_image_records.remove_image_from_board("2.png")
+    storage.board_image_records.remove_image_from_board("1.png")
+    board = storage.board_records.get(board_id)
+    assert board.board_image_count == 0
+    assert board.most_recent_image_name is None
+
+
+def test_moving_image_updates_both_boards(storage: Storage):
+    board_a = storage.board_records.save("a").board_id
+    board_b = storage.board_records.save("b").board_id
+    storage.save_image("1.png")
+    storage.board_image_records.add_image_to_board(board_a, "1.png")
+    storage.board_image_records.add_image_to_board(board_b, "1.png")
+
+    assert storage.board_records.get(board_a).board_image_count == 0
+    assert storage.board_records.get(board_a).most_recent_image_name is None
+    assert storage.board_records.get(board_b).board_image_count == 1
+    assert storage.board_records.get(board_b).most_recent_image_name == "1.png"
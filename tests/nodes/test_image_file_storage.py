@@ -0,0 +1,125 @@
+import pytest
+from PIL import Image
+
+from invokeai.app.services.image_file_storage import GIG, DiskImageFileStorage
+
+# Decoded size of a 64x64 RGB image. Thumbnails of such small images are the same size as the image.
+IMAGE_BYTES = 64 * 64 * 3
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    image_files = DiskImageFileStorage(
+        tmp_path / "images", hard_delete=True, max_cache_size=3 * IMAGE_BYTES / GIG, write_threads=0
+    )
+    yield image_files
+    image_files.stop()
+
+
+def test_cache_evicts_least_recently_used_images(image_files: DiskImageFileStorage):
+    # Each save caches the image and its thumbnail; the budget holds 3 images
+    image_files.save(Image.new("RGB", (64, 64)), "1.png")
+    image_files.save(Image.new("RGB", (64, 64)), "2.png")
+    stats = image_files.get_cache_stats()
+    assert stats.count == 3
+    assert stats.size <= stats.max_size
+
+    # 1.png was evicted and must be decoded again
+    image_files.get("2.png")
+    image_files.get("1.png")
+    stats = image_files.get_cache_stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+    image_files.get("1.png")
+    assert image_files.get_cache_stats().hits == 2
+
+
+def test_cache_skips_images_over_budget(image_files: DiskImageFileStorage):
+    image_files.save(Image.new("RGB", (512, 512)), "big.png")
+    assert image_files.get("big.png").size == (512, 512)
+    assert image_files.get_cache_stats().count == 0
+
+
+def test_delete_evicts_from_cache(image_files: DiskImageFileStorage):
+    image_files.save(Image.new("RGB", (64, 64)), "1.png")
+    image_files.delete("1.png")
+    assert image_files.get_cache_stats().count == 0
+
+
+def test_saved_images_are_available_before_they_are_written(tmp_path):
+    image_files = DiskImageFileStorage(tmp_path / "images", hard_delete=True, write_threads=2)
+    image = Image.new("RGB", (64, 64))
+    for i in range(10):
+        image_files.save(image, f"{i}.png")
+        assert image_files.get(f"{i}.png") is not None
+    # validating a path waits for its file to be written
+    assert image_files.validate_path(image_files.get_path("0.png", thumbnail=True))
+    image_files.delete("1.png")
+    image_files.stop()
+
+    assert not image_files.get_path("1.png").exists()
+    assert all(image_files.get_path(f"{i}.png").exists() for i in range(10) if i != 1)
+    assert not list((tmp_path / "images").glob("*.tmp"))
+
+
+def test_intermediates_use_their_own_compress_level(tmp_path):
+    image_files = DiskImageFileStorage(
+        tmp_path / "images", write_threads=0, compress_level=9, intermediate_compress_level=0
+    )
+    image = Image.linear_gradient("L").resize((512, 512))
+    image_files.save(image, "output.png")
+    image_files.save(image, "intermediate.png", is_intermediate=True)
+    image_files.stop()
+
+    output_path = image_files.get_path("output.png")
+    intermediate_path = image_files.get_path("intermediate.png")
+    assert intermediate_path.stat().st_size > output_path.stat().st_size
+    with Image.open(intermediate_path) as intermediate, Image.open(output_path) as output:
+        assert intermediate.tobytes() == output.tobytes()
+
+
+def test_resized_copies_are_made_once_and_deleted_with_their_image(tmp_path):
+    image_files = DiskImageFileStorage(tmp_path / "images", hard_delete=True, write_threads=0)
+    image_files.save(Image.new("RGB", (1024, 512)), "1.png")
+
+    path = image_files.get_resized_path("1.png", 128, "jpeg")
+    with Image.open(path) as resized:
+        assert resized.size == (128, 64)
+    mtime = path.stat().st_mtime_ns
+    assert image_files.get_resized_path("1.png", 128, "jpeg") == path
+    assert path.stat().st_mtime_ns == mtime
+
+    image_files.delete("1.png")
+    assert not path.parent.exists()
+    image_files.stop()
+
+
+def test_resized_copies_are_evicted_over_budget(tmp_path):
+    image_files = DiskImageFileStorage(tmp_path / "images", write_threads=0, max_resized_size=1 / GIG)
+    image_files.save(Image.new("RGB", (512, 512)), "1.png")
+    first_path = image_files.get_resized_path("1.png", 64)
+    second_path = image_files.get_resized_path("1.png", 128)
+    assert second_path.exists()
+    assert not first_path.exists()
+    image_files.stop()
+
+
+def test_intermediates_are_held_in_memory_until_needed(tmp_path):
+    # room for 2 intermediates
+    image_files = DiskImageFileStorage(
+        tmp_path / "images", hard_delete=True, max_intermediate_cache_size=2 * IMAGE_BYTES / GIG
+    )
+    for i in range(4):
+        image_files.save(Image.new("RGB", (64, 64)), f"{i}.png", is_intermediate=True)
+        assert image_files.get(f"{i}.png") is not None
+
+    # validating a path writes the image
+    assert image_files.validate_path(image_files.get_path("3.png"))
+    # deleted before it was written
+    image_files.delete("2.png")
+    image_files.persist("1.png")
+    # the oldest were written to stay within budget
+    assert image_files.validate_path(image_files.get_path("0.png"))
+
+    image_files.stop()
+    assert [image_files.get_path(f"{i}.png").exists() for i in range(4)] == [True, True, False, True]
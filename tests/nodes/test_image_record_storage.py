@@ -0,0 +1,166 @@
+import pytest
+
+from invokeai.app.models.image import ImageCategory, ResourceOrigin
+from invokeai.app.services.board_image_record_storage import SqliteBoardImageRecordStorage
+from invokeai.app.services.board_record_storage import SqliteBoardRecordStorage
+from invokeai.app.services.image_record_storage import SqliteImageRecordStorage
+from invokeai.app.services.models.image_record import ImageRecordChanges
+
+
+@pytest.fixture
+def image_records(tmp_path) -> SqliteImageRecordStorage:
+    db_location = str(tmp_path / "invokeai.db")
+    image_records = SqliteImageRecordStorage(db_location)
+    # the images table is referenced by the board tables' foreign keys
+    SqliteBoardRecordStorage(db_location)
+    SqliteBoardImageRecordStorage(db_location)
+    return image_records
+
+
+def save_image(image_records: SqliteImageRecordStorage, image_name: str, metadata=None, is_intermediate=False):
+    image_records.save(
+        image_name=image_name,
+        image_origin=ResourceOrigin.INTERNAL,
+        image_category=ImageCategory.GENERAL,
+        session_id=None,
+        width=512,
+        height=512,
+        node_id=None,
+        metadata=metadata,
+        is_intermediate=is_intermediate,
+    )
+
+
+def make_metadata(seed: int, scheduler: str, positive_prompt: str) -> dict:
+    return dict(
+        seed=seed,
+        scheduler=scheduler,
+        positive_prompt=positive_prompt,
+        negative_prompt="blurry",
+        model=dict(model_name="stable-diffusion-v1-5", base_model="sd-1", model_type="main"),
+    )
+
+
+def test_update_many_updates_existing_images(image_records: SqliteImageRecordStorage):
+    save_image(image_records, "1.png")
+    save_image(image_records, "2.png")
+    updated = image_records.update_many(["1.png", "2.png", "missing.png"], ImageRecordChanges(starred=True))
+    assert sorted(updated) == ["1.png", "2.png"]
+    assert image_records.get("1.png").starred
+    assert image_records.get("2.png").starred
+
+
+def test_delete_many_deletes_in_batches(image_records: SqliteImageRecordStorage):
+    image_names = [f"{i}.png" for i in range(1200)]
+    for image_name in image_names:
+        save_image(image_records, image_name)
+    deleted = image_records.delete_many(image_names[:1100] + ["missing.png"])
+    assert len(deleted) == 1100
+    assert image_records.get_many(0, 10).total == 100
+
+
+def test_get_many_filters_by_metadata(image_records: SqliteImageRecordStorage):
+    save_image(image_records, "1.png", make_metadata(1, "euler", "a photo of a cat"))
+    save_image(image_records, "2.png", make_metadata(2, "ddim", "a painting of a dog"))
+    save_image(image_records, "3.png")
+
+    assert [r.image_name for r in image_records.get_many(0, 10, seed=2).items] == ["2.png"]
+    assert [r.image_name for r in image_records.get_many(0, 10, scheduler="euler").items] == ["1.png"]
+    assert image_records.get_many(0, 10, model_name="stable-diffusion-v1-5").total == 2
+    assert [r.image_name for r in image_records.get_many(0, 10, prompt="painting dog").items] == ["2.png"]
+    assert image_records.get_many(0, 10, prompt='cat "dog').total == 0
+
+
+def test_prompt_index_follows_deletes(image_records: SqliteImageRecordStorage):
+    save_image(image_records, "1.png", make_metadata(1, "euler", "a photo of a cat"))
+    image_records.delete("1.png")
+    save_image(image_records, "2.png", make_metadata(2, "euler", "a photo of a bird"))
+    assert image_records.get_many(0, 10, prompt="cat").total == 0
+    assert image_records.get_many(0, 10, prompt="photo").total == 1
+
+
+def test_workflows_are_stored_once_and_deleted_with_their_last_image(image_records: SqliteImageRecordStorage):
+    workflow = '{"name": "My Workflow", "nodes": []}'
+    for image_name in ["1.png", "2.png"]:
+        image_records.save(
+            image_name=image_name,
+            image_origin=ResourceOrigin.INTERNAL,
+            image_category=ImageCategory.GENERAL,
+            session_id=None,
+            width=512,
+            height=512,
+            node_id=None,
+            metadata=None,
+            workflow=workflow,
+        )
+    save_image(image_records, "3.png")
+
+    assert image_records.get_workflow("2.png") == workflow
+    assert image_records.get_workflow("3.png") is None
+
+    def count_workflows() -> int:
+        image_records._cursor.execute("SELECT COUNT(*) FROM workflows;")
+        return image_records._cursor.fetchone()[0]
+
+    assert count_workflows() == 1
+    image_records.delete("1.png")
+    assert count_workflows() == 1
+    image_records.delete("2.png")
+    assert count_workflows() == 0
+
+
+def test_get_by_content_hash_matches_category_intermediate_and_board(image_records: SqliteImageRecordStorage):
+    def save_upload(image_name: str, image_category: ImageCategory, is_intermediate: bool):
+        image_records.save(
+            image_name=image_name,
+            image_origin=ResourceOrigin.EXTERNAL,
+            image_category=image_category,
+            session_id=None,
+            width=512,
+            height=512,
+            node_id=None,
+            metadata=None,
+            is_intermediate=is_intermediate,
+            content_hash="abc",
+        )
+
+    save_upload("1.png", ImageCategory.USER, False)
+    save_upload("2.png", ImageCategory.CONTROL, True)
+
+    assert image_records.get_by_content_hash("abc", ImageCategory.USER, False, None).image_name == "1.png"
+    assert image_records.get_by_content_hash("abc", ImageCategory.CONTROL, True, None).image_name == "2.png"
+    assert image_records.get_by_content_hash("abc", ImageCategory.USER, True, None) is None
+    assert image_records.get_by_content_hash("abc", ImageCategory.USER, False, "some_board") is None
+    assert image_records.get_by_content_hash("def", ImageCategory.USER, False, None) is None
+
+
+def test_reused_intermediate_is_not_expired(image_records: SqliteImageRecordStorage):
+    image_records.save(
+        image_name="1.png",
+        image_origin=ResourceOrigin.EXTERNAL,
+        image_category=ImageCategory.CONTROL,
+        session_id=None,
+        width=512,
+        height=512,
+        node_id=None,
+        metadata=None,
+        is_intermediate=True,
+        content_hash="abc",
+    )
+    image_records._cursor.execute(
+        "UPDATE images SET created_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', '-1 hour') WHERE image_name = '1.png';"
+    )
+    reused = image_records.get_by_content_hash("abc", ImageCategory.CONTROL, True, None)
+    assert reused.image_name == "1.png"
+    assert image_records.delete_intermediates(older_than=60) == []
+    assert image_records.get("1.png").created_at == reused.created_at
+
+
+def test_delete_intermediates_by_age_and_limit(image_records: SqliteImageRecordStorage):
+    for i in range(3):
+        save_image(image_records, f"{i}.png", is_intermediate=True)
+    save_image(image_records, "kept.png")
+    assert image_records.delete_intermediates(older_than=3600) == []
+    assert image_records.delete_intermediates(limit=2) == ["0.png", "1.png"]
+    assert image_records.delete_intermediates() == ["2.png"]
+    assert image_records.get_many(0, 10).total == 1
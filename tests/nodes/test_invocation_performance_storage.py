@@ -0,0 +1,95 @@
+import pytest
+
+from invokeai.app.services.invocation_performance_storage import (
+    SqliteInvocationPerformanceStorage,
+    get_weighted_percentile,
+)
+from invokeai.app.services.models.invocation_performance_record import InvocationPerformanceRecord
+
+
+@pytest.fixture
+def storage() -> SqliteInvocationPerformanceStorage:
+    return SqliteInvocationPerformanceStorage(":memory:", full_resolution_days=7, max_days=30)
+
+
+def save(storage: SqliteInvocationPerformanceStorage, node_type: str, duration: float, width: int = 512, **kwargs):
+    storage.save(InvocationPerformanceRecord(node_type=node_type, width=width, height=512, duration=duration, **kwargs))
+
+
+def test_weighted_percentile():
+    assert get_weighted_percentile([(1.0, 1), (2.0, 1), (3.0, 1), (4.0, 1)], 50) == 2.0
+    assert get_weighted_percentile([(1.0, 1), (2.0, 9)], 50) == 2.0
+    assert get_weighted_percentile([(1.0, 1), (2.0, 9)], 10) == 1.0
+
+
+def test_percentiles_by_node_type(storage: SqliteInvocationPerformanceStorage):
+    for i in range(1, 101):
+        save(storage, "t2l", duration=i, peak_vram=i * 1000)
+    save(storage, "l2i", duration=0.5)
+
+    results = {r.node_type: r for r in storage.get_percentiles(group_by=["node_type"], percentiles=[50, 95])}
+    assert results["t2l"].count == 100
+    assert results["t2l"].duration == {"p50": 50, "p95": 95}
+    assert results["t2l"].peak_vram == {"p50": 50000, "p95": 95000}
+    assert results["t2l"].resolution is None
+    assert results["l2i"].duration == {"p50": 0.5, "p95": 0.5}
+
+
+def test_percentiles_by_resolution_and_cache_hit(storage: SqliteInvocationPerformanceStorage):
+    save(storage, "t2l", duration=1, model_cache_hit=True)
+    save(storage, "t2l", duration=10, model_cache_hit=False)
+    save(storage, "t2l", duration=4, width=1024)
+
+    results = storage.get_percentiles(group_by=["resolution", "model_cache_hit"], percentiles=[50])
+    assert {(r.resolution, r.model_cache_hit, r.duration["p50"]) for r in results} == {
+        ("512x512", True, 1),
+        ("512x512", False, 10),
+        ("1024x512", None, 4),
+    }
+
+    results = storage.get_percentiles(group_by=["node_type"], percentiles=[50], width=1024)
+    assert [r.count for r in results] == [1]
+
+
+def test_downsample_keeps_weighted_records(storage: SqliteInvocationPerformanceStorage):
+    for i in range(25):
+        save(storage, "t2l", duration=1)
+    save(storage, "l2i", duration=1)
+    storage._cursor.execute(
+        "UPDATE invocation_performance SET created_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', '-10 days');"
+    )
+    save(storage, "t2l", duration=1)
+    storage.downsample()
+
+    storage._cursor.execute("SELECT node_type, weight FROM invocation_performance ORDER BY id;")
+    assert [tuple(row) for row in storage._cursor.fetchall()] == [
+        ("t2l", 10),
+        ("t2l", 10),
+        ("t2l", 5),
+        ("l2i", 1),
+        ("t2l", 1),
+    ]
+    results = {r.node_type: r.count for r in storage.get_percentiles(group_by=["node_type"])}
+    assert results == {"t2l": 26, "l2i": 1}
+
+    # Downsampled records are not thinned again, and expire after `max_days`
+    storage.downsample()
+    storage._cursor.execute("SELECT COUNT(*) FROM invocation_performance;")
+    assert storage._cursor.fetchone()[0] == 5
+    storage._cursor.execute(
+        "UPDATE invocation_performance SET created_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', '-31 days');"
+    )
+    storage.downsample()
+    assert storage.get_percentiles(group_by=["node_type"]) == []
+
+
+def test_downsample_keeps_cache_hits_and_misses_apart(storage: SqliteInvocationPerformanceStorage):
+    for i in range(10):
+        save(storage, "t2l", duration=1, model="sd-1.5", model_cache_hit=i != 0)
+    storage._cursor.execute(
+        "UPDATE invocation_performance SET created_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW', '-10 days');"
+    )
+    storage.downsample()
+
+    results = {r.model_cache_hit: r.count for r in storage.get_percentiles(group_by=["model_cache_hit"])}
+    assert results == {True: 9, False: 1}
@@ -0,0 +1,267 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+import torch
+
+from invokeai.app.invocations.compel import ConditioningFieldData
+from invokeai.app.services.latent_storage import (
+    GIG,
+    DiskLatentsStorage,
+    ForwardCacheLatentsStorage,
+    LatentsCacheStats,
+    SafetensorsLatentsStorage,
+    get_latents_size_in_bytes,
+)
+from invokeai.app.util.noise_recipe import NoiseRecipe, make_noise_batch
+from invokeai.app.util.tensor_files import is_safetensors_file
+from invokeai.backend.stable_diffusion.diffusion.shared_invokeai_diffusion import (
+    InvokeAIDiffuserComponent,
+    SDXLConditioningInfo,
+)
+
+# float32 tensors of this shape take 4KB
+SHAPE = (1, 4, 16, 16)
+
+
+@dataclass
+class Conditioning:
+    embeds: torch.Tensor
+
+
+class CountingLatentsStorage(DiskLatentsStorage):
+    def __init__(self, output_folder):
+        super().__init__(output_folder)
+        self.reads = 0
+
+    def get(self, name: str) -> torch.Tensor:
+        self.reads += 1
+        return super().get(name)
+
+
+@pytest.fixture
+def underlying(tmp_path) -> CountingLatentsStorage:
+    return CountingLatentsStorage(tmp_path / "latents")
+
+
+def make_cache(
+    underlying: CountingLatentsStorage, latents_kb: int, conditioning_kb: int, device_kb: int = 0
+) -> ForwardCacheLatentsStorage:
+    return ForwardCacheLatentsStorage(
+        underlying,
+        max_latents_cache_size=latents_kb * 1024 / GIG,
+        max_conditioning_cache_size=conditioning_kb * 1024 / GIG,
+        max_device_cache_size=device_kb * 1024 / GIG,
+    )
+
+
+def test_get_latents_size_in_bytes():
+    assert get_latents_size_in_bytes(torch.zeros(SHAPE)) == 4096
+    assert get_latents_size_in_bytes((torch.zeros(SHAPE, dtype=torch.float16), None)) == 2048
+    assert get_latents_size_in_bytes(Conditioning(embeds=torch.zeros(SHAPE))) == 4096
+
+
+def test_cache_evicts_least_recently_used(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=8, conditioning_kb=8)
+    stats = LatentsCacheStats()
+    cache.collect_cache_stats(stats)
+    cache.save("a", torch.zeros(SHAPE))
+    cache.save("b", torch.zeros(SHAPE))
+    # Reading "a" makes "b" the least recently used
+    cache.get("a")
+    cache.save("c", torch.zeros(SHAPE))
+
+    cache.get("a")
+    cache.get("c")
+    assert underlying.reads == 0
+    cache.get("b")
+    assert underlying.reads == 1
+    assert stats.hits == 3
+    assert stats.misses == 1
+    assert stats.high_watermark == 8192
+    assert stats.cache_size == 16384
+
+
+def test_conditioning_has_its_own_budget(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=4, conditioning_kb=4)
+    cache.save("conditioning", Conditioning(embeds=torch.zeros(SHAPE)))
+    cache.save("a", torch.zeros(SHAPE))
+    cache.save("b", torch.zeros(SHAPE))
+    cache.get("conditioning")
+    assert underlying.reads == 0
+
+
+def test_pinned_latents_are_not_evicted(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=4, conditioning_kb=4)
+    cache.save("a", torch.zeros(SHAPE))
+    cache.pin("a")
+    cache.save("b", torch.zeros(SHAPE))
+    cache.get("a")
+    assert underlying.reads == 0
+
+    # Unpinning evicts the entries that are over budget
+    cache.unpin("a")
+    cache.get("a")
+    cache.get("b")
+    assert underlying.reads == 1
+
+
+def test_cpu_latents_skip_the_device_tier(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=0, conditioning_kb=0, device_kb=64)
+    latents = torch.zeros(SHAPE)
+    cache.save("a", latents)
+    assert torch.equal(cache.get("a"), latents)
+    assert underlying.reads == 1
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_device_latents_stay_on_the_device(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=0, conditioning_kb=0, device_kb=4)
+    cache.save("a", torch.zeros(SHAPE, device="cuda"))
+    assert cache.get("a").device.type == "cuda"
+    # Evicting "a" from the device tier leaves the copy on disk
+    cache.save("b", torch.zeros(SHAPE, device="cuda"))
+    assert cache.get("a").device.type == "cpu"
+    assert underlying.reads == 1
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_device_latents_are_written_when_they_leave_the_device(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=0, conditioning_kb=0, device_kb=8)
+    cache.save("a", torch.zeros(SHAPE, device="cuda"))
+    cache.save("b", torch.zeros(SHAPE, device="cuda"))
+    assert not underlying.get_path("a").exists()
+
+    # Evicting "a" writes it
+    cache.save("c", torch.zeros(SHAPE, device="cuda"))
+    assert underlying.get_path("a").exists()
+    assert not underlying.get_path("b").exists()
+
+    cache.flush()
+    assert underlying.get_path("b").exists()
+    assert cache.get("b").device.type == "cuda"
+
+    # Latents that were never written are deleted from the cache only
+    cache.save("d", torch.zeros(SHAPE, device="cuda"))
+    cache.delete("d")
+    with pytest.raises(FileNotFoundError):
+        cache.get("d")
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_device_latents_that_do_not_fit_next_to_pinned_latents_fall_back_to_memory(
+    underlying: CountingLatentsStorage,
+):
+    cache = make_cache(underlying, latents_kb=8, conditioning_kb=0, device_kb=4)
+    cache.save("a", torch.zeros(SHAPE, device="cuda"))
+    cache.pin("a")
+    cache.save("b", torch.zeros(SHAPE, device="cuda"))
+    cache.pin("b")
+    assert cache.get("a").device.type == "cuda"
+    assert cache.get("b").device.type == "cpu"
+    assert underlying.get_path("b").exists()
+    assert underlying.reads == 0
+
+    # Unpinning writes the latents, which stay on the device
+    cache.unpin("a")
+    assert underlying.get_path("a").exists()
+    assert cache.get("a").device.type == "cuda"
+
+
+def test_saving_again_replaces_cached_latents(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=8, conditioning_kb=8, device_kb=8)
+    cache.save("a", torch.zeros(SHAPE))
+    cache.save("a", torch.ones(SHAPE))
+    assert torch.equal(cache.get("a"), torch.ones(SHAPE))
+    assert underlying.reads == 0
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires CUDA")
+def test_saving_cpu_latents_replaces_device_latents(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=8, conditioning_kb=8, device_kb=8)
+    cache.save("a", torch.zeros(SHAPE, device="cuda"))
+    cache.save("a", torch.ones(SHAPE))
+    latents = cache.get("a")
+    assert latents.device.type == "cpu"
+    assert torch.equal(latents, torch.ones(SHAPE))
+
+
+def test_delete_removes_cached_latents(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=8, conditioning_kb=8)
+    cache.save("a", torch.zeros(SHAPE))
+    cache.delete("a")
+    with pytest.raises(FileNotFoundError):
+        cache.get("a")
+
+
+def test_safetensors_storage_round_trips_latents(tmp_path):
+    storage = SafetensorsLatentsStorage(tmp_path / "latents")
+    latents = torch.randn(SHAPE, dtype=torch.float16)
+    storage.save("latents", latents)
+    assert is_safetensors_file(storage.get_path("latents"))
+    loaded = storage.get("latents")
+    assert loaded.dtype == torch.float16
+    assert torch.equal(loaded, latents)
+
+
+def test_safetensors_storage_round_trips_conditioning(tmp_path):
+    storage = SafetensorsLatentsStorage(tmp_path / "latents")
+    embeds = torch.randn(2, 77, 16)
+    conditioning = ConditioningFieldData(
+        conditionings=[
+            SDXLConditioningInfo(
+                # views of one tensor share memory
+                embeds=embeds[0:1],
+                extra_conditioning=InvokeAIDiffuserComponent.ExtraConditioningInfo(tokens_count_including_eos_bos=5),
+                pooled_embeds=embeds[1:2, 0],
+                add_time_ids=torch.tensor([[1024, 1024, 0, 0, 1024, 1024]]),
+            )
+        ]
+    )
+    storage.save("conditioning", conditioning)
+    assert is_safetensors_file(storage.get_path("conditioning"))
+
+    loaded = storage.get("conditioning")
+    assert isinstance(loaded, ConditioningFieldData)
+    info = loaded.conditionings[0]
+    assert isinstance(info, SDXLConditioningInfo)
+    assert info.extra_conditioning.tokens_count_including_eos_bos == 5
+    assert info.extra_conditioning.cross_attention_control_args is None
+    assert torch.equal(info.embeds, embeds[0:1])
+    assert torch.equal(info.pooled_embeds, embeds[1:2, 0])
+    assert torch.equal(info.add_time_ids, conditioning.conditionings[0].add_time_ids)
+
+
+def test_safetensors_storage_falls_back_to_pickle(tmp_path):
+    storage = SafetensorsLatentsStorage(tmp_path / "latents")
+    # ONNX conditioning is a numpy array
+    storage.save("onnx_conditioning", (np.ones((1, 77, 16), dtype=np.float32), None))
+    assert not is_safetensors_file(storage.get_path("onnx_conditioning"))
+    embeds, _ = storage.get("onnx_conditioning")
+    assert embeds.shape == (1, 77, 16)
+
+    # Files written by the previous storage are still read
+    DiskLatentsStorage(tmp_path / "latents").save("legacy", torch.ones(SHAPE))
+    assert torch.equal(storage.get("legacy"), torch.ones(SHAPE))
+
+
+def test_noise_recipes_are_made_when_read(underlying: CountingLatentsStorage):
+    cache = make_cache(underlying, latents_kb=64, conditioning_kb=0)
+    recipe = NoiseRecipe(seed=123, width=64, height=128, dtype="float16")
+    assert NoiseRecipe.from_name(recipe.name) == recipe
+
+    noise = cache.get(recipe.name)
+    generator = torch.Generator(device="cpu").manual_seed(123)
+    assert torch.equal(noise, torch.randn([1, 4, 16, 8], dtype=torch.float16, generator=generator))
+    assert cache.get(recipe.name) is noise
+    assert underlying.reads == 0
+    # Deleting a recipe only drops the cached noise
+    cache.delete(recipe.name)
+
+
+def test_make_noise_batch_matches_per_seed_noise():
+    seeds = [0, 1, 4294967295]
+    batch = make_noise_batch(seeds, width=64, height=64, dtype=torch.float32)
+    for i, seed in enumerate(seeds):
+        generator = torch.Generator(device="cpu").manual_seed(seed)
+        assert torch.equal(batch[i : i + 1], torch.randn([1, 4, 8, 8], generator=generator))
@@ -0,0 +1,66 @@
+from PIL import Image
+
+from invokeai.app.services.image_file_storage import DiskImageFileStorage
+from invokeai.app.util.sharding import get_sharded_path, migrate_folders_to_sharded_layout, migrate_to_sharded_layout
+from invokeai.app.util.thumbnails import get_thumbnail_name
+
+
+def test_migration_moves_files_into_shards(tmp_path):
+    for name in ["1.png", "2.png"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "subfolder").mkdir()
+
+    assert migrate_to_sharded_layout(tmp_path) == 2
+    assert get_sharded_path(tmp_path, "1.png").exists()
+    assert get_sharded_path(tmp_path, "2.png").exists()
+    assert (tmp_path / "subfolder").is_dir()
+    assert migrate_to_sharded_layout(tmp_path) == 0
+
+
+def test_image_paths_resolve_before_and_after_migration(tmp_path):
+    images_folder = tmp_path / "images"
+    image_files = DiskImageFileStorage(images_folder, write_threads=0)
+    image_files.save(Image.new("RGB", (64, 64)), "new.png")
+    assert image_files.get_path("new.png") == get_sharded_path(images_folder, "new.png")
+    image_files.stop()
+
+    # an image saved in the flat layout
+    Image.new("RGB", (64, 64)).save(images_folder / "old.png")
+    Image.new("RGB", (64, 64)).save(images_folder / "thumbnails" / get_thumbnail_name("old.png"))
+
+    image_files = DiskImageFileStorage(images_folder, write_threads=0)
+    assert image_files.get_path("old.png") == images_folder / "old.png"
+    assert image_files.validate_path(image_files.get_path("old.png", thumbnail=True))
+    assert image_files.get_path("new.png") == get_sharded_path(images_folder, "new.png")
+    image_files.stop()
+
+    migrate_to_sharded_layout(images_folder)
+    migrate_to_sharded_layout(images_folder / "thumbnails")
+    image_files = DiskImageFileStorage(images_folder, write_threads=0)
+    assert image_files.get("old.png").size == (64, 64)
+    assert image_files.validate_path(image_files.get_path("old.png", thumbnail=True))
+    image_files.stop()
+
+
+def test_resized_copies_are_found_after_migration(tmp_path):
+    images_folder = tmp_path / "images"
+    image_files = DiskImageFileStorage(images_folder, hard_delete=True, write_threads=0)
+    image_files.save(Image.new("RGB", (256, 256)), "1.png")
+    path = image_files.get_resized_path("1.png", 64)
+    assert path.parent == get_sharded_path(images_folder / "resized", "1")
+    image_files.stop()
+
+    # resized copies saved in the flat layout
+    flat_folder = images_folder / "resized" / "1"
+    path.parent.rename(flat_folder)
+    assert migrate_folders_to_sharded_layout(images_folder / "resized") == 1
+    assert path.exists()
+    assert migrate_folders_to_sharded_layout(images_folder / "resized") == 0
+
+    image_files = DiskImageFileStorage(images_folder, hard_delete=True, write_threads=0)
+    mtime = path.stat().st_mtime_ns
+    assert image_files.get_resized_path("1.png", 64) == path
+    assert path.stat().st_mtime_ns == mtime
+    image_files.delete("1.png")
+    assert not path.parent.exists()
+    image_files.stop()
@@ -0,0 +1,179 @@
+import asyncio
+import io
+import threading
+
+import torch
+from fastapi_events import handler_store
+from PIL import Image
+
+from invokeai.app.api.events import FastAPIEventService
+from invokeai.app.models.image import ProgressImageSettings
+from invokeai.app.services.events import EventServiceBase
+from invokeai.app.util.step_callback import make_progress_image
+from invokeai.backend.model_management.models import BaseModelType
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.events = []
+
+    async def handle(self, event):
+        self.events.append(event)
+
+
+def progress(session_id: str, step: int) -> dict:
+    return dict(event="generator_progress", data=dict(graph_execution_state_id=session_id, step=step))
+
+
+def run_service(emit, max_queue_size: int = 1000) -> list:
+    """Emits events from a worker thread while the event loop is blocked, then lets the loop dispatch them"""
+    handler = RecordingHandler()
+    handler_id = id(handler)
+    handler_store[handler_id] = [handler]
+
+    async def main():
+        service = FastAPIEventService(handler_id, max_queue_size=max_queue_size)
+        thread = threading.Thread(target=emit, args=(service,))
+        thread.start()
+        thread.join()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        service.stop()
+        await asyncio.sleep(0)
+
+    try:
+        asyncio.run(main())
+    finally:
+        del handler_store[handler_id]
+    return [payload for _, payload in handler.events]
+
+
+def test_dispatches_events_in_order():
+    def emit(service):
+        for i in range(3):
+            service.dispatch("session_event", dict(event="invocation_started", data=dict(step=i)))
+
+    payloads = run_service(emit)
+    assert [p["data"]["step"] for p in payloads] == [0, 1, 2]
+
+
+def test_coalesces_progress_per_session():
+    def emit(service):
+        service.dispatch("session_event", progress("a", 1))
+        service.dispatch("session_event", progress("b", 1))
+        service.dispatch("session_event", progress("a", 2))
+        service.dispatch("session_event", dict(event="invocation_complete", data=dict(graph_execution_state_id="a")))
+        service.dispatch("session_event", progress("a", 3))
+
+    payloads = run_service(emit)
+    assert [(p["event"], p["data"]["graph_execution_state_id"], p["data"].get("step")) for p in payloads] == [
+        ("generator_progress", "a", 2),
+        ("generator_progress", "b", 1),
+        ("invocation_complete", "a", None),
+        ("generator_progress", "a", 3),
+    ]
+
+
+def test_drops_progress_when_full():
+    def emit(service):
+        service.dispatch("session_event", progress("a", 1))
+        service.dispatch("session_event", progress("b", 1))
+
+    payloads = run_service(emit, max_queue_size=1)
+    assert [p["data"]["graph_execution_state_id"] for p in payloads] == ["a"]
+
+
+def test_progress_image_settings():
+    async def main():
+        service = FastAPIEventService(0)
+        assert not service.has_subscribers("a")
+        assert service.get_progress_image_settings("a", 0) == []
+
+        service.subscribe("a", "client1", ProgressImageSettings(every_n_steps=2))
+        service.subscribe("a", "client2", ProgressImageSettings(every_n_steps=3))
+        assert service.has_subscribers("a")
+        assert service.get_progress_image_settings("a", 1) == []
+        assert [s.every_n_steps for s in service.get_progress_image_settings("a", 2)] == [2]
+        assert [s.every_n_steps for s in service.get_progress_image_settings("a", 6)] == [2, 3]
+
+        service.unsubscribe("a", "client1")
+        assert service.has_subscribers("a")
+        service.unsubscribe_all("client2")
+        assert not service.has_subscribers("a")
+        service.stop()
+
+    asyncio.run(main())
+
+
+def test_progress_images_are_limited_per_second():
+    async def main():
+        service = FastAPIEventService(0)
+        service.subscribe("a", "client", ProgressImageSettings(max_fps=0.01))
+        assert len(service.get_progress_image_settings("a", 0)) == 1
+        assert service.get_progress_image_settings("a", 1) == []
+        service.stop()
+
+    asyncio.run(main())
+
+
+def test_binary_progress_image():
+    sample = torch.randn(1, 4, 64, 32)
+    settings = [ProgressImageSettings(binary=True, max_size=16)]
+    image = make_progress_image(sample, BaseModelType.StableDiffusion1, settings)
+    assert (image.width, image.height) == (256, 512)
+    assert image.dataURL is None
+    assert Image.open(io.BytesIO(image.data)).size == (8, 16)
+
+
+def test_progress_image_for_subscribers_with_different_settings():
+    async def main():
+        service = FastAPIEventService(0)
+        # e.g. the web UI, which reads data URLs, and a client asking for small binary images
+        service.subscribe("a", "web", ProgressImageSettings())
+        service.subscribe("a", "client", ProgressImageSettings(binary=True, max_size=16, every_n_steps=2))
+        settings_by_step = [service.get_progress_image_settings("a", step) for step in range(2)]
+        service.stop()
+        return settings_by_step
+
+    settings_by_step = asyncio.run(main())
+    sample = torch.randn(1, 4, 64, 32)
+    both = make_progress_image(sample, BaseModelType.StableDiffusion1, settings_by_step[0])
+    assert both.dataURL is not None
+    # The image is as large as the client without a size limit asked for
+    assert Image.open(io.BytesIO(both.data)).size == (32, 64)
+
+    web_only = make_progress_image(sample, BaseModelType.StableDiffusion1, settings_by_step[1])
+    assert web_only.dataURL is not None
+    assert web_only.data is None
+
+
+class RecordingEventService(EventServiceBase):
+    def __init__(self, compact_payloads: bool):
+        self.compact_payloads = compact_payloads
+        self.payloads = []
+
+    def dispatch(self, event_name, payload):
+        self.payloads.append(payload)
+
+
+def test_compact_payloads():
+    node = dict(id="1", type="image", prompt="a" * 1000, workflow="{}")
+    result = dict(
+        type="image_output",
+        image=dict(image_name="x.png"),
+        width=512,
+        height=512,
+        text="b" * 1000,
+        metadata=dict(positive_prompt="c" * 1000, model=dict(model_name="sd-1.5")),
+    )
+
+    service = RecordingEventService(compact_payloads=True)
+    service.emit_invocation_complete("session", result=result, node=node, source_node_id="source")
+    data = service.payloads[0]["data"]
+    assert data["node"] == dict(id="1", type="image")
+    assert data["result"] == dict(type="image_output", image=dict(image_name="x.png"), width=512, height=512)
+    assert data["source_node_id"] == "source"
+
+    service = RecordingEventService(compact_payloads=False)
+    service.emit_invocation_complete("session", result=result, node=node, source_node_id="source")
+    assert service.payloads[0]["data"]["node"] == node
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import Request
+
+from invokeai.app.api.file_responses import is_not_modified, parse_range
+
+
+def make_request(**headers: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "range_header,expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=900-", (900, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+    ],
+)
+def test_parse_range(range_header, expected):
+    assert parse_range(range_header, 1000) == expected
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1000-", "bytes=5-4", "bytes=-0"])
+def test_parse_range_not_satisfiable(range_header):
+    with pytest.raises(ValueError):
+        parse_range(range_header, 1000)
+
+
+def test_is_not_modified():
+    mtime = 1700000000.5
+    assert is_not_modified(make_request(if_none_match='"a", "b"'), '"b"', mtime)
+    assert not is_not_modified(make_request(if_none_match='"a"'), '"b"', mtime)
+    # If-None-Match takes precedence
+    assert not is_not_modified(
+        make_request(if_none_match='"a"', if_modified_since="Tue, 14 Nov 2023 22:13:20 GMT"), '"b"', mtime
+    )
+    assert is_not_modified(make_request(if_modified_since="Tue, 14 Nov 2023 22:13:20 GMT"), '"b"', mtime)
+    assert not is_not_modified(make_request(if_modified_since="Tue, 14 Nov 2023 22:13:19 GMT"), '"b"', mtime)
+    assert not is_not_modified(make_request(if_modified_since="yesterday"), '"b"', mtime)
+    assert not is_not_modified(make_request(), '"b"', mtime)
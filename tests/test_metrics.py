@@ -0,0 +1,54 @@
+import pytest
+
+from invokeai.app.util.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    counter = Counter("hits_total", "Hits", ["cache"], registry=registry)
+    counter.inc("models")
+    counter.inc("models", amount=2)
+    gauge = Gauge("depth", "Depth", registry=registry)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    memory = Gauge("memory_bytes", "Memory", ["kind"], callback=lambda: {("ram",): 1024.0}, registry=registry)
+
+    assert counter.get("models") == 3
+    assert registry.render() == (
+        "# HELP hits_total Hits\n"
+        "# TYPE hits_total counter\n"
+        'hits_total{cache="models"} 3\n'
+        "# HELP depth Depth\n"
+        "# TYPE depth gauge\n"
+        "depth 1\n"
+        "# HELP memory_bytes Memory\n"
+        "# TYPE memory_bytes gauge\n"
+        'memory_bytes{kind="ram"} 1024\n'
+    )
+    assert memory.get("ram") == 1024
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = Histogram("duration_seconds", "Duration", ["node_type"], buckets=[0.1, 1], registry=registry)
+    for value in [0.05, 0.1, 0.5, 5]:
+        histogram.observe(value, 'l2"i')
+
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'duration_seconds_bucket{node_type="l2\\"i",le="0.1"} 2',
+        'duration_seconds_bucket{node_type="l2\\"i",le="1"} 3',
+        'duration_seconds_bucket{node_type="l2\\"i",le="+Inf"} 4',
+        'duration_seconds_sum{node_type="l2\\"i"} 5.65',
+        'duration_seconds_count{node_type="l2\\"i"} 4',
+    ]
+
+
+def test_labels_are_checked():
+    registry = Registry()
+    counter = Counter("hits_total", "Hits", ["cache"], registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        Counter("hits_total", "Hits again", registry=registry)
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from invokeai.app.api.dependencies import ApiDependencies
+from invokeai.app.api.routers.sessions import session_router
+from invokeai.app.invocations.math import AddInvocation
+from invokeai.app.services.graph import Graph, GraphExecutionState
+from invokeai.app.services.sqlite import SqliteItemStorage, sqlite_memory
+
+
+@pytest.fixture
+def session() -> GraphExecutionState:
+    graph = Graph()
+    graph.add_node(AddInvocation(id="add", a=1, b=2))
+    session = GraphExecutionState(graph=graph)
+    invocation = session.next()
+    session.complete(invocation.id, invocation.invoke(None))
+    return session
+
+
+@pytest.fixture
+def client(session: GraphExecutionState, monkeypatch) -> TestClient:
+    graph_execution_manager = SqliteItemStorage[GraphExecutionState](
+        filename=sqlite_memory, table_name="graph_executions"
+    )
+    graph_execution_manager.set(session)
+    monkeypatch.setattr(
+        ApiDependencies,
+        "invoker",
+        SimpleNamespace(services=SimpleNamespace(graph_execution_manager=graph_execution_manager)),
+        raising=False,
+    )
+    app = FastAPI()
+    app.include_router(session_router, prefix="/api")
+    return TestClient(app)
+
+
+def test_get_session_invocation(session: GraphExecutionState, client: TestClient):
+    invocation_id = next(iter(session.prepared_source_mapping))
+    response = client.get(f"/api/v1/sessions/{session.id}/invocations/{invocation_id}")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["invocation"]["type"] == "add"
+    assert body["invocation"]["id"] == invocation_id
+    assert body["source_node_id"] == "add"
+    assert body["result"]["value"] == 3
+    assert body["error"] is None
+
+
+def test_get_session_invocation_not_found(session: GraphExecutionState, client: TestClient):
+    assert client.get(f"/api/v1/sessions/{session.id}/invocations/missing").status_code == 404
+    assert client.get("/api/v1/sessions/missing/invocations/add").status_code == 404
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+
+from invokeai.app.api.dependencies import ApiDependencies
+from invokeai.app.api.sse import ServerSentEvents
+from invokeai.app.services.events import EventServiceBase
+
+
+@pytest.fixture
+def sse(monkeypatch) -> ServerSentEvents:
+    monkeypatch.setattr(
+        ApiDependencies, "invoker", SimpleNamespace(services=SimpleNamespace(events=EventServiceBase())), raising=False
+    )
+    return ServerSentEvents(FastAPI())
+
+
+def session_event(session_id: str, event_name: str) -> tuple:
+    return ("session_event", dict(event=event_name, data=dict(graph_execution_state_id=session_id)))
+
+
+async def read_events(stream, count: int) -> list[str]:
+    chunks = []
+    while len(chunks) < count:
+        chunk = (await stream.__anext__()).decode("utf-8")
+        if chunk.startswith("id:"):
+            chunks.append(chunk)
+    return chunks
+
+
+def test_streams_events_of_followed_sessions(sse):
+    async def main():
+        stream = sse.stream(["a", "b"])
+        assert (await stream.__anext__()).startswith(b"retry:")
+        await sse._handle_session_event(session_event("a", "invocation_started"))
+        await sse._handle_session_event(session_event("c", "invocation_started"))
+        await sse._handle_session_event(session_event("b", "invocation_complete"))
+        chunks = await read_events(stream, 2)
+        await stream.aclose()
+        return chunks
+
+    chunks = asyncio.run(main())
+    assert "\nevent: invocation_started\ndata: " in chunks[0]
+    assert '"graph_execution_state_id": "a"' in chunks[0]
+    assert "\nevent: invocation_complete\n" in chunks[1]
+
+
+def test_resumes_after_last_event_id(sse):
+    async def main():
+        following_stream = sse.stream(["a"])
+        await following_stream.__anext__()
+        for event_name in ["invocation_started", "generator_progress", "invocation_complete"]:
+            await sse._handle_session_event(session_event("a", event_name))
+        await following_stream.aclose()
+        first_stream = sse.stream(["a"], last_event_id=0)
+        first_id = int((await read_events(first_stream, 1))[0].split("\n")[0][len("id: ") :])
+        await first_stream.aclose()
+
+        stream = sse.stream(["a"], last_event_id=first_id)
+        chunks = await read_events(stream, 2)
+        await stream.aclose()
+        return first_id, chunks
+
+    first_id, chunks = asyncio.run(main())
+    assert [c.split("\n")[0] for c in chunks] == [f"id: {first_id + 1}", f"id: {first_id + 2}"]
+    assert "invocation_complete" in chunks[1]
+
+
+def test_keeps_history_of_followed_sessions_only(sse):
+    async def main():
+        await sse._handle_session_event(session_event("a", "invocation_started"))
+        stream = sse.stream(["b"])
+        await stream.__anext__()
+        for event_name in ["invocation_started", "generator_progress", "generator_progress", "invocation_complete"]:
+            await sse._handle_session_event(session_event("b", event_name))
+        await read_events(stream, 4)
+        await stream.aclose()
+
+        # Session "a" was not followed when its event was dispatched, so only later events are sent
+        resumed_a = sse.stream(["a"], last_event_id=0)
+        await resumed_a.__anext__()
+        await sse._handle_session_event(session_event("a", "invocation_complete"))
+        chunks_a = await read_events(resumed_a, 1)
+        await resumed_a.aclose()
+
+        resumed_b = sse.stream(["b"], last_event_id=0)
+        chunks_b = await read_events(resumed_b, 3)
+        await resumed_b.aclose()
+        return chunks_a, chunks_b
+
+    chunks_a, chunks_b = asyncio.run(main())
+    assert "\nevent: invocation_complete\n" in chunks_a[0]
+    # Only the latest progress event is kept
+    assert [c.split("\n")[1] for c in chunks_b] == [
+        "event: invocation_started",
+        "event: generator_progress",
+        "event: invocation_complete",
+    ]
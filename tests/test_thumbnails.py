@@ -0,0 +1,67 @@
+import json
+import struct
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from invokeai.app.api.dependencies import ApiDependencies
+from invokeai.app.api.routers.images import images_router
+from invokeai.app.util.thumbnails import get_thumbnail_name
+
+
+class ThumbnailFiles:
+    def __init__(self, thumbnails_folder: Path):
+        self.thumbnails_folder = thumbnails_folder
+
+    def get_path(self, image_name: str, thumbnail: bool = False) -> Path:
+        return self.thumbnails_folder / get_thumbnail_name(image_name)
+
+    def validate_path(self, path: Path) -> bool:
+        return path.exists()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch) -> TestClient:
+    thumbnails_folder = tmp_path / "thumbnails"
+    thumbnails_folder.mkdir()
+    (thumbnails_folder / "1.webp").write_bytes(b"first")
+    (thumbnails_folder / "2.webp").write_bytes(b"second thumbnail")
+    (tmp_path / "secret.webp").write_bytes(b"secret")
+
+    images = ThumbnailFiles(thumbnails_folder)
+    monkeypatch.setattr(
+        ApiDependencies, "invoker", SimpleNamespace(services=SimpleNamespace(images=images)), raising=False
+    )
+    app = FastAPI()
+    app.include_router(images_router, prefix="/api")
+    return TestClient(app)
+
+
+def unpack(content: bytes) -> dict[str, bytes]:
+    (index_length,) = struct.unpack(">I", content[:4])
+    index = json.loads(content[4 : 4 + index_length].decode("utf-8"))
+    data = content[4 + index_length :]
+    return {entry["image_name"]: data[entry["offset"] : entry["offset"] + entry["length"]] for entry in index}
+
+
+def test_packs_thumbnails_with_index(client: TestClient):
+    response = client.post("/api/v1/images/thumbnails", json=dict(image_names=["2.png", "missing.png", "1.png"]))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    thumbnails = unpack(response.content)
+    assert list(thumbnails) == ["2.png", "1.png"]
+    assert thumbnails == {"2.png": b"second thumbnail", "1.png": b"first"}
+
+
+def test_leaves_out_names_outside_thumbnails_folder(client: TestClient):
+    image_names = ["../secret.png", "..\\secret.png", "sub/../1.png", "1.png"]
+    response = client.post("/api/v1/images/thumbnails", json=dict(image_names=image_names))
+    assert unpack(response.content) == {"1.png": b"first"}
+
+
+def test_limits_batch_size(client: TestClient):
+    response = client.post("/api/v1/images/thumbnails", json=dict(image_names=["1.png"] * 501))
+    assert response.status_code == 400